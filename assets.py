@@ -0,0 +1,138 @@
+import os
+import hashlib
+import threading
+from typing import NamedTuple
+
+from PIL import Image
+
+from metrics import timed
+
+# -------------------- 정적 자산 (히어로 이미지) --------------------
+# 저장소에 포함된 petfuneral.png(1024x1536, 2.8MB)를 GitHub에서 매번 받지 않고,
+# 표시 크기별 WebP/PNG 변형을 미리 만들어 미디어 서버가 1년 캐시(immutable)로 내려줌.
+# 파일명에 원본 해시를 넣으므로 원본이 바뀌면 URL도 바뀜. 브라우저는 srcset에서 골라 받음.
+# 생성(~0.5초)은 시작 때 백그라운드 스레드에서 하고, 화면은 파일명 계획만으로 그림:
+# data URI용 한 장을 먼저 만들고, 나머지는 미디어 서버가 요청받았을 때 아직 없으면 기다림.
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+ASSET_FOLDER = os.getenv("ASSET_FOLDER", "assets")
+
+HERO_SOURCE = os.path.join(APP_DIR, "petfuneral.png")
+HERO_WIDTHS = (160, 320, 480, 720)
+HERO_INLINE_WIDTH = 320     # 미디어 서버가 없을 때 data URI로 넣는 한 장
+# .hero-visual 열(전체의 약 36%)의 절반 너비로 표시됨 (static/style.css)
+HERO_SIZES = "18vw"
+
+_FORMATS = (("image/webp", ".webp"), ("image/png", ".png"))
+
+
+class Variant(NamedTuple):
+    name: str        # ASSET_FOLDER 안 파일명
+    mime: str
+    width: int
+    height: int
+
+
+def _source_digest(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()[:12]
+
+def _save(im, out_path: str, mime: str):
+    tmp = f"{out_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    if mime == "image/webp":
+        im.save(tmp, "WEBP", quality=82, method=6)
+    else:
+        # 일러스트라 256색으로 충분 (WebP를 못 쓰는 브라우저용)
+        im.quantize(256, method=Image.Quantize.FASTOCTREE).save(tmp, "PNG")
+    os.replace(tmp, out_path)
+
+def _plan(src: str, widths, folder: str, width: int, height: int):
+    """[(Variant, 경로)] 큰 너비부터. WebP는 모든 너비, PNG는 HERO_INLINE_WIDTH 한 장만."""
+    stem = os.path.splitext(os.path.basename(src))[0]
+    digest = _source_digest(src)
+    inline = min(widths, key=lambda x: abs(x - HERO_INLINE_WIDTH))
+    plan = []
+    for w in sorted(set(min(w, width) for w in widths), reverse=True):
+        for mime, ext in (_FORMATS if w == inline else _FORMATS[:1]):
+            plan.append((Variant(f"{stem}.{digest}.{w}w{ext}", mime, w, round(height * w / width)),
+                         os.path.join(folder, f"{stem}.{digest}.{w}w{ext}")))
+    return plan
+
+def plan_variants(src: str = HERO_SOURCE, widths=HERO_WIDTHS, folder: str = ASSET_FOLDER):
+    """생성하지 않고 [Variant]만 (원본 헤더 + 해시, 수 ms). 파일은 아직 없을 수 있음."""
+    with Image.open(src) as im:
+        plan = _plan(src, widths, folder, *im.size)
+    return sorted((v for v, _ in plan), key=lambda v: v.width)
+
+@timed("assets.build")
+def build_variants(src: str = HERO_SOURCE, widths=HERO_WIDTHS, folder: str = ASSET_FOLDER):
+    """
+    없는 변형만 생성(임시 파일 → rename)하고 [Variant] 반환. 원본보다 큰 너비는 건너뜀.
+    WebP는 모든 너비, PNG는 WebP를 못 쓰는 브라우저용으로 HERO_INLINE_WIDTH 한 장만.
+    """
+    os.makedirs(folder, exist_ok=True)
+    with Image.open(src) as im:
+        plan = _plan(src, widths, folder, *im.size)   # 헤더만 읽음
+        todo = [(v, p) for v, p in plan if not os.path.exists(p)]
+        if todo:
+            # 큰 것부터 줄이면서 직전 결과를 다음 축소의 입력으로 (매번 원본에서 줄이는 비용 절감)
+            current = im.convert("RGB")
+            for v, path in todo:
+                if current.width != v.width:
+                    current = current.resize((v.width, v.height), Image.LANCZOS)
+                _save(current, path, v.mime)
+    return sorted((v for v, _ in plan), key=lambda v: v.width)
+
+_inline_ready = threading.Event()
+_all_ready = threading.Event()
+_build_lock = threading.Lock()
+_build_thread = None
+
+def _build_in_background(src: str, folder: str):
+    try:
+        # data URI/PNG 대체용 한 장을 먼저 (원본 디코드 + 축소 1회, ~0.15초)
+        build_variants(src, (HERO_INLINE_WIDTH,), folder)
+        _inline_ready.set()
+        build_variants(src, HERO_WIDTHS, folder)
+    except OSError:
+        pass   # 원본이 없거나 쓸 수 없는 폴더: 기다리는 쪽은 파일이 없는 것으로 처리
+    finally:
+        _inline_ready.set()
+        _all_ready.set()
+
+def start_build(src: str = HERO_SOURCE, folder: str = ASSET_FOLDER) -> threading.Thread:
+    """프로세스당 한 번 백그라운드에서 모든 변형 생성 시작."""
+    global _build_thread
+    with _build_lock:
+        if _build_thread is None:
+            _build_thread = threading.Thread(target=_build_in_background, args=(src, folder),
+                                             name="asset-build", daemon=True)
+            _build_thread.start()
+        return _build_thread
+
+def wait_built(inline_only: bool = False, timeout: float = None) -> bool:
+    """백그라운드 생성이 (inline_only면 data URI용 한 장까지) 끝날 때까지 대기. 시작 전이면 바로 False."""
+    if _build_thread is None:
+        return False
+    return (_inline_ready if inline_only else _all_ready).wait(timeout)
+
+def picture_html(variants, url_for, alt: str, sizes: str = HERO_SIZES) -> str:
+    """<picture>: 뷰포트에 맞춰 고르는 WebP srcset + PNG 한 장 대체. url_for(variant) → URL."""
+    srcset = ", ".join(f"{url_for(v)} {v.width}w" for v in variants if v.mime == "image/webp")
+    fallback = next(v for v in variants if v.mime == "image/png")
+    return (f'<picture><source type="image/webp" srcset="{srcset}" sizes="{sizes}">'
+            f'<img src="{url_for(fallback)}" width="{fallback.width}" height="{fallback.height}" '
+            f'alt="{alt}" decoding="async" fetchpriority="high"></picture>')
+
+def stale_filter(src: str = HERO_SOURCE):
+    """ASSET_FOLDER 파일명 → 지금 원본이 아닌(해시가 다른) 예전 원본의 변형인지 판정하는 함수."""
+    stem = os.path.splitext(os.path.basename(src))[0]
+    current = f"{stem}.{_source_digest(src)}."
+    return lambda name: name.startswith(f"{stem}.") and not name.startswith(current)
+
+def inline_variant(variants, width: int = HERO_INLINE_WIDTH) -> Variant:
+    """미디어 서버가 없을 때 data URI로 넣을 WebP 한 장."""
+    webps = [v for v in variants if v.mime == "image/webp"]
+    return min(webps, key=lambda v: abs(v.width - width))
@@ -0,0 +1,611 @@
+"""
+성능 점검 스크립트.
+
+    python bench.py startup            # 첫 실행(콜드) / 재실행(웜) 시간 측정, 목표 초과 시 exit 1
+    python bench.py app                # 가상 추모관에서 재실행 지연 / HTML 크기 / 최대 RSS
+    python bench.py convert            # 가짜 이미지 API로 변환 처리량 (--backend local: 로컬 엔진)
+    python bench.py stress             # 여러 프로세스가 같은 추모관에 동시에 업로드/글/삭제/변환, 유실 검사
+    python bench.py generate DIR       # 가상 추모관 폴더만 생성 (수동 확인용)
+
+결과는 bench_results/<시각>-<커밋>.json 에 기록(--out 으로 변경)하여 커밋 간 비교.
+각 측정은 임시 폴더에서 새 프로세스로 돌려서 모듈/리소스 캐시가 섞이지 않게 함.
+"""
+import io
+import os
+import sys
+import json
+import time
+import types
+import base64
+import random
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+from datetime import datetime, timezone
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_PATH = os.path.join(APP_DIR, "streamlit_app.py")
+RESULTS_DIR = os.path.join(APP_DIR, "bench_results")
+
+# 목표치(ms). 환경변수로 덮어쓸 수 있음.
+STARTUP_TARGET_MS = float(os.getenv("STARTUP_TARGET_MS", "1500"))
+RERUN_TARGET_MS = float(os.getenv("RERUN_TARGET_MS", "200"))
+
+# 휴대폰/카메라에서 흔한 해상도
+PHOTO_SIZES = [(4032, 3024), (3024, 4032), (4000, 3000), (1920, 1080), (1600, 1200)]
+
+_STARTUP_CHILD = r"""
+import os, sys, json, time
+os.chdir(sys.argv[1])
+t0 = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file(sys.argv[2], default_timeout=120)
+at.run()
+cold = (time.perf_counter() - t0) * 1000
+if at.exception:
+    sys.exit("app raised: " + "; ".join(e.value for e in at.exception))
+# 첫 재실행은 첫 실행이 미뤄 둔 일(지연 import, 백그라운드 자산 생성 합류 등)을 떠안아 들쭉날쭉 → 측정 제외
+at.run()
+warm = []
+for _ in range(int(sys.argv[3])):
+    t = time.perf_counter()
+    at.run()
+    warm.append((time.perf_counter() - t) * 1000)
+print(json.dumps({"cold_ms": cold, "warm_ms": warm}))
+"""
+
+# 재실행마다 (지연, 내보낸 HTML 바이트) 기록. 캐러셀 넘기기/방명록 페이지 이동도 섞음.
+_APP_CHILD = r"""
+import os, sys, json, time, resource
+os.chdir(sys.argv[1])
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file(sys.argv[2], default_timeout=300)
+
+def html_bytes():
+    return sum(len(m.value.encode("utf-8")) for m in at.markdown)
+
+def step(action):
+    t = time.perf_counter()
+    action()
+    ms = (time.perf_counter() - t) * 1000
+    if at.exception:
+        sys.exit("app raised: " + "; ".join(e.value for e in at.exception))
+    return {"ms": ms, "html_bytes": html_bytes()}
+
+def click(key):
+    def run():
+        btn = [b for b in at.button if b.key == key]
+        (btn[0].click() if btn else at).run()
+    return run
+
+runs = [dict(step(at.run), action="first")]
+for i in range(int(sys.argv[3])):
+    action = ("rerun", "carousel_next", "guest_page_next")[i % 3]
+    runs.append(dict(step(at.run if action == "rerun" else click(action)), action=action))
+peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+# 앱이 같은 프로세스에서 실행되므로 앱의 계측 값을 그대로 읽을 수 있음
+import metrics
+spans = {k: v for k, v in metrics.snapshot()["spans"].items()
+         if k in ("app.fragment.hero", "assets.build")}
+print(json.dumps({"runs": runs, "peak_rss_mb": peak_kb / 1024, "spans": spans}))
+"""
+
+# 복제본 하나를 흉내 내는 프로세스: 자기 업로드/글은 기록해 두고, 변환은 아무 원본에나 씀.
+# argv: work app_dir worker ops start_at
+_STRESS_CHILD = r"""
+import io, os, sys, json, time, random
+os.chdir(sys.argv[1])
+sys.path.insert(0, sys.argv[2])
+worker, ops, start_at = int(sys.argv[3]), int(sys.argv[4]), float(sys.argv[5])
+from PIL import Image
+from tenancy import DEFAULT_MEMORIAL, memorial_paths
+from catalog import IMAGE_EXTS, converted_png_name
+from ingest import ingest_upload, SAVED
+from guestbook import add_message, delete_message
+from storage import change_feed, delete_photo, settle_converted, atomic_write, write_json
+
+paths = memorial_paths(DEFAULT_MEMORIAL)
+feed = change_feed()
+rng = random.Random(worker)
+uploads, messages, bumps, errors = [], {}, {}, []
+converted_png = io.BytesIO()
+Image.new("RGB", (64, 64), (200, 120, 90)).save(converted_png, "PNG")
+
+def bump(*kinds):
+    feed.bump(DEFAULT_MEMORIAL, *kinds)
+    for k in kinds:
+        bumps[k] = bumps.get(k, 0) + 1
+
+time.sleep(max(0.0, start_at - time.time()))   # 모든 프로세스가 같이 시작
+t0 = time.perf_counter()
+for k in range(ops):
+    r = rng.random()
+    if r < 0.3:
+        buf = io.BytesIO()
+        Image.frombytes("RGB", (16, 16), os.urandom(16 * 16 * 3)).save(buf, "JPEG")
+        status, name = ingest_upload(buf, f"w{worker}_{k}.jpg", paths.upload_folder, lambda d: False)
+        if status == SAVED:
+            uploads.append(name)
+            bump("photos")
+    elif r < 0.55:
+        text = f"{worker}-{k}"
+        messages[add_message(f"w{worker}", text, db=paths.guestbook_db)] = text
+        bump("guestbook")
+    elif r < 0.65 and messages:
+        mid = rng.choice(sorted(messages))
+        delete_message(mid, db=paths.guestbook_db)
+        del messages[mid]
+        bump("guestbook")
+    elif r < 0.75 and uploads:
+        delete_photo(paths, uploads.pop())   # 가장 최근 업로드 = 변환 대상이 되기 쉬운 것
+        bump("photos", "converted")
+    elif r < 0.9:
+        # 다른 복제본의 변환 워커: 가장 최근 사진(지워지는 중일 수 있음)에 변환본을 쓰고 정리
+        names = [n for n in os.listdir(paths.upload_folder) if n.lower().endswith(IMAGE_EXTS)]
+        if names:
+            name = max(names, key=lambda n: int(os.path.splitext(n)[0].rsplit("_", 1)[1]))
+            out = os.path.join(paths.converted_folder, converted_png_name(name))
+            time.sleep(0.01)   # 변환 시간
+            atomic_write(out, converted_png.getvalue())
+            settle_converted(paths, os.path.join(paths.upload_folder, name), out)
+            bump("converted")
+    else:
+        write_json(paths.info_path, {"name": f"w{worker}", "op": k})
+        bump("info")
+    if rng.random() < 0.2 and os.path.exists(paths.info_path):
+        try:
+            with open(paths.info_path, encoding="utf-8") as f:
+                json.load(f)
+        except ValueError as e:
+            errors.append(f"memorial_info.json: {e}")
+print(json.dumps({"uploads": uploads, "messages": sorted(messages.values()), "bumps": bumps,
+                  "errors": errors, "seconds": time.perf_counter() - t0}))
+"""
+
+# 앱과 같은 경로로 변환: 작업 큐에 넣고 ConversionWorker가 소비할 때까지 대기.
+# argv: work app_dir workers backend client_kwargs(JSON)
+_CONVERT_CHILD = r"""
+import os, sys, json, time
+os.chdir(sys.argv[1])
+sys.path.insert(0, sys.argv[2])
+import bench, metrics
+from catalog import converted_png_name
+from jobs import QUEUED, RUNNING, FAILED, ConversionWorker, enqueue, job_counts
+from media import digest_key
+from tenancy import DEFAULT_MEMORIAL, memorial_paths
+
+paths = memorial_paths(DEFAULT_MEMORIAL)
+client = bench.FakeClient(**json.loads(sys.argv[5]))
+names = sorted(os.listdir(paths.upload_folder))
+t = time.perf_counter()
+enqueue([(digest_key(n), os.path.join(paths.upload_folder, n),
+          os.path.join(paths.converted_folder, converted_png_name(n))) for n in names], DEFAULT_MEMORIAL)
+ConversionWorker(client, int(sys.argv[3]), backend=sys.argv[4]).start()
+while True:
+    counts = job_counts(DEFAULT_MEMORIAL)
+    if not counts.get(QUEUED) and not counts.get(RUNNING):
+        break
+    time.sleep(0.02)
+print(json.dumps({"jobs": len(names), "failed": counts.get(FAILED, 0), "seconds": time.perf_counter() - t,
+                  "api_calls": client.images.calls, "local": metrics.snapshot()["spans"].get("convert.local")}))
+"""
+
+# 같은 작업 큐를 쓰는 복제본의 변환 워커 하나: 시작/주기적으로 recover, claim → (변환) → finish.
+# crash가 1이면 처음 가져간 작업을 든 채로 종료(죽은 복제본). argv: work app_dir worker start_at crash
+_QUEUE_CHILD = r"""
+import os, sys, json, time, random
+os.chdir(sys.argv[1])
+sys.path.insert(0, sys.argv[2])
+worker, start_at, crash = int(sys.argv[3]), float(sys.argv[4]), sys.argv[5] == "1"
+from jobs import QUEUED, RUNNING, claim, finish, recover, job_counts
+from tenancy import DEFAULT_MEMORIAL
+
+rng = random.Random(worker)
+claimed, finished, lost = [], [], []
+time.sleep(max(0.0, start_at - time.time()))
+recovered = recover()
+deadline = time.time() + 60
+while time.time() < deadline:
+    rows = claim(2)
+    if not rows:
+        counts = job_counts(DEFAULT_MEMORIAL)
+        if not counts.get(QUEUED) and not counts.get(RUNNING):
+            break
+        time.sleep(0.02)
+        recovered += recover()   # 죽은 복제본이 남긴 작업
+        continue
+    claimed.extend(r[1] for r in rows)
+    if crash:
+        print(json.dumps({"claimed": claimed, "finished": [], "lost": [], "recovered": 0}), flush=True)
+        os._exit(0)
+    time.sleep(rng.uniform(0.005, 0.02))   # 변환 시간
+    for memorial, digest, src, out in rows:
+        (finished if finish(memorial, digest) else lost).append(digest)
+    if rng.random() < 0.3:
+        recovered += recover()   # 다른 복제본이 막 시작하는 상황
+print(json.dumps({"claimed": claimed, "finished": finished, "lost": lost, "recovered": recovered}))
+"""
+
+def _queue_stress(work: str, procs: int, n_jobs: int):
+    """작업 큐 시나리오. (problems, 요약 dict)"""
+    from jobs import DONE, enqueue, job_counts
+    from tenancy import DEFAULT_MEMORIAL
+    enqueue([(f"{i:016x}", f"src{i}", f"out{i}") for i in range(n_jobs)], DEFAULT_MEMORIAL)
+    start_at = time.time() + 1.0
+    # 0번은 작업을 든 채로 죽고, 나머지는 조금씩 늦게 시작해 남이 든 작업이 있을 때 recover를 부름
+    children = [subprocess.Popen([sys.executable, "-c", _QUEUE_CHILD, work, APP_DIR, str(i),
+                                  str(start_at + 0.05 * i), "1" if i == 0 and procs > 1 else "0"],
+                                 stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+                for i in range(procs)]
+    results = []
+    for c in children:
+        out, err = c.communicate()   # 0번을 먼저 거둬야 pid가 좀비로 남지 않음
+        if c.returncode != 0:
+            raise SystemExit(err.strip() or f"child exited {c.returncode}")
+        results.append(json.loads(out.strip().splitlines()[-1]))
+
+    problems = []
+    live = results[1:] if procs > 1 else results
+    claims = {}
+    for r in live:
+        for d in r["claimed"]:
+            claims[d] = claims.get(d, 0) + 1
+    twice = [d for d, n in claims.items() if n > 1]
+    if twice:
+        problems.append(f"queue: {len(twice)} jobs claimed by two live workers (converted twice)")
+    finishes = {}
+    for r in live:
+        for d in r["finished"]:
+            finishes[d] = finishes.get(d, 0) + 1
+    if len(finishes) != n_jobs or any(n != 1 for n in finishes.values()):
+        problems.append(f"queue: {len(finishes)}/{n_jobs} jobs finished, "
+                        f"{sum(1 for n in finishes.values() if n > 1)} more than once")
+    counts = job_counts(DEFAULT_MEMORIAL)
+    if counts != {DONE: n_jobs}:
+        problems.append(f"queue: final states {counts}")
+    orphaned = set(results[0]["claimed"]) if procs > 1 else set()
+    if orphaned - set(finishes):
+        problems.append(f"queue: {len(orphaned - set(finishes))} jobs of the dead worker never recovered")
+    return problems, {"jobs": n_jobs, "recovered": sum(r["recovered"] for r in live),
+                      "double_claims": len(twice)}
+
+
+# -------------------- 가상 추모관 --------------------
+def _photo(size, seed: int):
+    from PIL import Image
+    w, h = size
+    rng = random.Random(seed)
+    # 저해상도 노이즈를 키워서 사진처럼 부드러운 질감 (순수 노이즈는 압축/인코딩 비용이 비현실적)
+    noise = Image.effect_noise((w // 8, h // 8), rng.uniform(20, 60)).resize((w, h), Image.BICUBIC)
+    # 사진마다 명암 구조가 달라야 유사 사진 검출 등에서 서로 다른 사진으로 취급됨
+    blobs = Image.effect_noise((4, 3), 90).resize((w, h), Image.BICUBIC)
+    grad = Image.linear_gradient("L").rotate(rng.choice((0, 90, 180, 270))).resize((w, h))
+    channels = [noise, Image.blend(grad, blobs, 0.6), blobs]
+    rng.shuffle(channels)
+    return Image.merge("RGB", channels)
+
+def generate_memorial(root: str, photos: int, guests: int, converted: int, seed: int = 0) -> dict:
+    """root(작업 폴더)에 default 추모관 데이터 생성. 원본 N장, 방명록 M개, 변환본 K장."""
+    cwd = os.getcwd()
+    os.chdir(root)
+    sys.path.insert(0, APP_DIR)
+    try:
+        from tenancy import DEFAULT_MEMORIAL, memorial_paths
+        from guestbook import migrate_legacy
+        from catalog import converted_png_name
+        from media import ensure_thumbnails
+
+        paths = memorial_paths(DEFAULT_MEMORIAL)
+        os.makedirs(paths.upload_folder, exist_ok=True)
+        os.makedirs(paths.converted_folder, exist_ok=True)
+        total = 0
+        for i in range(photos):
+            im = _photo(PHOTO_SIZES[i % len(PHOTO_SIZES)], seed + i)
+            buf = io.BytesIO()
+            im.save(buf, "JPEG", quality=90)
+            digest = f"{seed:08x}{i:08x}"
+            fname = f"{digest}_photo{i:04d}.jpg"
+            with open(os.path.join(paths.upload_folder, fname), "wb") as f:
+                f.write(buf.getvalue())
+            total += buf.tell()
+            if i < converted:
+                out = os.path.join(paths.converted_folder, converted_png_name(fname))
+                im.resize((1024, 1024)).save(out, "PNG")
+                ensure_thumbnails(out)
+
+        with open(paths.legacy_guestbook, "w", encoding="utf-8") as f:
+            for i in range(guests):
+                f.write(f"2024-01-01 {i // 3600 % 24:02d}:{i // 60 % 60:02d}:{i % 60:02d}"
+                        f"|guest{i}|보고 싶어 {i}\n")
+        migrate_legacy(paths.guestbook_db, paths.legacy_guestbook)
+    finally:
+        sys.path.remove(APP_DIR)
+        os.chdir(cwd)
+    return {"photos": photos, "guests": guests, "converted": converted, "photo_bytes": total}
+
+
+# -------------------- 가짜 이미지 API --------------------
+class FakeAPIError(Exception):
+    def __init__(self, message: str, status_code: int, retry_after: float):
+        super().__init__(message)
+        self.status_code = status_code
+        self.response = types.SimpleNamespace(headers={"retry-after": str(retry_after)})
+
+class FakeImages:
+    """client.images 대역. latency초 지연 후 1024px PNG 반환, 일정 비율로 429/503."""
+
+    def __init__(self, latency: float, rate_limit_rate: float, error_rate: float,
+                 retry_after: float, seed: int = 0):
+        from PIL import Image
+        self.latency = latency
+        self.rate_limit_rate = rate_limit_rate
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.calls = 0
+        self._rng = random.Random(seed)
+        buf = io.BytesIO()
+        Image.new("RGB", (1024, 1024), (200, 120, 80)).save(buf, "PNG")
+        self._b64 = base64.b64encode(buf.getvalue()).decode("ascii")
+
+    def _respond(self, **kw):
+        self.calls += 1
+        time.sleep(self.latency)
+        r = self._rng.random()
+        if r < self.rate_limit_rate:
+            raise FakeAPIError("429 rate limited", 429, self.retry_after)
+        if r < self.rate_limit_rate + self.error_rate:
+            raise FakeAPIError("503 service unavailable", 503, self.retry_after)
+        return types.SimpleNamespace(data=[types.SimpleNamespace(b64_json=self._b64)])
+
+    variations = edit = _respond
+
+class FakeClient:
+    def __init__(self, **kw):
+        self.images = FakeImages(**kw)
+
+
+# -------------------- 실행 --------------------
+def _run_child(code: str, *args, work: str = None) -> dict:
+    """work(없으면 빈 임시 폴더)를 cwd로 하는 새 인터프리터에서 code 실행, 마지막 줄 JSON 반환."""
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, OPENAI_API_KEY=os.getenv("OPENAI_API_KEY", "sk-bench"))
+        out = subprocess.run([sys.executable, "-c", code, work or tmp, *args],
+                             env=env, capture_output=True, text=True)
+    if out.returncode != 0:
+        raise SystemExit(out.stderr.strip() or f"child exited {out.returncode}")
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+def _summary(values):
+    values = sorted(values)
+    return {"median": statistics.median(values), "p90": values[int(0.9 * (len(values) - 1))],
+            "max": values[-1]}
+
+
+def measure_startup(repeat: int, reruns: int):
+    """새 프로세스 repeat번: (콜드 중앙값, 웜 중앙값, 콜드 목록, 웜 목록). tests/test_startup.py도 사용."""
+    colds, warms = [], []
+    for _ in range(repeat):
+        r = _run_child(_STARTUP_CHILD, APP_PATH, str(reruns))
+        colds.append(r["cold_ms"])
+        warms.extend(r["warm_ms"])
+    return statistics.median(colds), statistics.median(warms), colds, warms
+
+def cmd_startup(args):
+    cold, warm, colds, warms = measure_startup(args.repeat, args.reruns)
+    print(f"cold start : {cold:8.1f} ms (median of {len(colds)}, target {STARTUP_TARGET_MS:.0f})")
+    print(f"warm rerun : {warm:8.1f} ms (median of {len(warms)}, target {RERUN_TARGET_MS:.0f})")
+    ok = cold <= STARTUP_TARGET_MS and warm <= RERUN_TARGET_MS
+    if not ok:
+        print("FAIL: 목표 시간 초과")
+    return (0 if ok else 1), {"cold_ms": colds, "warm_ms": warms, "ok": ok}
+
+def cmd_app(args):
+    with tempfile.TemporaryDirectory() as work:
+        t = time.perf_counter()
+        memorial = generate_memorial(work, args.photos, args.guests, args.converted, args.seed)
+        print(f"generated  : {args.photos} photos / {args.guests} guests / {args.converted} converted "
+              f"in {time.perf_counter() - t:.1f}s")
+        r = _run_child(_APP_CHILD, APP_PATH, str(args.reruns), work=work)
+    first, rest = r["runs"][0], r["runs"][1:]
+    warm = _summary([x["ms"] for x in rest]) if rest else None
+    print(f"first run  : {first['ms']:8.1f} ms, {first['html_bytes'] / 1024:8.1f} KiB html")
+    if warm:
+        print(f"reruns     : median {warm['median']:.1f} ms, p90 {warm['p90']:.1f} ms, max {warm['max']:.1f} ms")
+        print(f"html/rerun : {statistics.median(x['html_bytes'] for x in rest) / 1024:8.1f} KiB")
+    print(f"peak RSS   : {r['peak_rss_mb']:8.1f} MiB")
+    hero, build = r["spans"].get("app.fragment.hero"), r["spans"].get("assets.build")
+    if hero:
+        print(f"hero       : mean {hero['total_s'] / hero['count'] * 1000:.1f} ms, "
+              f"max {hero['max_s'] * 1000:.1f} ms over {hero['count']} renders"
+              + (f" (asset build {build['total_s'] * 1000:.0f} ms, in background)" if build else ""))
+    return 0, {"memorial": memorial, "first": first, "rerun_ms": warm, "runs": r["runs"],
+               "peak_rss_mb": r["peak_rss_mb"], "spans": r["spans"]}
+
+def cmd_convert(args):
+    client_kw = {"latency": args.latency, "rate_limit_rate": args.rate_limit_rate,
+                 "error_rate": args.error_rate, "retry_after": args.retry_after, "seed": args.seed}
+    with tempfile.TemporaryDirectory() as work:
+        # 변환 캐시/작업 DB도 임시 폴더에 생성되어 매번 실제로 변환
+        generate_memorial(work, args.photos, 0, 0, args.seed)
+        r = _run_child(_CONVERT_CHILD, APP_DIR, str(args.workers), args.backend, json.dumps(client_kw),
+                       work=work)
+    jobs, failed, elapsed, local = r["jobs"], r["failed"], r["seconds"], r["local"]
+    done = jobs - failed
+    print(f"converted  : {done}/{jobs} in {elapsed:.2f}s "
+          f"({done / elapsed:.2f} photos/s, {r['api_calls']} API calls, {args.workers} workers, "
+          f"backend {args.backend})")
+    local_ms = None
+    if local:
+        # 변환 프로세스를 처음 띄우는 비용이 포함된 평균
+        local_ms = local["total_s"] / local["count"] * 1000
+        print(f"local      : {local['count']} photos, mean {local_ms:.1f} ms, max {local['max_s'] * 1000:.1f} ms")
+    return 0, {"jobs": jobs, "done": done, "failed": failed, "seconds": elapsed,
+               "photos_per_s": done / elapsed, "api_calls": r["api_calls"],
+               "local_mean_ms": local_ms}
+
+def cmd_stress(args):
+    sys.path.insert(0, APP_DIR)
+    cwd = os.getcwd()
+    try:
+        from tenancy import DEFAULT_MEMORIAL, memorial_paths, ensure_memorial
+        from catalog import IMAGE_EXTS
+        from guestbook import iter_messages, message_count
+        from storage import versions
+        with tempfile.TemporaryDirectory() as work:
+            os.chdir(work)   # 모든 프로세스가 같은 default 추모관 폴더를 공유
+            paths = memorial_paths(DEFAULT_MEMORIAL)
+            ensure_memorial(paths)
+            start_at = time.time() + 1.0
+            procs = [subprocess.Popen([sys.executable, "-c", _STRESS_CHILD, work, APP_DIR, str(i),
+                                       str(args.ops), str(start_at)],
+                                      stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+                     for i in range(args.procs)]
+            results = []
+            for p in procs:
+                out, err = p.communicate()
+                if p.returncode != 0:
+                    raise SystemExit(err.strip() or f"child exited {p.returncode}")
+                results.append(json.loads(out.strip().splitlines()[-1]))
+
+            # 검사: 각 프로세스가 남겼다고 기록한 것 == 실제로 남은 것
+            problems = [e for r in results for e in r["errors"]]
+            want_msgs = sorted(m for r in results for m in r["messages"])
+            rows = list(iter_messages(db=paths.guestbook_db))
+            if sorted(r[3] for r in rows) != want_msgs:
+                problems.append(f"guestbook: {len(rows)} rows, expected {len(want_msgs)}")
+            if message_count(paths.guestbook_db) != len(rows):
+                problems.append(f"guestbook count {message_count(paths.guestbook_db)} != {len(rows)} rows")
+            want_photos = {n for r in results for n in r["uploads"]}
+            photos = {n for n in os.listdir(paths.upload_folder) if n.lower().endswith(IMAGE_EXTS)}
+            if photos != want_photos:
+                problems.append(f"uploads: {len(photos - want_photos)} unexpected, "
+                                f"{len(want_photos - photos)} lost")
+            stems = {os.path.splitext(n)[0] for n in photos}
+            converted = os.listdir(paths.converted_folder)
+            orphans = [n for n in converted if n.endswith("__converted.png")
+                       and n[:-len("__converted.png")] not in stems]
+            if orphans:
+                problems.append(f"converted without source: {len(orphans)}")
+            temps = [os.path.join(d, n) for d in (".", paths.upload_folder, paths.converted_folder)
+                     for n in os.listdir(d) if n.endswith((".tmp", ".norm"))]
+            if temps:
+                problems.append(f"temp files left: {temps[:3]}")
+            try:
+                with open(paths.info_path, encoding="utf-8") as f:
+                    json.load(f)
+            except (OSError, ValueError) as e:
+                problems.append(f"memorial_info.json: {e}")
+            want_versions = {}
+            for r in results:
+                for k, v in r["bumps"].items():
+                    want_versions[k] = want_versions.get(k, 0) + v
+            got_versions = versions(DEFAULT_MEMORIAL)
+            if got_versions != want_versions:
+                problems.append(f"change versions {got_versions} != {want_versions}")
+            queue_problems, queue = _queue_stress(work, args.procs, args.jobs)
+            problems.extend(queue_problems)
+            os.chdir(cwd)   # 임시 폴더를 지우기 전에 나옴
+    finally:
+        os.chdir(cwd)
+        sys.path.remove(APP_DIR)
+
+    ops = args.procs * args.ops
+    seconds = max(r["seconds"] for r in results)
+    print(f"stress     : {args.procs} processes x {args.ops} ops in {seconds:.2f}s ({ops / seconds:.0f} ops/s)")
+    print(f"survivors  : {len(photos)} photos, {len(converted)} converted, {len(rows)} messages")
+    print(f"queue      : {queue['jobs']} jobs, {queue['recovered']} recovered from the dead worker, "
+          f"{queue['double_claims']} double claims")
+    for p in problems:
+        print(f"FAIL: {p}")
+    if not problems:
+        print("ok         : nothing lost, no orphans, no temp files, versions match, each job run once")
+    return (1 if problems else 0), {"procs": args.procs, "ops": ops, "seconds": seconds,
+                                    "ops_per_s": ops / seconds, "queue": queue, "problems": problems}
+
+def cmd_generate(args):
+    os.makedirs(args.dir, exist_ok=True)
+    memorial = generate_memorial(args.dir, args.photos, args.guests, args.converted, args.seed)
+    print(f"generated memorial in {args.dir}: {memorial}")
+    return 0, None
+
+
+def _git_rev() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=APP_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def write_results(path: str, args, results: dict) -> str:
+    now = datetime.now(timezone.utc)
+    rev = _git_rev()
+    if path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"{now:%Y%m%dT%H%M%SZ}-{args.cmd}-{rev}.json")
+    params = {k: v for k, v in vars(args).items() if k not in ("func", "out")}
+    record = {"command": args.cmd, "rev": rev, "time": now.isoformat(), "python": platform.python_version(),
+              "machine": platform.machine(), "params": params, "results": results}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(record, f, ensure_ascii=False, indent=2)
+    return path
+
+
+def main(argv=None) -> int:
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    out_help = "결과 JSON 경로 (기본: bench_results/...)"
+    p.add_argument("--out", help=out_help)
+    # 하위 명령 뒤에서도 받도록. 주지 않으면 값을 덮어쓰지 않음 (앞에서 준 --out 유지)
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--out", default=argparse.SUPPRESS, help=out_help)
+    sub = p.add_subparsers(dest="cmd", required=True)
+
+    s = sub.add_parser("startup", parents=[common], help="콜드 스타트/재실행 시간")
+    s.add_argument("--repeat", type=int, default=3, help="새 프로세스로 반복할 횟수")
+    s.add_argument("--reruns", type=int, default=10, help="프로세스당 웜 재실행 횟수 (첫 재실행은 제외하고 셈)")
+    s.set_defaults(func=cmd_startup)
+
+    def memorial_args(s, photos=24, guests=500, converted=12):
+        s.add_argument("--photos", type=int, default=photos, help="원본 사진 수")
+        s.add_argument("--guests", type=int, default=guests, help="방명록 글 수")
+        s.add_argument("--converted", type=int, default=converted, help="변환본 수")
+        s.add_argument("--seed", type=int, default=0)
+
+    s = sub.add_parser("app", parents=[common], help="가상 추모관에서 재실행 지연/HTML 크기/최대 RSS")
+    memorial_args(s)
+    s.add_argument("--reruns", type=int, default=12, help="첫 실행 뒤 재실행 횟수")
+    s.set_defaults(func=cmd_app)
+
+    s = sub.add_parser("convert", parents=[common], help="가짜 이미지 API로 변환 처리량")
+    s.add_argument("--photos", type=int, default=16)
+    s.add_argument("--seed", type=int, default=0)
+    s.add_argument("--workers", type=int, default=4)
+    s.add_argument("--latency", type=float, default=0.5, help="API 호출당 지연(초)")
+    s.add_argument("--rate-limit-rate", type=float, default=0.0, help="429 비율")
+    s.add_argument("--error-rate", type=float, default=0.0, help="503 비율")
+    s.add_argument("--retry-after", type=float, default=0.2, help="429/503 응답의 Retry-After(초)")
+    s.add_argument("--backend", choices=("api", "local", "auto"), default="api",
+                   help="변환 방식 (local/auto는 로컬 카툰 엔진을 변환 프로세스에서 실행)")
+    s.set_defaults(func=cmd_convert)
+
+    s = sub.add_parser("stress", parents=[common], help="여러 프로세스의 동시 업로드/글/삭제/변환 후 유실 검사")
+    s.add_argument("--procs", type=int, default=4, help="동시에 쓰는 프로세스(복제본) 수")
+    s.add_argument("--ops", type=int, default=200, help="프로세스당 작업 수")
+    s.add_argument("--jobs", type=int, default=200, help="작업 큐 시나리오의 변환 작업 수")
+    s.set_defaults(func=cmd_stress)
+
+    s = sub.add_parser("generate", help="가상 추모관 폴더 생성")
+    s.add_argument("dir")
+    memorial_args(s)
+    s.set_defaults(func=cmd_generate)
+
+    args = p.parse_args(argv)
+    code, results = args.func(args)
+    if results is not None:
+        print(f"results    : {write_results(args.out, args, results)}")
+    return code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,68 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from media import SizedLRU, img_file_to_data_uri, thumbnail_key, thumbnail_path
+from metrics import incr
+
+# -------------------- 캐러셀 프레임 캐시 --------------------
+# 표시용 축소본을 data URI로 인코딩한 결과를 메모리에 보관하고,
+# 현재 위치의 앞뒤 프레임은 백그라운드에서 미리 만들어 둠.
+# 프레임 크기는 원본 크기와 무관하게 display 썸네일(최대 960px)로 제한됨.
+FRAME_CACHE_MB = int(os.getenv("CAROUSEL_CACHE_MB", "64"))
+PREFETCH_AHEAD = 2     # 다음 방향으로 미리 만들 프레임 수 (자동 재생 대비)
+PREFETCH_BEHIND = 1    # 이전 방향
+AUTOPLAY_INTERVAL = 4  # 초
+
+_frames = SizedLRU(FRAME_CACHE_MB << 20)
+_pending = set()
+_pending_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="carousel-prefetch")
+
+
+def _frame_key(path: str, kind: str):
+    # 같은 파일명으로 덮어써진 경우를 구분하기 위해 mtime 포함
+    return (thumbnail_key(path), kind, os.path.getmtime(path))
+
+def frame_uri(path: str, kind: str = "display") -> str:
+    """캐러셀에 넣을 data URI. 캐시에 없으면 지금 만들고 캐시에 넣음."""
+    key = _frame_key(path, kind)
+    uri = _frames.get(key)
+    incr("carousel.frame_" + ("miss" if uri is None else "hit"))
+    if uri is None:
+        uri = img_file_to_data_uri(thumbnail_path(path, kind))
+        _frames.put(key, uri)
+    return uri
+
+def _warm(path: str, kind: str, key):
+    try:
+        if key not in _frames:
+            _frames.put(key, img_file_to_data_uri(thumbnail_path(path, kind)))
+    except OSError:
+        pass   # 그 사이 삭제된 파일: 표시할 때 다시 시도
+    finally:
+        with _pending_lock:
+            _pending.discard(key)
+
+def prefetch(paths, idx: int, kind: str = "display"):
+    """idx 주변 프레임을 백그라운드에서 준비. 이미 캐시/대기 중인 것은 건너뜀."""
+    n = len(paths)
+    if n <= 1:
+        return
+    offsets = list(range(1, PREFETCH_AHEAD + 1)) + [-k for k in range(1, PREFETCH_BEHIND + 1)]
+    for off in offsets:
+        path = paths[(idx + off) % n]
+        try:
+            key = _frame_key(path, kind)
+        except OSError:
+            continue
+        if key in _frames:
+            continue
+        with _pending_lock:
+            if key in _pending:
+                continue
+            _pending.add(key)
+        _executor.submit(_warm, path, kind, key)
+
+def cached_frames() -> int:
+    return len(_frames)
@@ -0,0 +1,180 @@
+import os
+import sys
+import json
+import signal
+import threading
+import subprocess
+
+import numpy as np
+from PIL import Image, ImageFilter
+
+from media import square_canvas
+from metrics import incr, timed
+
+# -------------------- 로컬 카툰 변환 엔진 --------------------
+# 이미지 API 없이 CPU만으로 만드는 셀 애니 풍 변환본 (오프라인/즉시 미리보기/레이트 리밋 폴백).
+#   1) 평탄화: 작은 질감을 지우고 경계는 남김 (절반 크기 메디안)
+#   2) 색 양자화: 축소 표본으로 k-means → 전체 픽셀을 가장 가까운 색에 배정 (행렬 연산 한 번)
+#   3) 셀 음영: 영역 평균보다 어두운/밝은 부분을 2~3단계 단색 톤으로
+#   4) 외곽선: 소벨 경계 + 색 영역 경계를 굵은 선으로
+# 같은 입력이면 항상 같은 결과(결정적). 1024x1024 한 장에 수백 ms.
+PALETTE_SIZE = 12            # 전체 색 수 (셀 음영 톤 제외)
+KMEANS_SAMPLE = 8192         # k-means에 쓰는 표본 픽셀 수
+KMEANS_ITERS = 8
+SATURATION = 1.3             # 팔레트 채도 강조
+SHADE_STEP = 14.0            # 영역 평균 밝기에서 이만큼 벗어나면 그림자/하이라이트 톤
+SHADOW, HIGHLIGHT = 0.72, 0.18   # 그림자: 곱, 하이라이트: 흰색 쪽으로 섞는 비율
+EDGE_STRONG = 80.0           # 소벨 크기가 이보다 크면 선 (0~255 밝기 기준)
+EDGE_WEAK = 35.0             # 색 영역 경계는 이 정도 대비만 있어도 선
+LINE_COLOR = (38, 28, 30)
+
+LOCAL_WORKERS = int(os.getenv("LOCAL_CONVERT_WORKERS", str(os.cpu_count() or 1)))
+
+_LUMA = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+
+def _kmeans(pixels: np.ndarray, k: int, iters: int) -> np.ndarray:
+    """pixels (N, 3) float32 → 중심 (k, 3). 밝기 순 분위수로 초기화해 결정적."""
+    order = np.argsort(pixels @ _LUMA, kind="stable")
+    centers = pixels[order[np.linspace(0, len(order) - 1, k).astype(int)]].copy()
+    for _ in range(iters):
+        labels = _assign(pixels, centers)
+        sums = np.zeros_like(centers)
+        np.add.at(sums, labels, pixels)
+        counts = np.bincount(labels, minlength=k)[:, None]
+        centers = np.where(counts > 0, sums / np.maximum(counts, 1), centers)
+    return centers
+
+def _assign(pixels: np.ndarray, centers: np.ndarray) -> np.ndarray:
+    # |x - c|^2 = |x|^2 - 2x·c + |c|^2, |x|^2는 argmin에 무관하므로 생략
+    d = (centers * centers).sum(axis=1)[None, :] - 2.0 * (pixels @ centers.T)
+    return d.argmin(axis=1)
+
+# 5비트 RGB 격자의 각 칸 중심색 (32768, 3). 1M 픽셀 x 팔레트 대신 32768칸 x 팔레트만 계산
+_LUT_BITS = 5
+_levels = (np.arange(1 << _LUT_BITS, dtype=np.float32) + 0.5) * (256 >> _LUT_BITS)
+_LUT_COLORS = np.stack(np.meshgrid(_levels, _levels, _levels, indexing="ij"), axis=-1).reshape(-1, 3)
+
+def _lut_index(px: np.ndarray) -> np.ndarray:
+    """uint8 (H, W, 3) → 격자 칸 번호 (H, W)."""
+    q = (px >> (8 - _LUT_BITS)).astype(np.intp)
+    return (q[..., 0] << (2 * _LUT_BITS)) | (q[..., 1] << _LUT_BITS) | q[..., 2]
+
+def _saturate(colors: np.ndarray, amount: float) -> np.ndarray:
+    gray = (colors @ _LUMA)[:, None]
+    return np.clip(gray + (colors - gray) * amount, 0, 255)
+
+def _edges(gray: np.ndarray) -> np.ndarray:
+    """소벨 기울기 크기 (가장자리 1픽셀은 0)."""
+    g = gray
+    gx = np.zeros_like(g)
+    gy = np.zeros_like(g)
+    gx[1:-1, 1:-1] = ((g[:-2, 2:] + 2 * g[1:-1, 2:] + g[2:, 2:])
+                      - (g[:-2, :-2] + 2 * g[1:-1, :-2] + g[2:, :-2]))
+    gy[1:-1, 1:-1] = ((g[2:, :-2] + 2 * g[2:, 1:-1] + g[2:, 2:])
+                      - (g[:-2, :-2] + 2 * g[:-2, 1:-1] + g[:-2, 2:]))
+    return np.hypot(gx, gy)
+
+def _boundaries(labels: np.ndarray) -> np.ndarray:
+    b = np.zeros(labels.shape, dtype=bool)
+    b[:, 1:] |= labels[:, 1:] != labels[:, :-1]
+    b[1:, :] |= labels[1:, :] != labels[:-1, :]
+    return b
+
+@timed("cartoon.render")
+def cartoonize(im: Image.Image) -> Image.Image:
+    """RGB(A) 이미지 → 같은 크기의 카툰 풍 RGB 이미지."""
+    rgb = im.convert("RGB")
+    # 절반 크기에서 메디안(전체 크기 5x5 대비 1/10 비용) 후 다시 키움 → 붓 자국 없는 면
+    smooth = rgb.reduce(2).filter(ImageFilter.MedianFilter(3)).resize(rgb.size, Image.BILINEAR)
+    px = np.asarray(smooth)
+    flat = px.reshape(-1, 3)
+
+    # 색 양자화: 표본으로 팔레트를 구하고, 전체 픽셀은 채널당 5비트 색 → 팔레트 번호 표로 배정
+    step = max(1, len(flat) // KMEANS_SAMPLE)
+    centers = _kmeans(flat[::step].astype(np.float32), PALETTE_SIZE, KMEANS_ITERS)
+    labels = _assign(_LUT_COLORS, centers).astype(np.uint8)[_lut_index(px)]
+
+    # 셀 음영: 흐린 밝기를 영역(색)별 평균과 비교해 3단계로 나눔 → 경계가 딱 떨어지는 그림자
+    luma = np.asarray(smooth.convert("L").filter(ImageFilter.GaussianBlur(3)), dtype=np.float32)
+    area_luma = np.bincount(labels.ravel(), weights=luma.ravel(), minlength=PALETTE_SIZE)
+    area_luma /= np.maximum(np.bincount(labels.ravel(), minlength=PALETTE_SIZE), 1)
+    diff = luma - area_luma[labels]
+    tone = np.where(diff < -SHADE_STEP, 0, np.where(diff > SHADE_STEP, 2, 1))
+
+    base = _saturate(centers, SATURATION)
+    tones = np.stack([base * SHADOW, base, base + (255 - base) * HIGHLIGHT])   # (3, k, 3)
+    out = tones[tone, labels]
+
+    # 외곽선: 강한 소벨 경계 + 색 영역 경계 중 어느 정도 대비가 있는 곳, 3px로 굵게
+    mag = _edges(luma)
+    lines = (mag > EDGE_STRONG) | (_boundaries(labels) & (mag > EDGE_WEAK))
+    lines = Image.fromarray(lines.astype(np.uint8) * 255).filter(ImageFilter.MaxFilter(3))
+    out[np.asarray(lines) > 0] = LINE_COLOR
+    return Image.fromarray(out.astype(np.uint8), "RGB")
+
+def convert_file(src_path: str, out_path: str, max_side: int = 1024):
+    """원본 → API와 같은 max_side 정사각 캔버스 → 카툰 PNG (임시 파일 → rename)."""
+    result = cartoonize(square_canvas(src_path, max_side))
+    tmp = f"{out_path}.{os.getpid()}.local.tmp"
+    # 빠른 압축으로 우선 저장 (최적화는 optimizer가 백그라운드에서)
+    result.save(tmp, "PNG", compress_level=1)
+    os.replace(tmp, out_path)
+
+
+# -------------------- 변환 프로세스 --------------------
+# NumPy/PIL 연산 일부는 GIL을 잡으므로 배치는 별도 프로세스에서 병렬 처리.
+# multiprocessing 자식(spawn/forkserver)은 부모의 __main__을 다시 실행하는데, streamlit은 앱 스크립트를
+# __main__으로 등록하므로 이 파일만 실행하는 전용 프로세스를 띄워 파이프로 작업을 주고받음.
+# 프로세스는 처음 필요할 때 띄우고 재사용 (최대 LOCAL_WORKERS개). 앱이 끝나면 stdin이 닫혀 같이 종료.
+_idle: list = []
+_pool_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(max(1, LOCAL_WORKERS))
+
+def _start_worker() -> subprocess.Popen:
+    return subprocess.Popen([sys.executable, os.path.abspath(__file__)],
+                            stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+
+@timed("convert.local")
+def convert_local(src_path: str, out_path: str, max_side: int = 1024):
+    """변환 프로세스에서 convert_file 실행 후 완료까지 대기 (변환 워커 스레드에서 호출)."""
+    with _slots:
+        with _pool_lock:
+            proc = _idle.pop() if _idle else None
+        if proc is None or proc.poll() is not None:
+            proc = _start_worker()
+        try:
+            proc.stdin.write(json.dumps([src_path, out_path, max_side]) + "\n")
+            proc.stdin.flush()
+            reply = proc.stdout.readline()
+        except OSError:
+            reply = ""
+        if not reply:
+            # 프로세스가 죽음(OOM 등): 버리고 다음 호출은 새 프로세스에서
+            proc.kill()
+            proc.wait()
+            raise RuntimeError(f"로컬 변환 프로세스가 종료되었습니다 (exit {proc.returncode})")
+        with _pool_lock:
+            _idle.append(proc)
+    error = json.loads(reply)
+    if error:
+        raise RuntimeError(error)
+    incr("convert.local")
+
+def _serve():
+    """변환 프로세스 본체: 한 줄에 작업 하나([src, out, max_side]), 결과는 한 줄(오류 문자열 또는 null)."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)   # 터미널 Ctrl-C는 앱이 처리, 여기선 stdin이 닫히면 종료
+    out, sys.stdout = sys.stdout, sys.stderr       # 라이브러리 출력이 응답 줄을 깨지 않게
+    for line in sys.stdin:
+        src_path, out_path, max_side = json.loads(line)
+        try:
+            convert_file(src_path, out_path, max_side)
+            error = None
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        out.write(json.dumps(error) + "\n")
+        out.flush()
+
+
+if __name__ == "__main__":
+    _serve()
@@ -0,0 +1,129 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import NamedTuple
+
+from media import digest_key
+from metrics import incr, timed
+
+# -------------------- 미디어 카탈로그 --------------------
+# 폴더별 메모리 인덱스. 폴더 mtime이 바뀌었을 때만 다시 스캔하므로
+# 재실행마다 os.listdir + 파일별 getmtime을 반복하지 않음.
+IMAGE_EXTS = (".png", ".jpg", ".jpeg")
+
+MAX_INDEXES = 512      # 메모리에 유지할 폴더 인덱스 수 (추모관이 수천 개여도 상한)
+CHECK_INTERVAL = 1.0   # 초: 이 간격 안에서는 폴더 stat도 생략
+SETTLE_WINDOW = 2.0    # 초: mtime 해상도가 거친 파일시스템 대비, 최근 변경된 폴더는 다음에 다시 확인
+
+
+class MediaEntry(NamedTuple):
+    name: str
+    path: str
+    digest: str
+    mtime: float
+    size: int
+
+
+def converted_stem(src_filename: str) -> str:
+    base, _ = os.path.splitext(src_filename)
+    return f"{base}__converted"
+
+def converted_png_name(src_filename: str) -> str:
+    return converted_stem(src_filename) + ".png"
+
+
+class FolderIndex:
+    def __init__(self, folder: str):
+        self.folder = folder
+        self._lock = threading.Lock()
+        self._dir_mtime = None
+        self._settled = False
+        self._checked = 0.0
+        self._by_name = []
+        self._by_mtime = []
+        self._digests = set()
+        self._stems = {}        # stem -> name
+
+    # ---- 갱신 ----
+    def invalidate(self):
+        """업로드/변환/삭제 직후 호출: 다음 조회 때 반드시 다시 스캔."""
+        with self._lock:
+            self._dir_mtime = None
+            self._checked = 0.0
+
+    def refresh(self):
+        now = time.monotonic()
+        with self._lock:
+            if self._dir_mtime is not None and now - self._checked < CHECK_INTERVAL:
+                return
+            self._checked = now
+            try:
+                dir_mtime = os.stat(self.folder).st_mtime_ns
+            except FileNotFoundError:
+                dir_mtime = -1
+            if dir_mtime == self._dir_mtime and self._settled:
+                return
+            incr("catalog.rescan")
+            self._rescan()
+            # 방금 바뀐 폴더는 같은 mtime 안에 또 바뀔 수 있으므로, mtime이 그대로여도
+            # 다음 CHECK_INTERVAL 뒤 확인 때 한 번 더 스캔 (그 사이 조회는 스캔 결과 그대로)
+            self._dir_mtime = dir_mtime
+            self._settled = time.time() - dir_mtime / 1e9 > SETTLE_WINDOW
+
+    @timed("catalog.rescan")
+    def _rescan(self):
+        entries = {}
+        try:
+            with os.scandir(self.folder) as it:
+                for de in it:
+                    if not de.name.lower().endswith(IMAGE_EXTS) or not de.is_file():
+                        continue
+                    st = de.stat()
+                    entries[de.name] = MediaEntry(de.name, os.path.join(self.folder, de.name),
+                                                  digest_key(de.name), st.st_mtime, st.st_size)
+        except FileNotFoundError:
+            pass
+        self._by_name = sorted(entries.values(), key=lambda e: e.name)
+        self._by_mtime = sorted(entries.values(), key=lambda e: e.mtime, reverse=True)
+        self._digests = {e.digest for e in entries.values()}
+        self._stems = {os.path.splitext(e.name)[0]: e.name for e in entries.values()}
+
+    # ---- 조회 ----
+    def by_name(self):
+        self.refresh()
+        return self._by_name
+
+    def by_mtime(self):
+        """최신 파일 먼저."""
+        self.refresh()
+        return self._by_mtime
+
+    def has_digest(self, digest: str) -> bool:
+        self.refresh()
+        return digest in self._digests
+
+    def stems(self) -> dict:
+        """확장자 없는 파일명 -> 파일명"""
+        self.refresh()
+        return self._stems
+
+
+_INDEXES = OrderedDict()
+_INDEXES_LOCK = threading.Lock()
+
+def folder_index(folder: str) -> FolderIndex:
+    """프로세스 전역에서 공유되는 폴더 인덱스. 오래 안 쓴 것부터 버림(LRU)."""
+    key = os.path.abspath(folder)
+    with _INDEXES_LOCK:
+        if key in _INDEXES:
+            _INDEXES.move_to_end(key)
+        else:
+            _INDEXES[key] = FolderIndex(folder)
+            while len(_INDEXES) > MAX_INDEXES:
+                _INDEXES.popitem(last=False)
+        return _INDEXES[key]
+
+def is_converted(upload_name: str, converted: FolderIndex) -> bool:
+    """원본 파일명의 변환본이 (확장자와 무관하게) 변환본 폴더에 있는지."""
+    return converted_stem(upload_name) in converted.stems()
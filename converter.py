@@ -0,0 +1,416 @@
+import os
+import time
+import json
+import base64
+import random
+import shutil
+import hashlib
+import threading
+from io import BytesIO
+from functools import lru_cache
+
+from PIL import Image, ImageDraw
+
+import cartoon
+import optimizer
+from media import SizedLRU, square_canvas
+from metrics import incr, span, timed
+
+# -------------------- 이미지 변환 --------------------
+# 일본 TV 애니 감성 프롬프트
+_ANIME_PROMPT = (
+    "High-quality Japanese TV anime illustration. Keep the SAME pose and composition as the input photo. "
+    "Clean cel shading with 2–3 tones per color, hard shadows with clear shapes, flat high-saturation palette. "
+    "Bold, clean black lineart with slight variable line weight (0.5–2.5px). "
+    "Cute expressive eyes (species-appropriate), small/simple nose & mouth, subtle fur tufts and inner line details. "
+    "Anime highlights on eyes/fur, crisp edges. "
+    "Simple background without gradients: plain color, halftone dots, or speed lines. "
+    "No photo textures, no blur, no noise, no text, no watermark, not photorealistic."
+)
+IMAGE_MODEL = "gpt-image-1"
+IMAGE_SIZE = "1024x1024"
+
+# -------------------- OpenAI 클라이언트 --------------------
+class LazyOpenAIClient:
+    """openai import와 클라이언트 생성을 첫 `.images` 접근까지 미룸 (시작 시간 단축)."""
+
+    def __init__(self, api_key: str, organization: str = ""):
+        self.api_key = api_key
+        self.organization = organization or None
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self._client is not None
+
+    @property
+    def images(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    from openai import OpenAI  # pip install openai>=1.0.0
+                    self._client = OpenAI(api_key=self.api_key, organization=self.organization)
+        return self._client.images
+
+# -------------------- 전처리 (메모리) --------------------
+# 정사각 입력 PNG는 입력 digest별로 보관 → 재시도/폴백 때 디코드 생략
+_prepared = SizedLRU(max_bytes=int(os.getenv("PREPARED_CACHE_MB", "64")) * 1024 * 1024)
+
+@timed("convert.prepare")
+def _square_png_bytes(src_path: str, max_side: int = 1024) -> bytes:
+    """원본 비율 유지 + 흰 배경 정사각 캔버스에 합성한 PNG 바이트."""
+    buf = BytesIO()
+    square_canvas(src_path, max_side).save(buf, "PNG")
+    return buf.getvalue()
+
+def prepare_input(src_path: str, input_digest: str, max_side: int = 1024) -> bytes:
+    key = (input_digest, max_side)
+    data = _prepared.get(key)
+    incr("convert.prepare_cache_" + ("miss" if data is None else "hit"))
+    if data is None:
+        data = _square_png_bytes(src_path, max_side)
+        _prepared.put(key, data)
+    return data
+
+def _make_frame_mask_rgba(size: int = 1024, border: int = 24):
+    """images.edit 폴백용: 가장자리 보존(불투명), 내부 편집(투명)"""
+    m = Image.new("L", (size, size), 0)  # 0=편집
+    d = ImageDraw.Draw(m)
+    d.rectangle([0, 0, size-1, border-1], fill=255)                         # top
+    d.rectangle([0, size-border, size-1, size-1], fill=255)                 # bottom
+    d.rectangle([0, border, border-1, size-border-1], fill=255)             # left
+    d.rectangle([size-border, border, size-1, size-border-1], fill=255)     # right
+    return m.convert("RGBA")
+
+@lru_cache(maxsize=8)
+def frame_mask_png(size: int = 1024, border: int = 24) -> bytes:
+    """마스크는 항상 같으므로 (size, border)별로 한 번만 PNG 인코딩."""
+    buf = BytesIO()
+    _make_frame_mask_rgba(size, border).save(buf, "PNG")
+    return buf.getvalue()
+
+# -------------------- 변환 결과 캐시 (내용 주소) --------------------
+# 같은 사진 + 같은 프롬프트/모델/크기면 API를 다시 부르지 않음.
+# 캐시 파일은 추모관 변환본과 하드링크를 공유할 수 있으므로 mtime을 건드리지 않고,
+# 최근 사용 시각은 옆의 빈 `<key>.used` 파일에 기록. 복원은 복사(새 mtime)로 해서
+# 변환본 버전(?v=)/썸네일 갱신/카루셀 순서가 예전 변환 시각에 묶이지 않게 함.
+CACHE_FOLDER = "conversion_cache"
+CACHE_MAX_BYTES = int(os.getenv("CONVERT_CACHE_MAX_MB", "2048")) * 1024 * 1024
+
+_cache_lock = threading.Lock()
+
+def file_digest(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def cache_key(input_digest: str) -> str:
+    params = json.dumps([input_digest, IMAGE_MODEL, IMAGE_SIZE, _ANIME_PROMPT], ensure_ascii=False)
+    return hashlib.sha256(params.encode("utf-8")).hexdigest()
+
+USED_EXT = ".used"
+
+def _cache_path(key: str) -> str:
+    return os.path.join(CACHE_FOLDER, key[:2], key + ".png")
+
+def _touch_used(path: str):
+    """LRU: 최근 사용 시각 갱신 (공유 inode인 캐시 파일 대신 옆 파일에)."""
+    with open(os.path.splitext(path)[0] + USED_EXT, "wb"):
+        pass
+
+def _place(src: str, dst: str, link: bool):
+    """dst에 원자적으로 배치. link면 같은 파일시스템에서 하드링크(추가 용량 없음)."""
+    tmp = f"{dst}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        if not link:
+            raise OSError
+        os.link(src, tmp)
+    except OSError:
+        shutil.copyfile(src, tmp)
+    os.replace(tmp, dst)
+
+def restore_cached(key: str, out_path: str) -> bool:
+    path = _cache_path(key)
+    try:
+        _place(path, out_path, link=False)
+    except FileNotFoundError:
+        return False
+    _touch_used(path)
+    return True
+
+def store_cached(key: str, result_path: str):
+    path = _cache_path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    _place(result_path, path, link=True)
+    _touch_used(path)
+    evict_cache()
+
+def evict_cache(max_bytes: int = CACHE_MAX_BYTES):
+    """총 용량이 max_bytes를 넘으면 가장 오래 안 쓴 항목부터 삭제."""
+    if not os.path.isdir(CACHE_FOLDER):
+        return
+    with _cache_lock:
+        entries = []
+        total = 0
+        for shard in os.scandir(CACHE_FOLDER):
+            if not shard.is_dir():
+                continue
+            used = {}
+            pngs = []
+            for de in os.scandir(shard.path):
+                if de.name.endswith(USED_EXT):
+                    used[de.name[:-len(USED_EXT)]] = de
+                elif de.name.endswith(".png"):
+                    pngs.append(de)
+            for de in pngs:
+                st = de.stat()
+                sidecar = used.pop(de.name[:-len(".png")], None)
+                last_used = max(st.st_mtime, sidecar.stat().st_mtime) if sidecar else st.st_mtime
+                entries.append((last_used, st.st_size, de.path))
+                total += st.st_size
+            for de in used.values():   # 캐시 파일이 이미 지워진 사용 기록
+                _remove_quiet(de.path)
+        if total <= max_bytes:
+            return
+        entries.sort()
+        for _, size, path in entries:
+            _remove_quiet(path)
+            _remove_quiet(os.path.splitext(path)[0] + USED_EXT)
+            total -= size
+            if total <= max_bytes:
+                break
+
+def _remove_quiet(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+# -------------------- 호출 전략 (한 번 탐색 후 기억) --------------------
+# variations(+prompt) → variations → edit(+마스크) 순서로 시도하되,
+# 성공한 방식을 클라이언트/모델별로 STRATEGY_TTL 동안 기억해서 다음 사진부터 바로 사용.
+STRATEGIES = ("variations_prompt", "variations", "edit_mask")
+STRATEGY_TTL = 60 * 60   # 초
+
+RETRYABLE, UNSUPPORTED, ABORT, FATAL = "retryable", "unsupported", "abort", "fatal"
+
+_strategy_lock = threading.Lock()
+_strategy_cache = {}     # (클라이언트 키, 모델) -> (전략, 만료 시각)
+
+
+class ConversionAborted(RuntimeError):
+    """계정/권한 문제처럼 다른 사진도 모두 실패할 오류. 배치를 즉시 중단."""
+
+
+def _is_rate_limited(e: Exception) -> bool:
+    return getattr(e, "status_code", None) == 429 or type(e).__name__ == "RateLimitError"
+
+# 400/415/422 중 이 전략(모델/인자)을 쓸 수 없다는 응답만 다음 전략으로. 나머지 400은 사진 문제
+_UNSUPPORTED_CODES = ("unsupported_parameter", "unsupported_value", "unknown_parameter",
+                      "model_not_found", "invalid_model")
+_UNSUPPORTED_MESSAGES = ("unrecognized request argument", "unknown parameter", "does not support",
+                         "not supported with this model", "invalid model")
+
+def _is_unsupported_response(e: Exception) -> bool:
+    code = str(getattr(e, "code", None) or "").lower()
+    message = str(e).lower()
+    return code in _UNSUPPORTED_CODES or any(m in message for m in _UNSUPPORTED_MESSAGES)
+
+def classify_error(e: Exception) -> str:
+    """RETRYABLE: 잠시 후 같은 호출 재시도 / UNSUPPORTED: 다음 전략으로 /
+    ABORT: 배치 중단 / FATAL: 이 사진만 실패."""
+    status = getattr(e, "status_code", None)
+    if _is_rate_limited(e) or (status is not None and status >= 500):
+        return RETRYABLE
+    if type(e).__name__ in ("APITimeoutError", "APIConnectionError"):
+        return RETRYABLE
+    if status in (401, 403) or "must be verified" in str(e):
+        return ABORT
+    if status is None:
+        # SDK 버전에 따라 메서드/prompt 인자 자체가 없음 (HTTP 요청 전 AttributeError/TypeError)
+        return UNSUPPORTED if isinstance(e, (AttributeError, TypeError)) else FATAL
+    if status == 404 or (status in (400, 415, 422) and _is_unsupported_response(e)):
+        return UNSUPPORTED
+    return FATAL
+
+def _client_key(client) -> str:
+    ident = f"{getattr(client, 'api_key', '')}|{getattr(client, 'organization', '')}"
+    if ident == "|":
+        ident = str(id(client))
+    return hashlib.sha256(ident.encode("utf-8")).hexdigest()[:16]
+
+def _strategy_order(client):
+    key = (_client_key(client), IMAGE_MODEL)
+    with _strategy_lock:
+        known = _strategy_cache.get(key)
+        if known and known[1] > time.monotonic():
+            return [known[0]] + [s for s in STRATEGIES if s != known[0]]
+        _strategy_cache.pop(key, None)
+    return list(STRATEGIES)
+
+def _remember_strategy(client, strategy: str):
+    with _strategy_lock:
+        _strategy_cache[(_client_key(client), IMAGE_MODEL)] = (strategy, time.monotonic() + STRATEGY_TTL)
+
+def _forget_strategy(client, strategy: str):
+    key = (_client_key(client), IMAGE_MODEL)
+    with _strategy_lock:
+        if _strategy_cache.get(key, (None,))[0] == strategy:
+            del _strategy_cache[key]
+
+def _call(client, strategy: str, image):
+    if strategy == "variations_prompt":
+        return client.images.variations(model=IMAGE_MODEL, image=image, n=1, size=IMAGE_SIZE,
+                                        prompt=_ANIME_PROMPT)
+    if strategy == "variations":
+        return client.images.variations(model=IMAGE_MODEL, image=image, n=1, size=IMAGE_SIZE)
+    return client.images.edit(
+        model=IMAGE_MODEL,
+        image=image,
+        mask=("mask.png", frame_mask_png(size=1024, border=24), "image/png"),
+        size=IMAGE_SIZE,
+        prompt=_ANIME_PROMPT,
+    )
+
+def call_image_api(client, image):
+    """기억된 전략부터 시도. 미지원 오류만 다음 전략으로 넘어가고 나머지는 그대로 올림."""
+    last_error = None
+    for strategy in _strategy_order(client):
+        try:
+            with span(f"api.{strategy}"):
+                resp = _call(client, strategy, image)
+        except Exception as e:
+            kind = classify_error(e)
+            incr(f"api.error.{kind}")
+            if kind == ABORT:
+                raise ConversionAborted(str(e)) from e
+            if kind != UNSUPPORTED:
+                raise
+            _forget_strategy(client, strategy)
+            last_error = e
+            continue
+        _remember_strategy(client, strategy)
+        return resp
+    raise last_error
+
+_B64_CHUNK = 4 * 256 * 1024   # 4의 배수여야 조각 경계에서 디코드가 맞음
+
+def _write_b64(b64: str, out):
+    for i in range(0, len(b64), _B64_CHUNK):
+        out.write(base64.b64decode(b64[i:i + _B64_CHUNK]))
+
+def ai_redraw_comic_style(img_path: str, out_path: str, client):
+    """
+    variations 우선 → edit 폴백. 결과는 PNG 저장.
+    같은 입력/설정의 변환 결과가 캐시에 있으면 API 호출 없이 바로 복원.
+    """
+    if not out_path.lower().endswith(".png"):
+        out_path = os.path.splitext(out_path)[0] + ".png"
+
+    input_digest = file_digest(img_path)
+    key = cache_key(input_digest)
+    if restore_cached(key, out_path):
+        incr("convert.cache_hit")
+        optimizer.schedule(out_path, img_path)
+        return
+
+    if client is None:
+        raise RuntimeError("OpenAI 클라이언트가 준비되지 않았습니다. (OPENAI_API_KEY/조직 인증 확인)")
+
+    # 임시 파일 없이 메모리 바이트를 (파일명, 바이트, MIME) 형태로 전달
+    image = ("image.png", prepare_input(img_path, input_digest, max_side=1024), "image/png")
+
+    resp = call_image_api(client, image)
+
+    # 저장: 응답 문자열을 조각씩 디코드해 바로 기록 (디코드된 전체 사본을 메모리에 두지 않음)
+    # 임시 파일 → rename: 반쯤 쓰인 결과가 보이지 않고, 폴더 mtime도 갱신되어 카탈로그가 감지
+    tmp_out = f"{out_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_out, "wb") as out:
+        _write_b64(resp.data[0].b64_json, out)
+    os.replace(tmp_out, out_path)
+    store_cached(key, out_path)
+    _prepared.pop((input_digest, 1024))
+    # 무손실 재압축 + 표시용 변형은 백그라운드에서, 끝나면 캐시도 작아진 파일로 교체
+    optimizer.schedule(out_path, img_path, after=lambda path: store_cached(key, path))
+
+# -------------------- 레이트 리밋 재시도 --------------------
+RATE_LIMIT_RETRIES = 4
+BACKOFF_BASE = 2.0     # 초
+BACKOFF_MAX = 60.0
+
+def _retry_after(e: Exception):
+    """429 응답의 Retry-After 헤더(초). 없으면 None."""
+    try:
+        return float(e.response.headers.get("retry-after"))
+    except Exception:
+        return None
+
+class Cooldown:
+    """한 워커가 429를 받으면 모든 워커가 같은 시각까지 대기."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._until = 0.0
+
+    def wait(self):
+        while True:
+            with self._lock:
+                delay = self._until - time.monotonic()
+            if delay <= 0:
+                return
+            time.sleep(delay)
+
+    def push(self, seconds: float):
+        with self._lock:
+            self._until = max(self._until, time.monotonic() + seconds)
+
+def convert_with_backoff(client, in_path: str, out_path: str, cooldown: Cooldown):
+    attempt = 0
+    while True:
+        cooldown.wait()
+        try:
+            return ai_redraw_comic_style(in_path, out_path, client)
+        except Exception as e:
+            if classify_error(e) != RETRYABLE or attempt >= RATE_LIMIT_RETRIES:
+                raise
+            delay = _retry_after(e) or min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt))
+            cooldown.push(delay * random.uniform(1.0, 1.25))
+            attempt += 1
+
+# -------------------- 변환 백엔드 --------------------
+# api: 이미지 API (기본) / local: cartoon.py 로컬 엔진만 (오프라인, 무료) /
+# auto: 로컬 변환본을 먼저 저장해 바로 보여 주고 API 결과로 교체. 키가 없으면 로컬만.
+#       API가 끝내 실패(레이트 리밋 등)하면 로컬 변환본을 남기고 작업은 실패로 기록 → "다시 시도"로 교체.
+BACKENDS = ("api", "local", "auto")
+CONVERT_BACKEND = os.getenv("CONVERT_BACKEND", "api").strip().lower()
+
+def _has_cached(in_path: str) -> bool:
+    return os.path.exists(_cache_path(cache_key(file_digest(in_path))))
+
+def convert_image(client, in_path: str, out_path: str, cooldown: Cooldown, backend: str = CONVERT_BACKEND):
+    """백엔드 설정에 따라 한 장 변환. 변환 워커(jobs.ConversionWorker)의 작업 단위."""
+    if backend not in BACKENDS:
+        raise ValueError(f"알 수 없는 CONVERT_BACKEND: {backend!r} ({'/'.join(BACKENDS)})")
+    if backend == "api":
+        return convert_with_backoff(client, in_path, out_path, cooldown)
+    if backend == "local" or client is None:
+        cartoon.convert_local(in_path, out_path)
+        optimizer.schedule(out_path, in_path)
+        return
+    preview = False
+    if not os.path.exists(out_path) and not _has_cached(in_path):
+        # 미리보기는 곧 API 결과로 바뀌므로 최적화 예약 안 함 (교체와 경합 방지)
+        cartoon.convert_local(in_path, out_path)
+        incr("convert.local_preview")
+        preview = True
+    try:
+        convert_with_backoff(client, in_path, out_path, cooldown)
+    except Exception as e:
+        if not preview:
+            raise
+        # 배치 중단(ConversionAborted) 대신 사진별 실패로: 남은 사진도 로컬 변환본은 만들어짐
+        incr("convert.local_fallback")
+        raise RuntimeError(f"로컬 변환본으로 표시 중 (API 실패: {e})") from e
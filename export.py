@@ -0,0 +1,294 @@
+"""
+추모관 전체 내보내기 (ZIP 스트리밍).
+
+    python export.py <memorial_id> <out.zip>
+
+원본/변환본/부고(memorial_info.json)/방명록을 하나의 ZIP으로 만든다.
+- 이미 압축된 JPEG/PNG를 다시 압축하지 않도록 모든 항목을 STORED로 저장.
+- 항목 크기를 stat만으로 알 수 있어 전체 길이와 각 항목 위치를 미리 계산 →
+  Content-Length/Range 응답 가능, 중간부터 이어받기(resume) 가능.
+- 같은 내용이면 바이트 단위로 같은 결과(결정적) → ETag로 이어받기 검증.
+- 파일은 CHUNK_SIZE씩 읽어 흘려보내므로 메모리 사용량은 아카이브 크기와 무관.
+"""
+import os
+import sys
+import json
+import time
+import zlib
+import struct
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import NamedTuple
+
+from catalog import IMAGE_EXTS
+from media import digest_key
+from guestbook import iter_messages
+from tenancy import MemorialPaths, normalize_memorial_id, memorial_paths
+from metrics import incr
+
+EXPORT_VERSION = 1
+CHUNK_SIZE = 1 << 20
+_GENERATED_DT = (1980, 1, 1, 0, 0, 0)   # 생성 항목의 고정 시각 (결정적 출력)
+
+_UTF8 = 0x0800          # 파일명 UTF-8
+_DESCRIPTOR = 0x0008    # CRC/크기를 데이터 뒤 descriptor에 기록
+_U32 = 0xFFFFFFFF
+
+
+class Entry(NamedTuple):
+    name: str            # ZIP 안 경로
+    size: int
+    dos_time: tuple      # (date, time)
+    path: str = None     # 파일 항목
+    data: bytes = None   # 생성 항목 (manifest/방명록 등)
+    mtime_ns: int = 0
+
+
+def _dos_time(dt) -> tuple:
+    y, mo, d, h, mi, s = dt[:6]
+    y = max(y, 1980)
+    return ((y - 1980) << 9) | (mo << 5) | d, (h << 11) | (mi << 5) | (s // 2)
+
+
+# -------------------- CRC 캐시 --------------------
+# 이어받기 요청에서 앞부분을 건너뛴 항목의 CRC만 파일을 읽어 계산하고 기억.
+_CRC_CACHE_MAX = 100_000
+_crc_cache = OrderedDict()   # (path, size, mtime_ns) -> crc
+_crc_lock = threading.Lock()
+
+def _crc_key(entry: Entry):
+    return (os.path.abspath(entry.path), entry.size, entry.mtime_ns)
+
+def _remember_crc(entry: Entry, crc: int):
+    if entry.path is None:
+        return
+    with _crc_lock:
+        _crc_cache[_crc_key(entry)] = crc
+        while len(_crc_cache) > _CRC_CACHE_MAX:
+            _crc_cache.popitem(last=False)
+
+def _entry_crc(entry: Entry) -> int:
+    if entry.data is not None:
+        return zlib.crc32(entry.data)
+    with _crc_lock:
+        crc = _crc_cache.get(_crc_key(entry))
+    if crc is None:
+        crc = 0
+        for chunk in _read_file(entry, 0, entry.size):
+            crc = zlib.crc32(chunk, crc)
+        _remember_crc(entry, crc)
+    return crc
+
+def _read_file(entry: Entry, start: int, length: int):
+    with open(entry.path, "rb") as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                raise RuntimeError(f"내보내는 중 파일이 바뀌었습니다: {entry.path}")
+            length -= len(chunk)
+            yield chunk
+
+
+# -------------------- 항목 수집 --------------------
+def _file_entries(folder: str, prefix: str):
+    try:
+        names = sorted(n for n in os.listdir(folder)
+                       if n.lower().endswith(IMAGE_EXTS) and not n.startswith("."))
+    except FileNotFoundError:
+        return []
+    out = []
+    for n in names:
+        path = os.path.join(folder, n)
+        st = os.stat(path)
+        out.append(Entry(f"{prefix}/{n}", st.st_size, _dos_time(time.gmtime(st.st_mtime)),
+                         path=path, mtime_ns=st.st_mtime_ns))
+    return out
+
+def _data_entry(name: str, data: bytes) -> Entry:
+    return Entry(name, len(data), _dos_time(_GENERATED_DT), data=data)
+
+def _guestbook_text(db: str) -> bytes:
+    parts = []
+    for _, created, name, message in iter_messages(db=db):
+        parts.append(f"[{created}] {name}\n{message}\n\n")
+    return "".join(parts).encode("utf-8")
+
+def collect_entries(paths: MemorialPaths):
+    files = (_file_entries(paths.upload_folder, "originals")
+             + _file_entries(paths.converted_folder, "converted"))
+    generated = []
+    if os.path.exists(paths.info_path):
+        with open(paths.info_path, "rb") as f:
+            generated.append(_data_entry("obituary.json", f.read()))
+    guestbook = _guestbook_text(paths.guestbook_db)
+    if guestbook:
+        generated.append(_data_entry("guestbook.txt", guestbook))
+
+    manifest = {
+        "format": "memorial-export",
+        "version": EXPORT_VERSION,
+        "memorial": paths.memorial_id,
+        "files": [{"name": e.name, "size": e.size, "digest": digest_key(e.path)} for e in files],
+        "generated": [{"name": e.name, "size": e.size, "sha256": hashlib.sha256(e.data).hexdigest()}
+                      for e in generated],
+    }
+    manifest_bytes = json.dumps(manifest, ensure_ascii=False, indent=2, sort_keys=True).encode("utf-8")
+    # manifest를 맨 앞에 두어 스트리밍 해제 도구도 먼저 목록을 볼 수 있게 함
+    return [_data_entry("manifest.json", manifest_bytes)] + generated + files
+
+
+# -------------------- ZIP 레이아웃 --------------------
+class ZipExport:
+    """항목 목록으로 ZIP 바이트 배치를 계산하고 임의 구간을 스트리밍."""
+
+    def __init__(self, entries, filename: str = "memorial.zip"):
+        self.entries = entries
+        self.filename = filename
+        self._names = [e.name.encode("utf-8") for e in entries]
+        self.zip64 = False
+        self._layout()
+        if self.size >= _U32 or len(entries) >= 0xFFFF:
+            self.zip64 = True
+            self._layout()
+        h = hashlib.sha256(f"v{EXPORT_VERSION}|{self.size}".encode())
+        for e in entries:
+            h.update(f"{e.name}|{e.size}|{e.mtime_ns}|".encode("utf-8"))
+            if e.data is not None:
+                h.update(e.data)
+        self.etag = f'"{h.hexdigest()[:32]}"'
+
+    def _layout(self):
+        local_extra = 20 if self.zip64 else 0
+        desc = 24 if self.zip64 else 16
+        self.offsets = []
+        pos = 0
+        for e, name in zip(self.entries, self._names):
+            self.offsets.append(pos)
+            pos += 30 + len(name) + local_extra + e.size + desc
+        self.cd_offset = pos
+        self.cd_size = sum(46 + len(n) + (28 if self.zip64 else 0) for n in self._names)
+        self.size = pos + self.cd_size + (56 + 20 if self.zip64 else 0) + 22
+
+    # ---- 레코드 ----
+    def _flags(self):
+        return _UTF8 | _DESCRIPTOR
+
+    def _version(self):
+        return 45 if self.zip64 else 20
+
+    def _local_header(self, i: int) -> bytes:
+        e, name = self.entries[i], self._names[i]
+        date, tm = e.dos_time
+        if self.zip64:
+            extra = struct.pack("<HHQQ", 1, 16, 0, 0)
+            sizes = (_U32, _U32)
+        else:
+            extra, sizes = b"", (0, 0)
+        return struct.pack("<IHHHHHIIIHH", 0x04034b50, self._version(), self._flags(), 0,
+                           tm, date, 0, *sizes, len(name), len(extra)) + name + extra
+
+    def _descriptor(self, i: int, crc: int) -> bytes:
+        size = self.entries[i].size
+        if self.zip64:
+            return struct.pack("<IIQQ", 0x08074b50, crc, size, size)
+        return struct.pack("<IIII", 0x08074b50, crc, size, size)
+
+    def _central_header(self, i: int, crc: int) -> bytes:
+        e, name = self.entries[i], self._names[i]
+        date, tm = e.dos_time
+        if self.zip64:
+            extra = struct.pack("<HHQQQ", 1, 24, e.size, e.size, self.offsets[i])
+            size32, off32 = _U32, _U32
+        else:
+            extra, size32, off32 = b"", e.size, self.offsets[i]
+        return struct.pack("<IHHHHHHIIIHHHHHII", 0x02014b50, (3 << 8) | self._version(),
+                           self._version(), self._flags(), 0, tm, date, crc, size32, size32,
+                           len(name), len(extra), 0, 0, 0, 0o100644 << 16, off32) + name + extra
+
+    def _end_records(self) -> bytes:
+        n = len(self.entries)
+        out = b""
+        if self.zip64:
+            z64_offset = self.cd_offset + self.cd_size
+            out += struct.pack("<IQHHIIQQQQ", 0x06064b50, 44, 45, 45, 0, 0, n, n,
+                               self.cd_size, self.cd_offset)
+            out += struct.pack("<IIQI", 0x07064b50, 0, z64_offset, 1)
+            return out + struct.pack("<IHHHHIIH", 0x06054b50, 0, 0, 0xFFFF, 0xFFFF, _U32, _U32, 0)
+        return out + struct.pack("<IHHHHIIH", 0x06054b50, 0, 0, n, n, self.cd_size, self.cd_offset, 0)
+
+    # ---- 스트리밍 ----
+    def _parts(self, crcs: dict):
+        """(길이, 생성기(skip, take)) 순서열. 생성기는 필요할 때만 호출됨."""
+        def const(data_fn):
+            def gen(skip, take):
+                yield data_fn()[skip:skip + take]
+            return gen
+
+        for i, e in enumerate(self.entries):
+            yield len(self._local_header(i)), const(lambda i=i: self._local_header(i))
+            yield e.size, self._data_gen(i, crcs)
+            yield (24 if self.zip64 else 16), const(lambda i=i: self._descriptor(i, self._crc(i, crcs)))
+        yield self.cd_size, const(lambda: b"".join(self._central_header(i, self._crc(i, crcs))
+                                                   for i in range(len(self.entries))))
+        yield self.size - self.cd_offset - self.cd_size, const(self._end_records)
+
+    def _crc(self, i: int, crcs: dict) -> int:
+        if i not in crcs:
+            crcs[i] = _entry_crc(self.entries[i])
+        return crcs[i]
+
+    def _data_gen(self, i: int, crcs: dict):
+        e = self.entries[i]
+
+        def gen(skip, take):
+            if e.data is not None:
+                yield e.data[skip:skip + take]
+                return
+            full = skip == 0 and take == e.size
+            crc = 0
+            for chunk in _read_file(e, skip, take):
+                if full:
+                    crc = zlib.crc32(chunk, crc)
+                yield chunk
+            if full:
+                crcs[i] = crc
+                _remember_crc(e, crc)
+        return gen
+
+    def iter_bytes(self, start: int = 0, end: int = None):
+        """[start, end] (포함) 구간의 바이트를 순서대로 생성."""
+        end = self.size - 1 if end is None else min(end, self.size - 1)
+        crcs = {}
+        pos = 0
+        for length, gen in self._parts(crcs):
+            part_end = pos + length - 1
+            if length and part_end >= start and pos <= end:
+                skip = max(start - pos, 0)
+                take = min(end, part_end) - (pos + skip) + 1
+                yield from gen(skip, take)
+            pos += length
+            if pos > end:
+                break
+        incr("export.bytes", end - start + 1)
+
+    def write_to(self, fileobj):
+        for chunk in self.iter_bytes():
+            fileobj.write(chunk)
+
+
+def build_export(memorial_id: str) -> ZipExport:
+    paths = memorial_paths(normalize_memorial_id(memorial_id))
+    return ZipExport(collect_entries(paths), filename=f"memorial-{paths.memorial_id}.zip")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        sys.exit(__doc__)
+    export = build_export(sys.argv[1])
+    tmp = sys.argv[2] + ".part"
+    with open(tmp, "wb") as f:
+        export.write_to(f)
+    os.replace(tmp, sys.argv[2])
+    print(f"{sys.argv[2]}: {len(export.entries)} entries, {export.size} bytes")
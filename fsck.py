@@ -0,0 +1,423 @@
+"""
+저장 공간 점검(fsck)과 정리(GC).
+
+    python fsck.py                     # 모든 추모관 + 공유 폴더 점검, 보고만 (dry-run)
+    python fsck.py --memorial ID ...   # 지정한 추모관만 (공유 폴더/썸네일은 제외)
+    python fsck.py --budget 5          # 5초까지만 점검 (끝나지 않으면 '미완료'로 표시)
+    python fsck.py --delete            # 보고 후 확인을 받고 삭제 (--yes: 확인 생략)
+
+찾는 것 (종류):
+- temp       중단된 쓰기가 남긴 임시 파일 (*.tmp, *.part, *.norm). TEMP_GRACE보다 오래된 것만.
+- truncated  끝까지 쓰이지 않은 변환본/썸네일/변환 캐시 (PNG IEND, JPEG EOI, WebP RIFF 길이로 확인).
+- converted  원본이 없는 변환본 (`{digest}_{name}` ↔ `{digest}_{name}__converted.png` 스템 기준).
+- thumbnail  어느 추모관에도 원본/변환본이 없는 키의 썸네일 (전체 점검 때만).
+- asset      히어로 원본이 바뀌어 더 이상 쓰지 않는 정적 자산 변형.
+- job        원본이 지워진 변환 작업 기록 (용량 0, DB 정리).
+- damaged    끝이 잘린 원본. 다시 만들 수 없으므로 보고만 하고 지우지 않음.
+
+점검은 항상 보고서만 만들고, 삭제는 apply()가 항목마다 다시 확인한 뒤 수행
+(점검 뒤 크기/시각이 바뀐 파일, 원본이 다시 생긴 변환본은 건너뜀).
+점검 시작 이후에 생긴 파일은 판정하지 않으므로 진행 중인 업로드/변환과 겹쳐도 안전.
+"""
+import os
+import sys
+import time
+import argparse
+import threading
+from typing import NamedTuple
+
+from media import THUMB_FOLDER, THUMB_KINDS, digest_key, remove_thumbnails, thumbnail_key
+from catalog import IMAGE_EXTS, folder_index
+from tenancy import DEFAULT_MEMORIAL, normalize_memorial_id, memorial_paths, list_memorials
+from converter import CACHE_FOLDER, USED_EXT
+from assets import ASSET_FOLDER, stale_filter
+from jobs import RUNNING, list_jobs, forget
+from storage import change_feed, memorial_lock
+from metrics import incr, timed
+
+# -------------------- 설정 --------------------
+TEMP_SUFFIXES = (".tmp", ".part", ".norm")
+TEMP_GRACE = float(os.getenv("FSCK_TEMP_GRACE", str(60 * 60)))    # 초: 이보다 새 임시 파일은 쓰는 중일 수 있음
+FSCK_INTERVAL = float(os.getenv("FSCK_INTERVAL", str(6 * 60 * 60)))  # 초: 앱 백그라운드 점검 주기 (0이면 끔)
+START_DELAY = 60.0     # 초: 프로세스 시작 직후 첫 화면 렌더링과 겹치지 않게 첫 점검을 미룸
+
+# 백그라운드 점검은 조각씩: SLICE_SECONDS 동안(추모관 단위) 점검하고 SLICE_REST 쉼,
+# 한 폴더 안에서도 SLICE_FILES개마다 SLICE_PAUSE 쉬어 렌더링 스레드에 디스크/GIL을 양보
+SLICE_SECONDS = 0.25
+SLICE_REST = 1.0
+SLICE_FILES = 256
+SLICE_PAUSE = 0.01
+
+TEMP, TRUNCATED, ORPHAN_CONVERTED, ORPHAN_THUMB, STALE_ASSET, ORPHAN_JOB, DAMAGED = (
+    "temp", "truncated", "converted", "thumbnail", "asset", "job", "damaged")
+REMOVABLE = (TEMP, TRUNCATED, ORPHAN_CONVERTED, ORPHAN_THUMB, STALE_ASSET, ORPHAN_JOB)
+
+_CONVERTED_SUFFIX = "__converted"
+_PNG_END = b"\x00\x00\x00\x00IEND\xaeB`\x82"
+_REGISTRY_PAGE = 500
+
+
+class Finding(NamedTuple):
+    kind: str
+    path: str            # job은 지워진 원본 경로
+    size: int
+    mtime: float
+    memorial: str = ""
+    key: str = ""        # 정리할 때 함께 지울 변환 작업의 digest
+
+
+class Report(NamedTuple):
+    findings: list
+    scanned: int         # 살펴본 파일 수
+    seconds: float       # 점검에 쓴 시간 (쉰 시간 제외)
+    complete: bool       # 대상 전체를 끝까지 봤는지
+
+    def reclaimable(self) -> int:
+        return sum(f.size for f in self.findings if f.kind in REMOVABLE)
+
+    def summary(self) -> dict:
+        """종류 -> (개수, 바이트)"""
+        out = {}
+        for f in self.findings:
+            n, b = out.get(f.kind, (0, 0))
+            out[f.kind] = (n + 1, b + f.size)
+        return out
+
+
+def is_truncated(path: str, size: int) -> bool:
+    """파일 끝 표식만 읽어 중간에 끊긴 파일인지 판단 (디코드 없이 수십 바이트)."""
+    if size == 0:
+        return True
+    ext = os.path.splitext(path)[1].lower()
+    with open(path, "rb") as f:
+        head = f.read(12)
+        if ext == ".png":
+            f.seek(max(0, size - len(_PNG_END)))
+            return f.read() != _PNG_END
+        if ext in (".jpg", ".jpeg"):
+            # EOI 뒤에 꼬리 데이터를 붙이는 카메라가 있어 마지막 1KB 안에서 찾음
+            f.seek(max(0, size - 1024))
+            return b"\xff\xd9" not in f.read()
+        if ext == ".webp":
+            return head[:4] != b"RIFF" or int.from_bytes(head[4:8], "little") + 8 > size
+    return False
+
+def _is_temp(name: str) -> bool:
+    return name.endswith(TEMP_SUFFIXES)
+
+def _source_stem(converted_name: str):
+    stem = os.path.splitext(converted_name)[0]
+    return stem[:-len(_CONVERTED_SUFFIX)] if stem.endswith(_CONVERTED_SUFFIX) else None
+
+
+# -------------------- 점검 --------------------
+class Checker:
+    """
+    점검 한 바퀴의 진행 상태. run(time_budget)을 여러 번 불러 추모관 단위로 이어서 진행.
+    memorials를 주지 않으면 공유 목록 전체 + 공유 폴더(썸네일/변환 캐시/정적 자산)까지.
+    """
+
+    def __init__(self, memorials=None, pause: float = 0.0):
+        self.shared = memorials is None
+        self.ids = list(memorials) if memorials is not None else None
+        self.pause = pause
+        self.started = time.time()
+        self.offset = 0
+        self.live = set()      # 살아 있는 digest 키 (썸네일 판정용)
+        self.findings = []
+        self.scanned = 0
+        self.seconds = 0.0
+        self.done = False
+
+    def _memorial_ids(self):
+        ids, offset = [DEFAULT_MEMORIAL], 0
+        while True:
+            page = list_memorials(limit=_REGISTRY_PAGE, offset=offset)
+            ids.extend(mid for mid, _ in page if mid != DEFAULT_MEMORIAL)
+            if len(page) < _REGISTRY_PAGE:
+                return ids
+            offset += _REGISTRY_PAGE
+
+    @timed("fsck.slice")
+    def run(self, time_budget: float = None) -> Report:
+        """time_budget(초)이 지나면 다음 추모관으로 넘어가기 전에 멈춤. 끝나면 self.done."""
+        t0 = time.perf_counter()
+        if self.ids is None:
+            self.ids = self._memorial_ids()
+        while not self.done:
+            if time_budget is not None and time.perf_counter() - t0 > time_budget:
+                break
+            if self.offset < len(self.ids):
+                self._check_memorial(self.ids[self.offset])
+                self.offset += 1
+            else:
+                if self.shared:
+                    self._check_shared()
+                self.done = True
+        self.seconds += time.perf_counter() - t0
+        return self.report()
+
+    def report(self) -> Report:
+        return Report(list(self.findings), self.scanned, self.seconds, self.done)
+
+    # ---- 공통 ----
+    def _files(self, folder: str):
+        """folder의 일반 파일 (DirEntry, stat). 없는 폴더는 빈 목록."""
+        try:
+            with os.scandir(folder) as it:
+                for de in it:
+                    self.scanned += 1
+                    if self.pause and self.scanned % SLICE_FILES == 0:
+                        time.sleep(self.pause)
+                    try:
+                        if not de.is_file(follow_symlinks=False):
+                            continue
+                        st = de.stat()
+                    except FileNotFoundError:
+                        continue
+                    yield de, st
+        except FileNotFoundError:
+            return
+
+    def _add(self, kind: str, path: str, st, memorial: str = "", key: str = ""):
+        self.findings.append(Finding(kind, path, st.st_size, st.st_mtime, memorial, key))
+        incr(f"fsck.found.{kind}")
+
+    def _temp(self, de, st) -> bool:
+        """임시 파일이면 True (오래된 것은 기록)."""
+        if not _is_temp(de.name):
+            return False
+        if self.started - st.st_mtime > TEMP_GRACE:
+            self._add(TEMP, de.path, st)
+        return True
+
+    def _settled(self, st) -> bool:
+        # 점검 시작 뒤에 바뀐 파일은 진행 중인 작업의 것일 수 있으므로 판정하지 않음
+        return st.st_mtime < self.started
+
+    # ---- 추모관 ----
+    def _check_memorial(self, memorial_id: str):
+        paths = memorial_paths(memorial_id)
+        for de, st in self._files(paths.root):
+            self._temp(de, st)   # phash 색인 등 추모관 루트의 임시 파일
+
+        uploads = {}   # 스템 -> 파일명
+        for de, st in self._files(paths.upload_folder):
+            if self._temp(de, st) or not de.name.lower().endswith(IMAGE_EXTS):
+                continue
+            uploads[os.path.splitext(de.name)[0]] = de.name
+            self.live.add(thumbnail_key(de.path))
+            if self._settled(st) and is_truncated(de.path, st.st_size):
+                self._add(DAMAGED, de.path, st, memorial_id)
+
+        for de, st in self._files(paths.converted_folder):
+            if self._temp(de, st) or not de.name.lower().endswith(IMAGE_EXTS):
+                continue
+            source = _source_stem(de.name)
+            if not self._settled(st):
+                self.live.add(thumbnail_key(de.path))
+            elif source is not None and source not in uploads:
+                self._add(ORPHAN_CONVERTED, de.path, st, memorial_id)
+            elif is_truncated(de.path, st.st_size):
+                # 지우고 작업 기록도 지워서 다시 변환할 수 있게
+                key = digest_key(uploads[source]) if source is not None else ""
+                self._add(TRUNCATED, de.path, st, memorial_id, key)
+            else:
+                self.live.add(thumbnail_key(de.path))
+
+        for digest, src, _, state in list_jobs(memorial_id):
+            if state != RUNNING and not os.path.exists(src):
+                self.findings.append(Finding(ORPHAN_JOB, src, 0, 0.0, memorial_id, digest))
+                incr(f"fsck.found.{ORPHAN_JOB}")
+
+    # ---- 공유 폴더 ----
+    def _check_shared(self):
+        for de, st in self._files(THUMB_FOLDER):
+            if self._temp(de, st) or not self._settled(st):
+                continue
+            # `{digest 키}.{kind}{확장자}` (예전 파일명 키에는 점이 있을 수 있어 뒤에서부터 나눔)
+            key, _, kind = os.path.splitext(de.name)[0].rpartition(".")
+            if kind not in THUMB_KINDS:
+                continue
+            if key not in self.live:
+                self._add(ORPHAN_THUMB, de.path, st)
+            elif is_truncated(de.path, st.st_size):
+                self._add(TRUNCATED, de.path, st)   # 다음 조회 때 다시 생성됨
+
+        for shard in self._subdirs(CACHE_FOLDER):
+            for de, st in self._files(shard):
+                if de.name.endswith(USED_EXT):
+                    continue   # 최근 사용 기록 (빈 파일)
+                if not self._temp(de, st) and self._settled(st) and is_truncated(de.path, st.st_size):
+                    self._add(TRUNCATED, de.path, st)
+
+        try:
+            stale = stale_filter()
+        except OSError:
+            stale = None   # 히어로 원본이 없으면 판정하지 않음
+        for de, st in self._files(ASSET_FOLDER):
+            if not self._temp(de, st) and stale is not None and stale(de.name):
+                self._add(STALE_ASSET, de.path, st)
+
+    def _subdirs(self, folder: str):
+        """folder 바로 아래 하위 폴더 경로 (변환 캐시 샤드)."""
+        try:
+            with os.scandir(folder) as it:
+                return [de.path for de in it if de.is_dir(follow_symlinks=False)]
+        except FileNotFoundError:
+            return []
+
+
+def check(memorials=None, time_budget: float = None) -> Report:
+    """한 번에 점검 (CLI/벤치용). 백그라운드에서는 Janitor가 조각씩 진행."""
+    return Checker(memorials).run(time_budget)
+
+
+# -------------------- 정리 --------------------
+def _source_exists(f: Finding) -> bool:
+    uploads = folder_index(memorial_paths(f.memorial).upload_folder)
+    uploads.invalidate()
+    return _source_stem(os.path.basename(f.path)) in uploads.stems()
+
+def _remove(f: Finding) -> bool:
+    try:
+        st = os.stat(f.path)
+    except FileNotFoundError:
+        return False
+    if st.st_size != f.size or st.st_mtime != f.mtime:
+        return False
+    if f.kind == ORPHAN_CONVERTED and _source_exists(f):
+        return False   # 같은 사진을 다시 올림: 변환본을 다시 쓸 수 있음
+    try:
+        os.remove(f.path)
+    except FileNotFoundError:
+        return False
+    if f.memorial:
+        # 변환본: 썸네일도 함께, 잘린 변환본은 작업 기록을 지워 다시 변환 가능하게
+        remove_thumbnails(f.path)
+        if f.key:
+            forget(f.memorial, f.key)
+        folder_index(os.path.dirname(f.path)).invalidate()
+    return True
+
+@timed("fsck.apply")
+def apply(report: Report, kinds=REMOVABLE):
+    """보고서 항목 중 kinds를 삭제. 점검 뒤에 바뀐 항목은 건너뜀. (지운 수, 확보한 바이트) 반환."""
+    removed = freed = 0
+    touched = set()   # 변환본을 지운 추모관 → 다른 복제본에 알림
+    for f in report.findings:
+        if f.kind not in kinds:
+            continue
+        if f.kind == ORPHAN_JOB:
+            if not os.path.exists(f.path):
+                forget(f.memorial, f.key)
+                removed += 1
+            continue
+        if f.memorial:
+            # 사진 삭제/변환본 배치와 같은 잠금: 확인과 삭제 사이에 원본이 다시 생기지 않게
+            with memorial_lock(memorial_paths(f.memorial).root):
+                ok = _remove(f)
+            if ok:
+                touched.add(f.memorial)
+        else:
+            ok = _remove(f)
+        if ok:
+            removed += 1
+            freed += f.size
+            incr(f"fsck.removed.{f.kind}")
+    for memorial in touched:
+        change_feed().bump(memorial, "converted")
+    incr("fsck.bytes_freed", freed)
+    return removed, freed
+
+
+# -------------------- 앱 백그라운드 점검 --------------------
+class Janitor(threading.Thread):
+    """
+    앱 프로세스에서 주기적으로 천천히 점검하는 데몬 스레드 (st.cache_resource로 프로세스당 하나).
+    auto_delete가 아니면 보고서만 남기고, 삭제는 화면에서 확인(request_cleanup)을 받은 뒤.
+    """
+
+    def __init__(self, interval: float = FSCK_INTERVAL, auto_delete: bool = False):
+        super().__init__(name="fsck", daemon=True)
+        self.interval = interval
+        self.auto_delete = auto_delete
+        self.report = None        # 마지막으로 끝난 점검 결과
+        self.cleaned = None       # 마지막 정리 결과 (지운 수, 바이트)
+        self.checking = False
+        self._cleanup = False
+        self._wake = threading.Event()
+
+    def notify(self):
+        """다음 주기를 기다리지 않고 바로 다시 점검."""
+        self._wake.set()
+
+    def request_cleanup(self):
+        """마지막 보고서대로 정리한 뒤 다시 점검."""
+        self._cleanup = True
+        self._wake.set()
+
+    def run(self):
+        self._wake.wait(START_DELAY)
+        self._wake.clear()
+        while True:
+            try:
+                if self._cleanup and self.report is not None:
+                    self._cleanup = False
+                    self.cleaned = apply(self.report)
+                self.checking = True
+                checker = Checker(pause=SLICE_PAUSE)
+                while not checker.done:
+                    checker.run(SLICE_SECONDS)
+                    if not checker.done:
+                        time.sleep(SLICE_REST)
+                self.report = checker.report()
+                if self.auto_delete:
+                    self.cleaned = apply(self.report)
+            except Exception:
+                # DB 잠금/폴더 삭제 경합 등으로 스레드가 죽지 않도록: 다음 주기에 다시
+                incr("fsck.failed")
+            finally:
+                self.checking = False
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+
+# -------------------- CLI --------------------
+def format_report(report: Report) -> str:
+    lines = [f"{kind:<10} {n:6d} files {b / 1024 / 1024:10.2f} MiB"
+             for kind, (n, b) in sorted(report.summary().items())]
+    lines.append(f"reclaimable {report.reclaimable() / 1024 / 1024:.2f} MiB "
+                 f"({report.scanned} files in {report.seconds:.2f}s"
+                 f"{'' if report.complete else ', incomplete: time budget reached'})")
+    return "\n".join(lines)
+
+def main(argv=None) -> int:
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--memorial", nargs="+", help="점검할 추모관 ID (기본: 전체 + 공유 폴더)")
+    p.add_argument("--budget", type=float, help="점검 시간 상한(초)")
+    p.add_argument("--delete", action="store_true", help="점검 후 삭제")
+    p.add_argument("--yes", action="store_true", help="삭제 확인을 묻지 않음")
+    p.add_argument("-v", "--verbose", action="store_true", help="항목별로 출력")
+    args = p.parse_args(argv)
+
+    memorials = [normalize_memorial_id(m) for m in args.memorial] if args.memorial else None
+    report = check(memorials, args.budget)
+    if args.verbose:
+        for f in report.findings:
+            print(f"{f.kind:<10} {f.size:10d}  {f.path}")
+    print(format_report(report))
+    if not args.delete or not any(f.kind in REMOVABLE for f in report.findings):
+        return 0
+    if not args.yes:
+        answer = input("위 항목을 삭제할까요? [y/N] ").strip().lower()
+        if answer not in ("y", "yes"):
+            print("삭제하지 않았습니다.")
+            return 0
+    removed, freed = apply(report)
+    print(f"removed {removed} items, {freed / 1024 / 1024:.2f} MiB freed")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
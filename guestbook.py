@@ -0,0 +1,132 @@
+import os
+import re
+import sqlite3
+from datetime import datetime
+
+from metrics import timed
+from storage import connect_db
+
+# -------------------- 방명록 저장소 (SQLite WAL) --------------------
+GUESTBOOK_DB = "guestbook.db"
+LEGACY_PATH = "guestbook.txt"   # 예전 `time|name|message` 한 줄 형식
+
+_LEGACY_LINE = re.compile(r"^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\|")
+
+def _create_schema(conn):
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS messages (
+            id      INTEGER PRIMARY KEY AUTOINCREMENT,
+            created TEXT NOT NULL,
+            name    TEXT NOT NULL,
+            message TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+        INSERT OR IGNORE INTO meta(key, value) VALUES ('count', 0);
+        -- 글 수는 트리거로 유지하여 COUNT(*) 스캔 없이 조회
+        CREATE TRIGGER IF NOT EXISTS messages_ins AFTER INSERT ON messages
+            BEGIN UPDATE meta SET value = value + 1 WHERE key = 'count'; END;
+        CREATE TRIGGER IF NOT EXISTS messages_del AFTER DELETE ON messages
+            BEGIN UPDATE meta SET value = value - 1 WHERE key = 'count'; END;
+    """)
+
+def _connect(db: str) -> sqlite3.Connection:
+    return connect_db(db, _create_schema)
+
+def _parse_legacy(lines):
+    """메시지 안의 줄바꿈 때문에 쪼개진 줄은 직전 메시지에 이어 붙임."""
+    rows = []
+    for ln in lines:
+        ln = ln.rstrip("\n")
+        if _LEGACY_LINE.match(ln):
+            time_str, user, msg = ln.split("|", 2)
+            rows.append([time_str, user, msg])
+        elif rows and ln.strip():
+            rows[-1][2] += "\n" + ln
+    return rows
+
+@timed("guestbook.migrate")
+def migrate_legacy(db: str = GUESTBOOK_DB, legacy_path: str = LEGACY_PATH) -> int:
+    """guestbook.txt를 한 번만 DB로 옮기고 `.migrated`로 이름 변경. 옮긴 글 수 반환."""
+    if not os.path.exists(legacy_path):
+        return 0
+    rows = []
+    conn = _connect(db)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        done = conn.execute("SELECT value FROM meta WHERE key = 'migrated'").fetchone()
+        if not done and os.path.exists(legacy_path):
+            with open(legacy_path, "r", encoding="utf-8") as f:
+                rows = _parse_legacy(f.readlines())
+            conn.executemany("INSERT INTO messages(created, name, message) VALUES (?, ?, ?)", rows)
+            conn.execute("INSERT INTO meta(key, value) VALUES ('migrated', 1)")
+        conn.execute("COMMIT")
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+    # 커밋 후에 이름 변경: 중간에 죽어도 migrated 표시 덕에 중복 이관 없음
+    try:
+        os.replace(legacy_path, legacy_path + ".migrated")
+    except FileNotFoundError:
+        pass
+    return len(rows)
+
+def add_message(name: str, message: str, db: str = GUESTBOOK_DB) -> int:
+    conn = _connect(db)
+    try:
+        cur = conn.execute("INSERT INTO messages(created, name, message) VALUES (?, ?, ?)",
+                           (datetime.now().strftime('%Y-%m-%d %H:%M:%S'), name, message))
+        return cur.lastrowid
+    finally:
+        conn.close()
+
+def delete_message(msg_id: int, db: str = GUESTBOOK_DB):
+    conn = _connect(db)
+    try:
+        conn.execute("DELETE FROM messages WHERE id = ?", (msg_id,))
+    finally:
+        conn.close()
+
+@timed("guestbook.count")
+def message_count(db: str = GUESTBOOK_DB) -> int:
+    if not os.path.exists(db):   # 아직 글이 없는 추모관은 파일을 만들지 않음
+        return 0
+    conn = _connect(db)
+    try:
+        return conn.execute("SELECT value FROM meta WHERE key = 'count'").fetchone()[0]
+    finally:
+        conn.close()
+
+@timed("guestbook.list")
+def list_messages(limit: int = 20, before_id=None, db: str = GUESTBOOK_DB):
+    """최신순 [(id, created, name, message)]. 다음 페이지는 마지막 id를 before_id로 넘김."""
+    if not os.path.exists(db):
+        return []
+    conn = _connect(db)
+    try:
+        if before_id is None:
+            return conn.execute("SELECT id, created, name, message FROM messages "
+                                "ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+        return conn.execute("SELECT id, created, name, message FROM messages "
+                            "WHERE id < ? ORDER BY id DESC LIMIT ?", (before_id, limit)).fetchall()
+    finally:
+        conn.close()
+
+def iter_messages(batch: int = 500, db: str = GUESTBOOK_DB):
+    """오래된 순으로 (id, created, name, message)를 batch개씩 읽어 하나씩 반환 (내보내기용)."""
+    if not os.path.exists(db):
+        return
+    last_id = 0
+    while True:
+        conn = _connect(db)
+        try:
+            rows = conn.execute("SELECT id, created, name, message FROM messages "
+                                "WHERE id > ? ORDER BY id LIMIT ?", (last_id, batch)).fetchall()
+        finally:
+            conn.close()
+        yield from rows
+        if len(rows) < batch:
+            return
+        last_id = rows[-1][0]
@@ -0,0 +1,77 @@
+import os
+import uuid
+import hashlib
+
+from PIL import Image, ImageOps
+
+# -------------------- 업로드 저장 --------------------
+# 파일을 통째로 메모리에 올리지 않고 청크 단위로 해시 + 임시 파일 기록을 한 번에 처리.
+CHUNK_SIZE = 1 << 20               # 1MB
+MAX_METADATA_BYTES = 64 * 1024     # 이보다 큰 EXIF/XMP 등은 제거
+
+SAVED, DUPLICATE, EMPTY = "saved", "duplicate", "empty"
+
+_ORIENTATION = 0x0112
+# 휴대폰 카메라 JPEG은 Pillow에서 MPO(다중 사진 JPEG)로 열리기도 함 → JPEG으로 다시 저장
+_JPEG_FORMATS = ("JPEG", "MPO")
+
+def safe_filename(name: str) -> str:
+    return "".join(c for c in name if c not in "\\/:*?\"<>|")
+
+def _metadata_size(im) -> int:
+    size = 0
+    for key, value in im.info.items():
+        if key == "icc_profile":
+            continue
+        if isinstance(value, (bytes, str)):
+            size += len(value)
+    return size
+
+def normalize_image(path: str):
+    """EXIF 회전을 픽셀에 반영하고 큰 메타데이터 제거. 필요 없으면 파일을 건드리지 않음."""
+    with Image.open(path) as im:
+        fmt = im.format
+        orientation = im.getexif().get(_ORIENTATION, 1)
+        if orientation in (0, 1) and _metadata_size(im) <= MAX_METADATA_BYTES:
+            return
+        icc = im.info.get("icc_profile")
+        out = ImageOps.exif_transpose(im)
+    params = {"icc_profile": icc} if icc else {}
+    tmp_path = path + ".norm"
+    if fmt in _JPEG_FORMATS:
+        out.convert("RGB").save(tmp_path, "JPEG", quality=95, **params)
+    else:
+        out.save(tmp_path, "PNG", **params)
+    os.replace(tmp_path, path)
+
+def ingest_upload(fileobj, name: str, folder: str, known_digest) -> tuple:
+    """
+    업로드 파일 하나를 folder에 저장. (상태, 저장된 파일명) 반환.
+    known_digest(digest) -> bool 로 중복 여부 확인 (카탈로그 인덱스 + 이번 배치).
+    """
+    fileobj.seek(0)
+    tmp_path = os.path.join(folder, f".ingest-{uuid.uuid4().hex}.tmp")
+    h = hashlib.sha256()
+    size = 0
+    try:
+        with open(tmp_path, "wb") as f:
+            for chunk in iter(lambda: fileobj.read(CHUNK_SIZE), b""):
+                h.update(chunk)
+                f.write(chunk)
+                size += len(chunk)
+        if size == 0:
+            return EMPTY, None
+
+        digest = h.hexdigest()[:16]
+        if known_digest(digest):
+            return DUPLICATE, None
+
+        normalize_image(tmp_path)
+        filename = f"{digest}_{safe_filename(name)}"
+        os.replace(tmp_path, os.path.join(folder, filename))
+        return SAVED, filename
+    finally:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,278 @@
+import os
+import time
+import socket
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from converter import CONVERT_BACKEND, Cooldown, ConversionAborted, convert_image
+from storage import change_feed, connect_db, settle_converted
+from tenancy import memorial_paths
+
+# -------------------- 변환 작업 큐 (SQLite) --------------------
+JOBS_DB = "conversion_jobs.db"
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+POLL_INTERVAL = 2.0          # 초: 대기열이 빌 때 재확인 주기
+RUNNING_TIMEOUT = 15 * 60    # 초: 이보다 오래 running이면 죽은 워커로 보고 재대기
+
+_OWNER = f"{socket.gethostname()}:{os.getpid()}"
+
+_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS jobs (
+        memorial TEXT NOT NULL,
+        digest   TEXT NOT NULL,
+        src      TEXT NOT NULL,
+        out      TEXT NOT NULL,
+        state    TEXT NOT NULL,
+        error    TEXT,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        batch    REAL NOT NULL,
+        owner    TEXT,
+        updated  REAL NOT NULL,
+        PRIMARY KEY (memorial, digest)
+    )""",
+    "CREATE INDEX IF NOT EXISTS jobs_state ON jobs(state, batch)",
+]
+
+def _migrate(conn: sqlite3.Connection):
+    """추모관 구분 이전의 큐: 모두 default 추모관 작업으로 옮김."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        cols = [r[1] for r in conn.execute("PRAGMA table_info(jobs)")]
+        if cols and "memorial" not in cols:
+            conn.execute("ALTER TABLE jobs RENAME TO jobs_old")
+            conn.execute("DROP INDEX IF EXISTS jobs_state")
+            for stmt in _SCHEMA:
+                conn.execute(stmt)
+            conn.execute("""
+                INSERT INTO jobs(memorial, digest, src, out, state, error, attempts, batch, owner, updated)
+                SELECT 'default', digest, src, out, state, error, attempts, batch, owner, updated
+                FROM jobs_old""")
+            conn.execute("DROP TABLE jobs_old")
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+def _create_schema(conn):
+    cols = [r[1] for r in conn.execute("PRAGMA table_info(jobs)")]
+    if cols and "memorial" not in cols:
+        _migrate(conn)
+    for stmt in _SCHEMA:
+        conn.execute(stmt)
+
+def _connect(db: str) -> sqlite3.Connection:
+    return connect_db(db, _create_schema)
+
+def enqueue(jobs, memorial: str, db: str = JOBS_DB) -> int:
+    """jobs: [(digest, src, out), ...]. 이미 대기/진행 중인 digest는 건너뜀. 추가된 수 반환."""
+    now = time.time()
+    added = 0
+    conn = _connect(db)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        for digest, src, out in jobs:
+            cur = conn.execute("""
+                INSERT INTO jobs(memorial, digest, src, out, state, batch, updated) VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(memorial, digest) DO UPDATE SET
+                    src=excluded.src, out=excluded.out, state=excluded.state, error=NULL,
+                    attempts=0, batch=excluded.batch, owner=NULL, updated=excluded.updated
+                WHERE jobs.state NOT IN (?, ?)""",
+                (memorial, digest, src, out, QUEUED, now, now, QUEUED, RUNNING))
+            added += cur.rowcount
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+    return added
+
+def claim(n: int, db: str = JOBS_DB):
+    """대기 중인 작업 n개를 running으로 표시하고 [(memorial, digest, src, out)] 반환."""
+    now = time.time()
+    conn = _connect(db)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        rows = conn.execute("""
+            SELECT memorial, digest, src, out FROM jobs
+            WHERE state = ? OR (state = ? AND updated < ?)
+            ORDER BY batch, rowid LIMIT ?""",
+            (QUEUED, RUNNING, now - RUNNING_TIMEOUT, n)).fetchall()
+        conn.executemany(
+            "UPDATE jobs SET state = ?, owner = ?, attempts = attempts + 1, updated = ? "
+            "WHERE memorial = ? AND digest = ?",
+            [(RUNNING, _OWNER, now, r[0], r[1]) for r in rows])
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+    return rows
+
+def finish(memorial: str, digest: str, error=None, db: str = JOBS_DB) -> bool:
+    """이 프로세스가 맡은 작업만 완료 처리. 그 사이 다른 워커가 가져갔으면(시간 초과) False."""
+    conn = _connect(db)
+    try:
+        cur = conn.execute("UPDATE jobs SET state = ?, error = ?, owner = NULL, updated = ? "
+                           "WHERE memorial = ? AND digest = ? AND owner = ?",
+                           (FAILED if error else DONE, str(error) if error else None, time.time(),
+                            memorial, digest, _OWNER))
+        return cur.rowcount > 0
+    finally:
+        conn.close()
+
+def abort_pending(memorial: str, error: str, db: str = JOBS_DB) -> int:
+    """
+    계정 권한 오류 등으로 추모관의 남은 대기 작업을 실패 처리. 처리한 수 반환.
+    작업 DB는 여러 복제본(다른 API 키일 수 있음)과 다른 추모관이 함께 쓰므로 그 추모관만.
+    """
+    conn = _connect(db)
+    try:
+        cur = conn.execute("UPDATE jobs SET state = ?, error = ?, updated = ? WHERE memorial = ? AND state = ?",
+                           (FAILED, error, time.time(), memorial, QUEUED))
+        return cur.rowcount
+    finally:
+        conn.close()
+
+def forget(memorial: str, digest: str, db: str = JOBS_DB):
+    """원본 삭제 시 해당 작업 기록 제거."""
+    conn = _connect(db)
+    try:
+        conn.execute("DELETE FROM jobs WHERE memorial = ? AND digest = ?", (memorial, digest))
+    finally:
+        conn.close()
+
+def _pid_alive(pid: int) -> bool:
+    if os.name != "posix":
+        return True   # Windows의 os.kill은 프로세스를 종료시킴 → RUNNING_TIMEOUT에 맡김
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True   # 권한 없음 등: 다른 사용자의 살아 있는 프로세스
+    return True
+
+def recover(db: str = JOBS_DB) -> int:
+    """
+    같은 호스트에서 이미 종료된 프로세스가 남긴 running 작업을 다시 대기열로. 되돌린 수 반환.
+    살아 있는 다른 복제본의 작업은 건드리지 않음 (다른 호스트/확인 불가한 것은 RUNNING_TIMEOUT).
+    """
+    host = _OWNER.rsplit(":", 1)[0]
+    conn = _connect(db)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        owners = [r[0] for r in conn.execute(
+            "SELECT DISTINCT owner FROM jobs WHERE state = ? AND owner LIKE ? AND owner != ?",
+            (RUNNING, host + ":%", _OWNER))]
+        dead = [o for o in owners if o.rsplit(":", 1)[1].isdigit() and not _pid_alive(int(o.rsplit(":", 1)[1]))]
+        recovered = 0
+        for owner in dead:
+            recovered += conn.execute("UPDATE jobs SET state = ?, owner = NULL WHERE state = ? AND owner = ?",
+                                      (QUEUED, RUNNING, owner)).rowcount
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+    return recovered
+
+def job_states(memorial: str, db: str = JOBS_DB) -> dict:
+    """digest -> state"""
+    conn = _connect(db)
+    try:
+        return dict(conn.execute("SELECT digest, state FROM jobs WHERE memorial = ?", (memorial,)))
+    finally:
+        conn.close()
+
+def job_counts(memorial: str, db: str = JOBS_DB) -> dict:
+    """state -> 개수"""
+    conn = _connect(db)
+    try:
+        return dict(conn.execute("SELECT state, COUNT(*) FROM jobs WHERE memorial = ? GROUP BY state",
+                                 (memorial,)))
+    finally:
+        conn.close()
+
+def list_jobs(memorial: str, db: str = JOBS_DB):
+    """[(digest, src, out, state)] — 저장 공간 점검(fsck)용 전체 목록."""
+    if not os.path.exists(db):
+        return []
+    conn = _connect(db)
+    try:
+        return conn.execute("SELECT digest, src, out, state FROM jobs WHERE memorial = ?",
+                            (memorial,)).fetchall()
+    finally:
+        conn.close()
+
+def failed_jobs(memorial: str, db: str = JOBS_DB):
+    conn = _connect(db)
+    try:
+        return conn.execute("SELECT digest, src, error FROM jobs WHERE memorial = ? AND state = ? "
+                            "ORDER BY updated DESC", (memorial, FAILED)).fetchall()
+    finally:
+        conn.close()
+
+def progress(memorial: str, db: str = JOBS_DB):
+    """현재 진행 중인 배치 기준 (끝난 수, 전체 수). 대기/진행 작업이 없으면 (0, 0)."""
+    conn = _connect(db)
+    try:
+        row = conn.execute("SELECT MIN(batch) FROM jobs WHERE memorial = ? AND state IN (?, ?)",
+                           (memorial, QUEUED, RUNNING)).fetchone()
+        if row[0] is None:
+            return 0, 0
+        counts = dict(conn.execute("SELECT state, COUNT(*) FROM jobs WHERE memorial = ? AND batch >= ? "
+                                   "GROUP BY state", (memorial, row[0])))
+    finally:
+        conn.close()
+    finished = counts.get(DONE, 0) + counts.get(FAILED, 0)
+    return finished, finished + counts.get(QUEUED, 0) + counts.get(RUNNING, 0)
+
+# -------------------- 백그라운드 워커 --------------------
+class ConversionWorker(threading.Thread):
+    """스크립트 스레드 밖에서 대기열을 소비. 프로세스당 하나(st.cache_resource)로 유지."""
+
+    def __init__(self, client, workers: int = 4, db: str = JOBS_DB, backend: str = CONVERT_BACKEND):
+        super().__init__(name="conversion-worker", daemon=True)
+        self.client = client
+        self.workers = max(1, workers)
+        self.db = db
+        self.backend = backend
+        self._wake = threading.Event()
+
+    def notify(self):
+        """새 작업이 들어왔을 때 대기 중인 워커를 즉시 깨움."""
+        self._wake.set()
+
+    def _settle(self, memorial: str, src: str, out: str):
+        """변환 중에 원본이 지워졌으면 변환본 정리 후, 다른 복제본에 변환본 변경 알림."""
+        try:
+            settle_converted(memorial_paths(memorial), src, out)
+            change_feed().bump(memorial, "converted")
+        except (OSError, sqlite3.Error):
+            pass   # 알림이 빠져도 각 복제본의 폴더 인덱스가 폴더 mtime으로 곧 따라잡음
+
+    def run(self):
+        recover(self.db)
+        cooldown = Cooldown()
+        inflight = {}
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="convert") as pool:
+            while True:
+                try:
+                    free = self.workers - len(inflight)
+                    if free > 0:
+                        for memorial, digest, src, out in claim(free, self.db):
+                            fut = pool.submit(convert_image, self.client, src, out, cooldown, self.backend)
+                            inflight[fut] = (memorial, digest, src, out)
+                    if not inflight:
+                        self._wake.wait(POLL_INTERVAL)
+                        self._wake.clear()
+                        continue
+                    done, _ = wait(inflight, timeout=POLL_INTERVAL, return_when=FIRST_COMPLETED)
+                    for fut in done:
+                        exc = fut.exception()
+                        memorial, digest, src, out = inflight.pop(fut)
+                        self._settle(memorial, src, out)
+                        finish(memorial, digest, exc, db=self.db)
+                        if isinstance(exc, ConversionAborted):
+                            # 같은 계정으로는 모두 실패할 것이므로 파일별로 재시도하지 않음
+                            abort_pending(memorial, str(exc), self.db)
+                except Exception:
+                    # DB 잠금 등 일시 오류로 워커가 죽지 않도록
+                    time.sleep(POLL_INTERVAL)
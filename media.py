@@ -0,0 +1,231 @@
+import os
+import base64
+import hashlib
+import threading
+import mimetypes
+from collections import OrderedDict
+
+from PIL import Image, ImageOps, features
+
+from metrics import incr, timed
+
+# -------------------- 썸네일 설정 --------------------
+THUMB_FOLDER = "thumbnails"
+
+# kind -> (한 변 최대 픽셀, 정사각 크롭 여부)
+THUMB_KINDS = {
+    "thumb": (360, True),      # 미리보기 그리드 (정사각)
+    "display": (960, False),   # 캐러셀 (비율 유지)
+}
+
+_USE_WEBP = features.check("webp")
+THUMB_EXT = ".webp" if _USE_WEBP else ".jpg"
+# AVIF 변형은 백그라운드 최적화 때만 추가로 생성 (지원하는 브라우저에는 미디어 서버가 골라서 전송)
+AVIF_ENABLED = features.check("avif") and os.getenv("AVIF_VARIANTS", "1") != "0"
+AVIF_EXT = ".avif"
+
+
+# -------------------- 키/경로 --------------------
+def digest_key(filename: str) -> str:
+    """`{sha256[:16]}_{name}` 파일명 → 캐시 키. 변환본은 `__converted` 접미를 유지."""
+    base = os.path.splitext(os.path.basename(filename))[0]
+    head, sep, _ = base.partition("_")
+    if not sep or len(head) != 16:
+        # 해시 접두가 없는 예전 파일: 파일명 자체를 키로 사용
+        return base
+    if base.endswith("__converted"):
+        return f"{head}__converted"
+    return head
+
+def thumbnail_key(src_path: str) -> str:
+    """
+    공유 썸네일 폴더의 파일명 키. 원본은 내용 해시라 추모관끼리 공유하지만, 변환본은 같은 원본이라도
+    추모관마다 다르게 변환될 수 있으므로(로컬/API, 캐시 만료) 변환본 폴더 경로의 해시를 붙여 분리.
+    """
+    key = digest_key(src_path)
+    if key.endswith("__converted"):
+        folder = os.path.normpath(os.path.dirname(src_path))
+        key += "-" + hashlib.sha1(folder.encode("utf-8")).hexdigest()[:8]
+    return key
+
+def is_converted_key(key: str) -> bool:
+    """digest_key/thumbnail_key 결과가 변환본의 것인지."""
+    return key.endswith("__converted") or (key[-9:-8] == "-" and key[:-9].endswith("__converted"))
+
+def thumbnail_file(src_path: str, kind: str = "thumb", folder: str = THUMB_FOLDER) -> str:
+    return os.path.join(folder, f"{thumbnail_key(src_path)}.{kind}{THUMB_EXT}")
+
+def avif_file(src_path: str, kind: str, folder: str = THUMB_FOLDER) -> str:
+    return os.path.join(folder, f"{thumbnail_key(src_path)}.{kind}{AVIF_EXT}")
+
+
+# -------------------- 생성 --------------------
+def _resize_for(im, kind: str):
+    """이미 열린(디코드된) 이미지 → kind 크기 이미지. 원본 im은 건드리지 않음."""
+    max_side, square = THUMB_KINDS[kind]
+    im = ImageOps.exif_transpose(im)   # 항상 새 이미지 반환 → 아래 thumbnail()이 원본을 바꾸지 않음
+    if square:
+        im = ImageOps.fit(im, (max_side, max_side), Image.LANCZOS)
+    else:
+        im.thumbnail((max_side, max_side), Image.LANCZOS)
+    has_alpha = im.mode in ("RGBA", "LA") or (im.mode == "P" and "transparency" in im.info)
+    if _USE_WEBP and has_alpha:
+        return im.convert("RGBA")
+    return im.convert("RGB")
+
+def _render(src_path: str, kind: str):
+    max_side, _ = THUMB_KINDS[kind]
+    with Image.open(src_path) as im:
+        # JPEG는 축소 디코딩으로 풀해상도 디코드 비용 절감
+        im.draft("RGB", (max_side * 2, max_side * 2))
+        return _resize_for(im, kind)
+
+def square_canvas(src_path: str, max_side: int = 1024):
+    """원본 비율 유지 + 흰 배경 max_side 정사각 캔버스(RGBA)에 합성. 변환 입력용."""
+    with Image.open(src_path) as im:
+        # JPEG는 필요한 크기 이상으로만 축소 디코딩 (풀해상도 디코드 생략)
+        im.draft("RGB", (max_side, max_side))
+        im = im.convert("RGBA")
+        scale = min(max_side / im.width, max_side / im.height, 1.0)
+        new_w = int(im.width * scale)
+        new_h = int(im.height * scale)
+        im = im.resize((new_w, new_h), Image.LANCZOS)
+
+        canvas = Image.new("RGBA", (max_side, max_side), (255, 255, 255, 255))
+        canvas.paste(im, ((max_side - new_w) // 2, (max_side - new_h) // 2))
+    return canvas
+
+def _save_tmp(im, out_path: str, fmt: str, **params) -> str:
+    """out_path 옆 임시 파일에 저장하고 그 경로 반환 (rename은 호출한 쪽에서)."""
+    tmp_path = f"{out_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    im.save(tmp_path, fmt, **params)
+    return tmp_path
+
+def _save_atomic(im, out_path: str, fmt: str, **params):
+    os.replace(_save_tmp(im, out_path, fmt, **params), out_path)
+
+def _thumbnail_tmp(im, out_path: str) -> str:
+    if _USE_WEBP:
+        return _save_tmp(im, out_path, "WEBP", quality=82, method=4)
+    return _save_tmp(im, out_path, "JPEG", quality=85, optimize=True, progressive=True)
+
+def _save_thumbnail(im, out_path: str):
+    os.replace(_thumbnail_tmp(im, out_path), out_path)
+
+@timed("media.thumbnail")
+def make_thumbnail(src_path: str, kind: str = "thumb", folder: str = THUMB_FOLDER) -> str:
+    """원본에서 썸네일 생성(임시 파일 → rename). 생성된 경로 반환."""
+    os.makedirs(folder, exist_ok=True)
+    out_path = thumbnail_file(src_path, kind, folder)
+    _save_thumbnail(_render(src_path, kind), out_path)
+    return out_path
+
+@timed("media.variants")
+def encode_variants(src_path: str, im, folder: str = THUMB_FOLDER):
+    """
+    이미 디코드된 im 하나로 모든 크기의 썸네일 + AVIF 변형을 임시 파일로 생성 (원본을 다시 열지 않음).
+    [(임시 경로, 최종 경로)] 반환: 호출한 쪽이 (잠금 안에서) rename하거나 지움.
+    """
+    os.makedirs(folder, exist_ok=True)
+    written = []
+    try:
+        for kind in THUMB_KINDS:
+            small = _resize_for(im, kind)
+            out = thumbnail_file(src_path, kind, folder)
+            written.append((_thumbnail_tmp(small, out), out))
+            if AVIF_ENABLED:
+                out = avif_file(src_path, kind, folder)
+                written.append((_save_tmp(small, out, "AVIF", quality=60, speed=6), out))
+    except BaseException:
+        discard(written)
+        raise
+    return written
+
+def discard(written):
+    """encode_variants 등이 남긴 [(임시 경로, 최종 경로)]의 임시 파일 삭제."""
+    for tmp, _ in written:
+        try:
+            os.remove(tmp)
+        except FileNotFoundError:
+            pass
+
+def ensure_thumbnails(src_path: str, folder: str = THUMB_FOLDER):
+    """업로드/변환 직후 1회 호출: 모든 크기의 썸네일을 미리 생성."""
+    for kind in THUMB_KINDS:
+        thumbnail_path(src_path, kind, folder)
+
+def thumbnail_path(src_path: str, kind: str = "thumb", folder: str = THUMB_FOLDER) -> str:
+    """캐시된 썸네일 경로. 없거나 원본보다 오래되었으면 새로 생성."""
+    out_path = thumbnail_file(src_path, kind, folder)
+    try:
+        if os.path.getmtime(out_path) >= os.path.getmtime(src_path):
+            return out_path
+    except OSError:
+        pass
+    return make_thumbnail(src_path, kind, folder)
+
+def remove_thumbnails(src_path: str, folder: str = THUMB_FOLDER):
+    for kind in THUMB_KINDS:
+        for path in (thumbnail_file(src_path, kind, folder), avif_file(src_path, kind, folder)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+# -------------------- 메모리 캐시 --------------------
+class SizedLRU:
+    """값의 len() 합이 max_bytes를 넘지 않게 유지하는 LRU (스레드 안전)."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._items[key] = value
+            self._bytes += len(value)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def pop(self, key):
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            return old
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._items
+
+    def __len__(self):
+        with self._lock:
+            return len(self._items)
+
+
+# -------------------- 인코딩 --------------------
+@timed("media.data_uri")
+def img_file_to_data_uri(path: str) -> str:
+    mime, _ = mimetypes.guess_type(path)
+    if mime is None:
+        mime = "image/png"
+    with open(path, "rb") as f:
+        b64 = base64.b64encode(f.read()).decode("utf-8")
+    incr("media.data_uri_bytes", len(b64))
+    return f"data:{mime};base64,{b64}"
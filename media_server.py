@@ -0,0 +1,252 @@
+import os
+import re
+import threading
+import mimetypes
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, quote, unquote
+
+import metrics
+from assets import ASSET_FOLDER, wait_built
+from export import build_export
+from media import AVIF_EXT, THUMB_FOLDER, is_converted_key, thumbnail_key, thumbnail_path
+from tenancy import normalize_memorial_id, memorial_paths
+
+# -------------------- 미디어 HTTP 서버 --------------------
+# 이미지를 data URI로 HTML에 넣지 않고 URL로 내려서 브라우저/CDN이 캐시하게 함.
+#   /t/<digest>.<kind>.<ext>          썸네일 (원본 해시 기반 → 불변)
+#   /t/<digest>__converted-<폴더 해시>.<kind>.<ext>?v=..  변환본 썸네일 (추모관별, 다시 변환될 수 있으므로 버전 쿼리로 불변화)
+#   /m/<memorial>/o/<filename>        원본 (`{sha256[:16]}_{name}` → 불변)
+#   /m/<memorial>/c/<filename>?v=..   변환본 (다시 변환될 수 있으므로 버전 쿼리로 불변화)
+#   /m/<memorial>/export.zip          추모관 전체 ZIP (스트리밍, 이어받기 가능)
+#   /a/<name>.<hash>.<w>w.<ext>       앱 정적 자산 (히어로 이미지 변형, 원본 해시 기반 → 불변)
+#   /metrics, /metrics.json           프로세스 계측 (Prometheus 텍스트 / JSON)
+MEDIA_PORT = 8502
+CHUNK_SIZE = 64 * 1024
+ASSET_WAIT = 10.0   # 초: 아직 생성 중인 히어로 변형 요청을 기다리는 최대 시간
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "public, max-age=0, must-revalidate"
+
+_NAME_RE = re.compile(r"^[^/\\\x00]+$")
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+_MEDIA_EXTS = (".png", ".jpg", ".jpeg", ".webp", ".avif")
+_EXPORT_RE = re.compile(r"^/m/([^/]+)/export\.zip$")
+
+
+def _etag(st) -> str:
+    return f'"{st.st_size:x}-{st.st_mtime_ns:x}"'
+
+def _version(path: str) -> str:
+    return f"{os.stat(path).st_mtime_ns:x}"
+
+
+# -------------------- URL 생성 --------------------
+def thumbnail_url(base_url: str, src_path: str, kind: str) -> str:
+    """
+    썸네일을 (없거나 원본보다 오래되었으면) 만들고 URL 반환. 변환본은 같은 이름으로 다시 쓰이므로
+    썸네일 파일 버전을 붙임 (썸네일은 변환본이 바뀔 때마다 다시 만들어져 변환본 버전을 따라감).
+    """
+    path = thumbnail_path(src_path, kind)
+    url = f"{base_url}/t/{quote(os.path.basename(path))}"
+    if is_converted_key(thumbnail_key(src_path)):
+        url += f"?v={_version(path)}"
+    return url
+
+def asset_url(base_url: str, name: str) -> str:
+    return f"{base_url}/a/{quote(name)}"
+
+def original_url(base_url: str, memorial_id: str, path: str) -> str:
+    return f"{base_url}/m/{memorial_id}/o/{quote(os.path.basename(path))}"
+
+def converted_url(base_url: str, memorial_id: str, path: str) -> str:
+    return f"{base_url}/m/{memorial_id}/c/{quote(os.path.basename(path))}?v={_version(path)}"
+
+
+# -------------------- 요청 처리 --------------------
+def resolve(url_path: str):
+    """URL 경로 → (파일 경로, 불변 여부). 허용되지 않는 경로는 None."""
+    parts = [unquote(p) for p in url_path.split("/")[1:]]
+    if len(parts) == 2 and parts[0] == "t":
+        # `{키}.{kind}.{ext}`: 변환본 썸네일은 버전 쿼리가 맞을 때만 불변
+        key = os.path.splitext(parts[1])[0].rpartition(".")[0]
+        folder, name, immutable = THUMB_FOLDER, parts[1], not is_converted_key(key)
+    elif len(parts) == 2 and parts[0] == "a":
+        folder, name, immutable = ASSET_FOLDER, parts[1], True
+    elif len(parts) == 4 and parts[0] == "m" and parts[2] in ("o", "c"):
+        try:
+            paths = memorial_paths(normalize_memorial_id(parts[1]))
+        except ValueError:
+            return None
+        if parts[2] == "o":
+            folder, immutable = paths.upload_folder, True
+        else:
+            folder, immutable = paths.converted_folder, False
+        name = parts[3]
+    else:
+        return None
+    if not _NAME_RE.match(name) or name.startswith(".") or not name.lower().endswith(_MEDIA_EXTS):
+        return None
+    return os.path.join(folder, name), immutable
+
+def parse_range(header: str, size: int):
+    """단일 `bytes=` 범위 → (start, end) 포함 구간. 형식 밖이면 None, 충족 불가면 ValueError."""
+    m = _RANGE_RE.match(header.strip())
+    if not m or not (m.group(1) or m.group(2)):
+        return None   # 다중 범위 등은 전체 응답으로 처리
+    first, last = m.group(1), m.group(2)
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    else:
+        start, end = max(size - int(last), 0), size - 1
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
+
+
+class MediaHandler(BaseHTTPRequestHandler):
+    server_version = "MemorialMedia/1.0"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, fmt, *args):
+        pass   # 요청마다 stderr에 찍지 않음
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def do_GET(self):
+        self._serve(send_body=True)
+
+    def send_response(self, code, message=None):
+        metrics.incr(f"media_server.{code}")
+        super().send_response(code, message)
+
+    def _empty(self, code: int, headers=()):
+        self.send_response(code)
+        for k, v in headers:
+            self.send_header(k, v)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def _text(self, body: str, content_type: str, send_body: bool):
+        data = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Cache-Control", "no-store")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(data)
+
+    def _serve(self, send_body: bool):
+        url = urlsplit(self.path)
+        if url.path == "/metrics":
+            return self._text(metrics.to_prometheus(), "text/plain; version=0.0.4", send_body)
+        if url.path == "/metrics.json":
+            return self._text(metrics.to_json(), "application/json", send_body)
+        m = _EXPORT_RE.match(url.path)
+        if m:
+            return self._serve_export(m.group(1), send_body)
+        target = resolve(url.path)
+        if target is None:
+            return self._empty(404)
+        path, immutable = target
+        try:
+            requested = os.stat(path)
+        except (FileNotFoundError, NotADirectoryError):
+            # 히어로 변형은 앱 시작 직후 백그라운드에서 만드는 중일 수 있음
+            if not (path.startswith(ASSET_FOLDER + os.sep) and wait_built(timeout=ASSET_WAIT)):
+                return self._empty(404)
+            try:
+                requested = os.stat(path)
+            except FileNotFoundError:
+                return self._empty(404)
+        # 버전 쿼리가 요청한 파일의 현재 버전과 맞을 때만 변환본(과 그 썸네일)도 불변으로 취급
+        if not immutable and url.query == f"v={requested.st_mtime_ns:x}":
+            immutable = True
+        extra = []
+        if path.startswith(THUMB_FOLDER + os.sep):
+            # 같은 URL로 AVIF 지원 브라우저에는 (있으면) 더 작은 AVIF 변형을 보냄.
+            # 썸네일만 다시 만들어지고 AVIF는 예전 변환본의 것일 수 있으므로 더 새것일 때만
+            extra.append(("Vary", "Accept"))
+            avif = os.path.splitext(path)[0] + AVIF_EXT
+            if "image/avif" in self.headers.get("Accept", ""):
+                try:
+                    if os.stat(avif).st_mtime_ns >= requested.st_mtime_ns:
+                        path = avif
+                except FileNotFoundError:
+                    pass
+        try:
+            f = open(path, "rb")
+        except (FileNotFoundError, IsADirectoryError):
+            return self._empty(404)
+        with f:
+            st = os.fstat(f.fileno())
+            mime, _ = mimetypes.guess_type(path)
+
+            def body(start, end):
+                f.seek(start)
+                remaining = end - start + 1
+                while remaining > 0:
+                    chunk = f.read(min(CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    yield chunk
+                    remaining -= len(chunk)
+
+            self._send_ranged(_etag(st), IMMUTABLE if immutable else REVALIDATE, st.st_size,
+                              mime or "application/octet-stream", body, send_body, extra)
+
+    def _serve_export(self, memorial_id: str, send_body: bool):
+        """추모관 전체 ZIP. 결정적 출력이라 ETag + Range로 끊긴 다운로드를 이어받을 수 있음."""
+        try:
+            export = build_export(memorial_id)
+        except ValueError:
+            return self._empty(404)
+        self._send_ranged(export.etag, "private, no-cache", export.size, "application/zip",
+                          export.iter_bytes, send_body,
+                          [("Content-Disposition", f'attachment; filename="{export.filename}"')])
+
+    def _send_ranged(self, etag: str, cache_control: str, size: int, content_type: str,
+                     body, send_body: bool, extra_headers=()):
+        """ETag/304, 단일 Range(206/416), If-Range 처리 후 body(start, end)의 청크를 전송."""
+        common = [("ETag", etag), ("Cache-Control", cache_control), ("Accept-Ranges", "bytes")]
+
+        inm = self.headers.get("If-None-Match")
+        if inm and (inm.strip() == "*" or etag in [t.strip() for t in inm.split(",")]):
+            return self._empty(304, common)
+
+        start, end, code = 0, size - 1, 200
+        rng = self.headers.get("Range")
+        if_range = self.headers.get("If-Range")
+        if rng and (not if_range or if_range.strip() == etag):
+            try:
+                span = parse_range(rng, size)
+            except ValueError:
+                return self._empty(416, common + [("Content-Range", f"bytes */{size}")])
+            if span:
+                (start, end), code = span, 206
+
+        self.send_response(code)
+        for k, v in common + list(extra_headers):
+            self.send_header(k, v)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(end - start + 1))
+        if code == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.end_headers()
+        if not send_body or size == 0:
+            return
+        try:
+            for chunk in body(start, end):
+                self.wfile.write(chunk)
+        except (BrokenPipeError, ConnectionResetError):
+            pass   # 브라우저가 중간에 끊음 (다음 이미지로 넘어감 등)
+        except RuntimeError:
+            self.close_connection = True   # 내보내는 중 파일 변경: 길이가 어긋나므로 연결을 끊음
+
+def start_media_server(host: str = "0.0.0.0", port: int = MEDIA_PORT) -> ThreadingHTTPServer:
+    """데몬 스레드에서 서버 시작. 앱 프로세스와 같은 작업 폴더 기준으로 파일을 찾음."""
+    server = ThreadingHTTPServer((host, port), MediaHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="media-server", daemon=True).start()
+    return server
@@ -0,0 +1,129 @@
+import os
+import json
+import time
+import threading
+import functools
+from contextlib import contextmanager
+
+# -------------------- 프로세스 내 계측 --------------------
+# 구간(span)별 호출 수/합계/최대 시간과 이벤트 카운터를 프로세스 단위로 집계.
+# METRICS_ENABLED=0 이면 span/timed/incr 모두 플래그 확인 한 번으로 끝남.
+_enabled = os.getenv("METRICS_ENABLED", "1").strip() not in ("0", "false", "off", "")
+_lock = threading.Lock()
+_spans = {}       # name -> [count, total_seconds, max_seconds]
+_counters = {}    # name -> int
+_started = time.time()
+
+PROM_PREFIX = "memorial"
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def observe(name: str, seconds: float):
+    with _lock:
+        s = _spans.get(name)
+        if s is None:
+            _spans[name] = [1, seconds, seconds]
+        else:
+            s[0] += 1
+            s[1] += seconds
+            if seconds > s[2]:
+                s[2] = seconds
+
+def incr(name: str, n: int = 1):
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+@contextmanager
+def _span(name: str):
+    t = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - t)
+
+def span(name: str):
+    """`with span("catalog.rescan"): ...` — 꺼져 있으면 아무것도 하지 않는 공유 객체 반환."""
+    return _span(name) if _enabled else _NULL_SPAN
+
+def timed(name: str):
+    """함수 전체를 span으로 감싸는 데코레이터."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            t = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                observe(name, time.perf_counter() - t)
+        return wrapper
+    return decorator
+
+
+# -------------------- 내보내기 --------------------
+def snapshot() -> dict:
+    with _lock:
+        spans = {k: {"count": c, "total_s": t, "max_s": m} for k, (c, t, m) in _spans.items()}
+        counters = dict(_counters)
+    return {"enabled": _enabled, "pid": os.getpid(), "uptime_s": time.time() - _started,
+            "spans": spans, "counters": counters}
+
+def to_json() -> str:
+    return json.dumps(snapshot(), ensure_ascii=False, sort_keys=True)
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def to_prometheus() -> str:
+    """Prometheus 텍스트 형식 (textfile collector 또는 /metrics 응답용)."""
+    snap = snapshot()
+    p = PROM_PREFIX
+    lines = [f"# HELP {p}_span_seconds Time spent in instrumented code paths.",
+             f"# TYPE {p}_span_seconds summary"]
+    for name, s in sorted(snap["spans"].items()):
+        lines.append(f'{p}_span_seconds_count{{span="{_label(name)}"}} {s["count"]}')
+        lines.append(f'{p}_span_seconds_sum{{span="{_label(name)}"}} {s["total_s"]:.6f}')
+    lines += [f"# HELP {p}_span_seconds_max Slowest single call since process start.",
+              f"# TYPE {p}_span_seconds_max gauge"]
+    for name, s in sorted(snap["spans"].items()):
+        lines.append(f'{p}_span_seconds_max{{span="{_label(name)}"}} {s["max_s"]:.6f}')
+    lines += [f"# HELP {p}_events_total Event counters.",
+              f"# TYPE {p}_events_total counter"]
+    for name, v in sorted(snap["counters"].items()):
+        lines.append(f'{p}_events_total{{event="{_label(name)}"}} {v}')
+    lines += [f"# TYPE {p}_uptime_seconds gauge", f"{p}_uptime_seconds {snap['uptime_s']:.0f}"]
+    return "\n".join(lines) + "\n"
+
+def write_prometheus(path: str):
+    """임시 파일 → rename 으로 기록 (수집기가 반쯤 쓰인 파일을 읽지 않게)."""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(to_prometheus())
+    os.replace(tmp, path)
+
+def start_file_exporter(path: str, interval: float = 15.0) -> threading.Thread:
+    def loop():
+        while True:
+            try:
+                write_prometheus(path)
+            except OSError:
+                pass
+            time.sleep(interval)
+    t = threading.Thread(target=loop, name="metrics-exporter", daemon=True)
+    t.start()
+    return t
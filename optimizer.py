@@ -0,0 +1,92 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, PngImagePlugin
+
+from media import discard, encode_variants
+from metrics import incr, timed
+from storage import memorial_lock
+
+# -------------------- 변환본 백그라운드 최적화 --------------------
+# 변환 직후에는 API 응답을 그대로(무손실 마스터) 저장만 하고, 나머지는 여기서 처리:
+#   1) 마스터 PNG를 무손실로 재압축 (작아질 때만 교체)
+#   2) 같은 디코드 결과로 표시용 썸네일(WebP) + AVIF 변형 생성
+# 한 파일당 디코드는 한 번. 인코딩은 임시 파일에 해 두고, rename만 추모관 잠금 안에서
+# 원본 사진과 변환본이 그대로일 때 함 (그 사이 삭제/재변환됐으면 버림 → 고아/덮어쓰기 없음).
+OPTIMIZE_WORKERS = int(os.getenv("OPTIMIZE_WORKERS", "1"))
+_MARK = "memorial-optimized"   # 재압축을 마친 PNG에 남기는 tEXt 키 (중복 작업 방지)
+
+_executor = ThreadPoolExecutor(max_workers=max(1, OPTIMIZE_WORKERS), thread_name_prefix="optimize")
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+@timed("optimize.png")
+def _recompress_png(path: str, im):
+    """im(= path를 디코드한 것)을 최대 압축으로 임시 파일에 저장. 더 작을 때만 그 경로, 아니면 None."""
+    info = PngImagePlugin.PngInfo()
+    info.add_text(_MARK, "1")
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.opt.tmp"
+    params = {"icc_profile": im.info["icc_profile"]} if im.info.get("icc_profile") else {}
+    im.save(tmp, "PNG", optimize=True, pnginfo=info, **params)
+    if os.path.getsize(tmp) >= os.path.getsize(path):
+        os.remove(tmp)
+        return None
+    return tmp
+
+def _same_file(path: str, st) -> bool:
+    try:
+        now = os.stat(path)
+    except FileNotFoundError:
+        return False
+    return (now.st_ino, now.st_mtime_ns, now.st_size) == (st.st_ino, st.st_mtime_ns, st.st_size)
+
+def optimize_image(path: str, src: str, after=None) -> bool:
+    """
+    path(src 원본의 변환본 PNG) 최적화 + 변형 생성. 교체가 끝나면 after(path) 호출(캐시 갱신 등).
+    그 사이 원본이 지워졌거나 변환본이 바뀌었으면 아무것도 쓰지 않고 False.
+    """
+    st = os.stat(path)
+    with Image.open(path) as im:
+        im.load()
+        already = im.format != "PNG" or im.info.get(_MARK) == "1"
+        master = None if already else _recompress_png(path, im)
+        # 마스터 임시 파일보다 나중에 써야 썸네일이 마스터보다 새것으로 판정됨 (rename은 mtime 유지)
+        written = [(master, path)] if master else []
+        try:
+            written += encode_variants(path, im)
+        except BaseException:
+            discard(written)
+            raise
+    with memorial_lock(os.path.dirname(os.path.dirname(path)) or "."):
+        if not os.path.exists(src) or not _same_file(path, st):
+            discard(written)
+            incr("optimize.skipped")
+            return False
+        saved = st.st_size - os.path.getsize(master) if master else 0
+        for tmp, final in written:
+            os.replace(tmp, final)
+    if saved:
+        incr("optimize.bytes_saved", saved)
+    incr("optimize.done")
+    if master and after is not None:
+        after(path)
+    return True
+
+def _run(path: str, src: str, after):
+    try:
+        optimize_image(path, src, after)
+    except (OSError, ValueError):
+        incr("optimize.failed")   # 그 사이 삭제/손상: 썸네일은 조회 시 다시 생성됨
+    finally:
+        with _pending_lock:
+            _pending.discard(path)
+
+def schedule(path: str, src: str, after=None):
+    """src 원본의 변환본 path를 백그라운드 최적화 예약. 같은 파일이 이미 대기 중이면 무시."""
+    with _pending_lock:
+        if path in _pending:
+            return
+        _pending.add(path)
+    _executor.submit(_run, path, src, after)
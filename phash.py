@@ -0,0 +1,209 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from catalog import folder_index
+from metrics import incr, timed
+
+# -------------------- 유사 사진(지각 해시) 인덱스 --------------------
+# sha256 중복 검사는 바이트가 같은 파일만 잡음. 메신저 재압축/크기 변경/다시 저장한 사진은
+# 64비트 dHash의 해밍 거리로 찾음. 해시는 폴더별로 NumPy 배열에 모아 한 번에 비교.
+HASH_SIZE = 8                                        # 8x8 = 64비트
+MAX_DISTANCE = int(os.getenv("PHASH_DISTANCE", "10"))   # 이 거리 이하면 같은 사진으로 봄
+MAX_INDEXES = 256
+BLOCK = 1024           # 일괄 비교 조각 크기 (BLOCK^2 x 8바이트 = 8MB)
+HASH_WORKERS = 4       # 처음 색인할 때 병렬 디코드 (PIL 디코드는 GIL을 풂)
+
+_BIT_WEIGHTS = (1 << np.arange(HASH_SIZE * HASH_SIZE, dtype=np.uint64)).astype(np.uint64)
+_POPCOUNT8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _popcount(x: np.ndarray) -> np.ndarray:
+    if hasattr(np, "bitwise_count"):   # NumPy 2.0+
+        return np.bitwise_count(x)
+    return _POPCOUNT8[x.view(np.uint8).reshape(-1, 8)].sum(axis=1)
+
+@timed("phash.compute")
+def dhash(path: str) -> int:
+    """가로 방향 밝기 차이로 만든 64비트 dHash."""
+    with Image.open(path) as im:
+        # JPEG는 아주 작게 축소 디코딩 → 대용량 사진도 수 ms
+        im.draft("L", (HASH_SIZE * 8, HASH_SIZE * 8))
+        small = im.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.BOX)
+    px = np.asarray(small, dtype=np.int16)
+    bits = (px[:, 1:] > px[:, :-1]).ravel()
+    return int(_BIT_WEIGHTS[bits].sum(dtype=np.uint64))
+
+def _try_dhash(entry):
+    try:
+        return dhash(entry.path)
+    except OSError:
+        return None   # 읽을 수 없는 파일은 색인하지 않음
+
+def distances(hashes: np.ndarray, h: int) -> np.ndarray:
+    return _popcount(hashes ^ np.uint64(h))
+
+
+class PHashIndex:
+    """폴더 한 곳의 파일명 → dHash. 카탈로그와 동기화하고 npz 파일에 캐시."""
+
+    def __init__(self, folder: str, cache_path: str):
+        self.folder = folder
+        self.cache_path = cache_path
+        self._lock = threading.Lock()
+        self._names = []
+        self._mtimes = np.zeros(0, dtype=np.float64)
+        self._hashes = np.zeros(0, dtype=np.uint64)
+        self._recent = {}   # 파일명 -> (mtime, 해시): check_new로 추가됐고 아직 refresh에 반영 안 된 것
+        self._loaded = False
+
+    # ---- 저장/동기화 ----
+    def _load(self):
+        self._loaded = True
+        try:
+            with np.load(self.cache_path, allow_pickle=False) as z:
+                self._names = [str(n) for n in z["names"]]
+                self._mtimes = z["mtimes"].astype(np.float64)
+                self._hashes = z["hashes"].astype(np.uint64)
+        except (OSError, KeyError, ValueError):
+            pass
+
+    def _save(self):
+        tmp = f"{self.cache_path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, names=np.array(self._names, dtype=str), mtimes=self._mtimes, hashes=self._hashes)
+        os.replace(tmp, self.cache_path)
+
+    def refresh(self):
+        """폴더 내용과 맞춤: 새/바뀐 파일만 해시 계산, 지워진 파일은 제거."""
+        entries = folder_index(self.folder).by_name()
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            known = {n: (m, h) for n, m, h in zip(self._names, self._mtimes, self._hashes)}
+            known.update(self._recent)
+            missing = [e for e in entries
+                       if e.name not in known or known[e.name][0] != e.mtime]
+            if missing:
+                with ThreadPoolExecutor(max_workers=HASH_WORKERS) as pool:
+                    computed = dict(zip((e.name for e in missing), pool.map(_try_dhash, missing)))
+            names, mtimes, hashes = [], [], []
+            for e in entries:
+                if e.name in known and known[e.name][0] == e.mtime:
+                    h = known[e.name][1]
+                else:
+                    h = computed[e.name]
+                    if h is None:
+                        continue
+                names.append(e.name)
+                mtimes.append(e.mtime)
+                hashes.append(h)
+            if missing or names != self._names:
+                self._names = names
+                self._mtimes = np.array(mtimes, dtype=np.float64)
+                self._hashes = np.array(hashes, dtype=np.uint64)
+                try:
+                    self._save()
+                except OSError:
+                    pass
+            # 카탈로그가 아직 못 본(무효화 전) 새 파일은 계속 따로 기억
+            listed = {e.name for e in entries}
+            self._recent = {n: v for n, v in self._recent.items()
+                            if n not in listed and os.path.exists(os.path.join(self.folder, n))}
+
+    # ---- 조회 ----
+    def nearest(self, h: int, exclude: str = None):
+        """(파일명, 거리) — MAX_DISTANCE 이내에서 가장 가까운 것 (check_new로 막 추가된 것 포함). 없으면 None."""
+        with self._lock:
+            best = None
+            if len(self._hashes):
+                d = distances(self._hashes, h)
+                if exclude is not None and exclude in self._names:
+                    d[self._names.index(exclude)] = 255
+                i = int(np.argmin(d))
+                best = (self._names[i], int(d[i]))
+            for name, (_, other) in self._recent.items():
+                dist = bin(int(other) ^ h).count("1")
+                if name != exclude and (best is None or dist < best[1]):
+                    best = (name, dist)
+        return best if best is not None and best[1] <= MAX_DISTANCE else None
+
+    def check_new(self, path: str):
+        """
+        방금 저장한 파일이 기존 사진(같은 배치에서 먼저 추가된 것 포함)과 비슷하면 (비슷한 파일명, 거리).
+        폴더를 다시 스캔하지 않고 이 파일만 해시해 메모리 인덱스와 비교한 뒤 기억해 둠 (다음 refresh에 합쳐짐).
+        배치 전에 refresh()를 한 번 부르면 다른 복제본이 올린 사진도 비교됨.
+        """
+        name = os.path.basename(path)
+        h = dhash(path)
+        match = self.nearest(h, exclude=name)
+        mtime = os.stat(path).st_mtime
+        with self._lock:
+            self._recent[name] = (mtime, h)
+        if match:
+            incr("phash.near_duplicate")
+        return match
+
+    def forget(self, name: str):
+        """check_new 뒤 저장하지 않기로 한(지운) 파일을 비교 대상에서 뺌."""
+        with self._lock:
+            self._recent.pop(name, None)
+
+    def dedupe(self, candidates, keep=()):
+        """
+        candidates 중 keep(이미 변환됐거나 대기 중인 사진) 또는 앞선 후보와 비슷한 것을 제외.
+        (남길 후보 목록, {제외된 파일명: 비슷한 파일명}) 반환. 블록 단위 행렬 비교로 수만 장도 처리.
+        """
+        self.refresh()
+        with self._lock:
+            pos = {n: i for i, n in enumerate(self._names)}
+            cand = [n for n in candidates if n in pos]
+            kept_names = [n for n in keep if n in pos]
+            ch = self._hashes[[pos[n] for n in cand]] if cand else np.zeros(0, np.uint64)
+            kh = self._hashes[[pos[n] for n in kept_names]] if kept_names else np.zeros(0, np.uint64)
+
+        skipped = {}
+        alive = np.ones(len(cand), dtype=bool)
+        # 1) 이미 남겨 둔 사진과 비슷한 후보 (BLOCK x BLOCK 조각씩 비교해 메모리 상한 유지)
+        for c0 in range(0, len(ch), BLOCK):
+            for k0 in range(0, len(kh), BLOCK):
+                d = _popcount(ch[c0:c0 + BLOCK, None] ^ kh[None, k0:k0 + BLOCK])
+                hit = d <= MAX_DISTANCE
+                for i in np.flatnonzero(alive[c0:c0 + BLOCK] & hit.any(axis=1)):
+                    skipped[cand[c0 + i]] = kept_names[k0 + int(np.argmax(hit[i]))]
+                    alive[c0 + i] = False
+        # 2) 후보끼리: 앞선(남긴) 후보와 비슷한 뒤 후보 제외
+        for i in range(len(cand)):
+            if not alive[i]:
+                continue
+            later = np.flatnonzero(alive[i + 1:]) + i + 1
+            if not len(later):
+                break
+            dup = later[distances(ch[later], int(ch[i])) <= MAX_DISTANCE]
+            for j in dup:
+                skipped[cand[j]] = cand[i]
+            alive[dup] = False
+        # 해시를 못 구한(읽기 실패) 후보는 그대로 통과
+        keep_list = [n for n in candidates if n not in skipped]
+        if skipped:
+            incr("phash.skipped_conversions", len(skipped))
+        return keep_list, skipped
+
+
+_INDEXES = OrderedDict()
+_INDEXES_LOCK = threading.Lock()
+
+def phash_index(folder: str, cache_path: str) -> PHashIndex:
+    key = os.path.abspath(folder)
+    with _INDEXES_LOCK:
+        if key in _INDEXES:
+            _INDEXES.move_to_end(key)
+        else:
+            _INDEXES[key] = PHashIndex(folder, cache_path)
+            while len(_INDEXES) > MAX_INDEXES:
+                _INDEXES.popitem(last=False)
+        return _INDEXES[key]
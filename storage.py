@@ -0,0 +1,241 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:   # Windows: 프로세스 안 잠금만 (여러 복제본은 지원하지 않음)
+    fcntl = None
+
+from catalog import IMAGE_EXTS, converted_stem
+from media import is_converted_key, remove_thumbnails, thumbnail_key
+from metrics import incr
+
+# -------------------- 여러 앱 복제본이 공유하는 저장소 --------------------
+# 같은 볼륨을 여러 Streamlit 프로세스(로드 밸런서 뒤 복제본)가 함께 씀.
+# - 파일 쓰기: 임시 파일 → rename (읽는 쪽은 항상 이전 또는 새 내용 전체만 봄)
+# - 추모관 잠금: `<root>/.memorial.lock` 에 POSIX 권고 잠금(lockf) + 프로세스 안 스레드 잠금
+#   사진 삭제와 변환본 배치처럼 여러 파일을 함께 바꾸는 작업만 잡음
+# - 변경 알림: 쓰는 쪽이 changes.db 의 (추모관, 종류) 버전을 올리고, 각 복제본은 재실행 때
+#   버전을 비교해서 자기 메모리 캐시(폴더 인덱스 등)를 무효화
+# 방명록/변환 큐/추모관 목록은 원래 SQLite(WAL) 트랜잭션이라 따로 처리하지 않음.
+# WAL과 lockf는 같은 호스트(또는 POSIX 잠금이 되는 공유 파일시스템)를 전제로 함.
+CHANGES_DB = "changes.db"
+CHANGE_CHECK_INTERVAL = 0.5   # 초: 이 간격 안에서는 다른 복제본의 변경을 다시 확인하지 않음
+MAX_TRACKED = 512             # 마지막으로 본 버전을 기억할 추모관 수
+LOCK_NAME = ".memorial.lock"
+
+
+# -------------------- 원자적 쓰기 --------------------
+def atomic_write(path: str, data: bytes):
+    """같은 폴더의 임시 파일에 쓰고 fsync 후 rename."""
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except FileNotFoundError:
+            pass
+        raise
+
+def write_json(path: str, obj):
+    atomic_write(path, json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8"))
+
+
+# -------------------- SQLite 연결 --------------------
+_ready = set()   # 이 프로세스에서 WAL/스키마 설정을 마친 DB 경로
+
+def connect_db(db: str, setup) -> sqlite3.Connection:
+    """
+    autocommit 연결. 이 프로세스에서 처음 열 때(또는 파일이 지워진 뒤)만 WAL 설정 후
+    setup(conn)으로 스키마 생성/이관 (방명록, 변환 큐, 추모관 목록, 변경 알림이 함께 씀).
+    """
+    key = os.path.abspath(db)
+    fresh = key not in _ready or not os.path.exists(db)   # 파일이 지워졌으면 다시 설정
+    conn = sqlite3.connect(db, timeout=30, isolation_level=None)
+    if not fresh:
+        return conn
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        setup(conn)
+    except BaseException:
+        conn.close()
+        raise
+    _ready.add(key)
+    return conn
+
+
+# -------------------- 추모관 잠금 --------------------
+# lockf 잠금은 프로세스 단위라 같은 프로세스의 스레드끼리는 막지 못함 → 경로별 스레드 잠금을 먼저
+_local_locks = {}
+_local_locks_guard = threading.Lock()
+
+def _local_lock(key: str) -> threading.Lock:
+    with _local_locks_guard:
+        return _local_locks.setdefault(key, threading.Lock())
+
+@contextmanager
+def memorial_lock(root: str):
+    """추모관(root 폴더) 단위 배타 잠금. 다른 프로세스/복제본과 스레드 모두에 대해."""
+    path = os.path.abspath(os.path.join(root, LOCK_NAME))
+    with _local_lock(path):
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(root, exist_ok=True)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            started = time.perf_counter()
+            fcntl.lockf(fd, fcntl.LOCK_EX)
+            waited = time.perf_counter() - started
+            if waited > 0.01:
+                incr("storage.lock_wait_ms", int(waited * 1000))
+            try:
+                yield
+            finally:
+                fcntl.lockf(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+
+# -------------------- 사진 삭제 / 변환본 배치 --------------------
+def _remove(path: str) -> bool:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        return False
+    # 원본 썸네일은 내용 해시 키라 같은 사진을 가진 다른 추모관이 쓰고 있을 수 있음 →
+    # 추모관별 키인 변환본 썸네일만 지우고, 원본 것은 저장 공간 점검(fsck)의 고아 썸네일 정리에 맡김
+    if is_converted_key(thumbnail_key(path)):
+        remove_thumbnails(path)
+    return True
+
+def delete_photo(paths, fname: str) -> bool:
+    """
+    원본과 그 변환본(+썸네일)을 함께 삭제. 원본을 지웠으면 True.
+    settle_converted와 같은 잠금 안에서 하므로 다른 복제본에서 막 끝난 변환본이 남지 않음.
+    """
+    with memorial_lock(paths.root):
+        removed = _remove(os.path.join(paths.upload_folder, fname))
+        stem = converted_stem(fname)
+        for ext in IMAGE_EXTS:   # 변환본은 PNG지만 예전 파일은 확장자가 다를 수 있음
+            _remove(os.path.join(paths.converted_folder, stem + ext))
+    return removed
+
+def settle_converted(paths, src: str, out: str) -> bool:
+    """
+    변환 작업이 끝난 뒤(성공/실패 무관) 호출. 그 사이 원본이 지워졌으면 변환본을 지우고 False.
+    변환본 쓰기가 끝난 뒤에 잠금 안에서 확인하므로 delete_photo와 어떤 순서로 겹쳐도 고아가 없음.
+    """
+    with memorial_lock(paths.root):
+        if os.path.exists(src):
+            return True
+        if _remove(out):
+            incr("storage.orphan_prevented")
+        return False
+
+
+# -------------------- 변경 알림 --------------------
+def _create_schema(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS changes (
+            memorial TEXT NOT NULL,
+            kind     TEXT NOT NULL,
+            version  INTEGER NOT NULL,
+            PRIMARY KEY (memorial, kind)
+        )""")
+
+def _connect(db: str) -> sqlite3.Connection:
+    return connect_db(db, _create_schema)
+
+def versions(memorial: str, db: str = CHANGES_DB) -> dict:
+    """종류 -> 버전. 아직 아무도 쓰지 않았으면 빈 dict."""
+    if not os.path.exists(db):
+        return {}
+    conn = _connect(db)
+    try:
+        return dict(conn.execute("SELECT kind, version FROM changes WHERE memorial = ?", (memorial,)))
+    finally:
+        conn.close()
+
+
+class ChangeFeed:
+    """
+    프로세스 하나가 추모관별로 마지막으로 본 버전을 기억.
+    bump()는 쓰기 직후 버전을 올리고, poll()은 그 뒤 다른 프로세스가 바꾼 종류를 돌려줌.
+    """
+
+    def __init__(self, db: str = CHANGES_DB, interval: float = CHANGE_CHECK_INTERVAL):
+        self.db = db
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._seen = OrderedDict()    # memorial -> {kind: version}
+        self._checked = {}            # memorial -> monotonic 시각
+
+    def _remember(self, memorial: str, seen: dict):
+        self._seen[memorial] = seen
+        self._seen.move_to_end(memorial)
+        while len(self._seen) > MAX_TRACKED:
+            old, _ = self._seen.popitem(last=False)
+            self._checked.pop(old, None)
+
+    def bump(self, memorial: str, *kinds: str) -> dict:
+        """kinds의 버전을 1씩 올리고 새 버전 반환. 다른 프로세스의 변경이 끼지 않았으면 본 것으로 기록."""
+        conn = _connect(self.db)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            before = dict(conn.execute("SELECT kind, version FROM changes WHERE memorial = ?", (memorial,)))
+            conn.executemany("""
+                INSERT INTO changes(memorial, kind, version) VALUES (?, ?, 1)
+                ON CONFLICT(memorial, kind) DO UPDATE SET version = version + 1""",
+                [(memorial, k) for k in kinds])
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        after = {k: before.get(k, 0) + 1 for k in kinds}
+        with self._lock:
+            seen = dict(self._seen.get(memorial, {}))
+            for k in kinds:
+                if seen.get(k, 0) == before.get(k, 0):
+                    seen[k] = after[k]
+            self._remember(memorial, seen)
+        return after
+
+    def poll(self, memorial: str, force: bool = False) -> set:
+        """마지막 확인 뒤 다른 프로세스가 바꾼 종류. 처음 보는 추모관이면 버전이 있는 모든 종류."""
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._checked.get(memorial, -self.interval) < self.interval:
+                return set()
+            self._checked[memorial] = now
+            prev = self._seen.get(memorial)
+        current = versions(memorial, self.db)
+        with self._lock:
+            self._remember(memorial, current)
+        if prev is None:
+            return set(current)
+        changed = {k for k, v in current.items() if prev.get(k, 0) != v}
+        if changed:
+            incr("storage.remote_change")
+        return changed
+
+
+_feed = None
+_feed_lock = threading.Lock()
+
+def change_feed() -> ChangeFeed:
+    """프로세스 전역 ChangeFeed (앱, 변환 워커, fsck가 함께 씀)."""
+    global _feed
+    with _feed_lock:
+        if _feed is None:
+            _feed = ChangeFeed()
+        return _feed
@@ -1,25 +1,63 @@
 import streamlit as st
 import os
+import time
 import hashlib
-import base64
-import mimetypes
+import importlib.util
 from datetime import datetime
 import html
 import json
-import tempfile
 
-from PIL import Image, ImageDraw
+import metrics
+from metrics import timed
+from media import (THUMB_FOLDER, digest_key, img_file_to_data_uri, is_converted_key,
+                   ensure_thumbnails)
+from guestbook import migrate_legacy, add_message, delete_message, message_count, list_messages
+from ingest import ingest_upload, DUPLICATE, EMPTY
+from tenancy import (DEFAULT_MEMORIAL, normalize_memorial_id, memorial_paths, ensure_memorial,
+                     list_memorials)
+from catalog import folder_index, converted_png_name, is_converted
+from phash import phash_index
+from carousel import AUTOPLAY_INTERVAL, frame_uri, prefetch, cached_frames
+from media_server import (MEDIA_PORT as DEFAULT_MEDIA_PORT, start_media_server, thumbnail_url,
+                          original_url, converted_url, asset_url)
+from assets import ASSET_FOLDER, inline_variant, picture_html, plan_variants, start_build, wait_built
+from converter import BACKENDS, LazyOpenAIClient
+from storage import change_feed, delete_photo, write_json
+from fsck import FSCK_INTERVAL, REMOVABLE, Janitor
+from jobs import (POLL_INTERVAL, QUEUED, RUNNING, DONE, ConversionWorker,
+                  enqueue, forget, job_states, job_counts, failed_jobs, progress as job_progress)
 
 # -------------------- 기본 설정 --------------------
 st.set_page_config(page_title="반려동물 추모관", page_icon="🐾", layout="wide")
 
-UPLOAD_FOLDER = "uploaded_images"
-CONVERTED_FOLDER = "converted_images"
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-os.makedirs(CONVERTED_FOLDER, exist_ok=True)
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+_run_started = time.perf_counter()
 
-BASE_IMG_URL = "https://github.com/hyeongyunkim/teamproject/raw/main/petfuneral.png"
-INFO_PATH = "memorial_info.json"
+@st.cache_resource
+def init_storage():
+    """공유 폴더 생성은 프로세스당 한 번만."""
+    os.makedirs(THUMB_FOLDER, exist_ok=True)   # 원본 썸네일은 digest 키라 추모관끼리 공유 (변환본은 추모관별 키)
+
+init_storage()
+
+# -------------------- 추모관 선택 (?m=<id>) --------------------
+try:
+    MEMORIAL_ID = normalize_memorial_id(st.query_params.get("m"))
+except ValueError as e:
+    st.error(f"❌ {e}")
+    st.stop()
+
+paths = memorial_paths(MEMORIAL_ID)
+UPLOAD_FOLDER = paths.upload_folder
+CONVERTED_FOLDER = paths.converted_folder
+INFO_PATH = paths.info_path
+GUESTBOOK_DB = paths.guestbook_db
+
+# 다른 추모관으로 이동하면 화면 위치 관련 상태 초기화
+if st.session_state.get("memorial_id") != MEMORIAL_ID:
+    for k in ("autoplay_last", "guest_cursors", "photo_page", "jobs_done_seen"):
+        st.session_state.pop(k, None)
+    st.session_state.memorial_id = MEMORIAL_ID
 
 # -------------------- OpenAI 설정 --------------------
 def load_api_key() -> str:
@@ -34,221 +72,165 @@ def load_org_id() -> str:
     except Exception:
         return os.getenv("OPENAI_ORG_ID", "").strip()
 
+def load_setting(name: str, default: str = "") -> str:
+    try:
+        return str(st.secrets.get(name) or os.getenv(name, default)).strip()
+    except Exception:
+        return os.getenv(name, default).strip()
+
 OPENAI_API_KEY = load_api_key()
 OPENAI_ORG_ID = load_org_id()
+# 동시에 진행할 변환 요청 수 (레이트 리밋이 빡빡한 계정은 낮게)
+CONVERT_WORKERS = int(load_setting("CONVERT_WORKERS", "4") or 4)
+# 변환 방식: api(이미지 API) / local(로컬 엔진, 키 불필요) / auto(로컬 먼저 → API 결과로 교체)
+CONVERT_BACKEND = load_setting("CONVERT_BACKEND", "api").lower()
+if CONVERT_BACKEND not in BACKENDS:
+    st.warning(f"CONVERT_BACKEND={CONVERT_BACKEND!r} 는 지원하지 않습니다. api로 동작합니다.")
+    CONVERT_BACKEND = "api"
+
+@st.cache_resource
+def get_openai_client(api_key: str, org_id: str) -> LazyOpenAIClient:
+    """세션 간 공유. 실제 openai import/생성은 첫 API 호출 때(워커 스레드에서) 일어남."""
+    return LazyOpenAIClient(api_key, org_id)
+
 client = None
 openai_import_error = None
 if OPENAI_API_KEY:
+    if importlib.util.find_spec("openai") is None:  # pip install openai>=1.0.0
+        openai_import_error = ModuleNotFoundError("openai 패키지가 설치되지 않았습니다.")
+    else:
+        client = get_openai_client(OPENAI_API_KEY, OPENAI_ORG_ID)
+
+@st.cache_resource
+def get_conversion_worker(_client, key_fingerprint: str, workers: int, backend: str) -> ConversionWorker:
+    """프로세스당 하나의 백그라운드 변환 워커. 새로고침/재접속과 무관하게 계속 실행."""
+    worker = ConversionWorker(_client, workers, backend=backend)
+    worker.start()
+    return worker
+
+conversion_worker = None
+if client is not None or CONVERT_BACKEND != "api":
+    conversion_worker = get_conversion_worker(
+        client, hashlib.sha256(OPENAI_API_KEY.encode()).hexdigest()[:16] if OPENAI_API_KEY else "",
+        CONVERT_WORKERS, CONVERT_BACKEND)
+
+# -------------------- 미디어 서버 --------------------
+# MEDIA_BASE_URL: 브라우저가 미디어 서버에 접근하는 주소 (예: http://localhost:8502).
+# 비어 있으면 서버를 띄우지 않고 예전처럼 이미지를 data URI로 HTML에 넣음.
+MEDIA_BASE_URL = load_setting("MEDIA_BASE_URL").rstrip("/")
+MEDIA_PORT = int(load_setting("MEDIA_PORT", str(DEFAULT_MEDIA_PORT)) or DEFAULT_MEDIA_PORT)
+
+@st.cache_resource
+def get_media_server(port: int):
+    """프로세스당 한 번 시작. 포트가 이미 쓰이면(다른 앱 프로세스가 서비스 중) None."""
     try:
-        from openai import OpenAI  # pip install openai>=1.0.0
-        if OPENAI_ORG_ID:
-            client = OpenAI(api_key=OPENAI_API_KEY, organization=OPENAI_ORG_ID)
-        else:
-            client = OpenAI(api_key=OPENAI_API_KEY)
-    except Exception as e:
-        openai_import_error = e
+        return start_media_server(port=port)
+    except OSError:
+        return None
+
+media_server = get_media_server(MEDIA_PORT) if MEDIA_BASE_URL else None
+
+@st.cache_resource
+def start_asset_build():
+    """히어로 이미지 변형을 첫 화면 렌더링과 겹쳐서 백그라운드에서 생성 (assets.py)."""
+    return start_build()
+
+start_asset_build()
+
+# METRICS_FILE: Prometheus textfile collector 등이 읽을 파일 경로 (비어 있으면 내보내지 않음)
+METRICS_FILE = load_setting("METRICS_FILE")
+
+@st.cache_resource
+def get_metrics_exporter(path: str):
+    return metrics.start_file_exporter(path)
+
+if METRICS_FILE and metrics.enabled():
+    get_metrics_exporter(METRICS_FILE)
+
+# -------------------- 저장 공간 점검 --------------------
+# 남은 임시 파일/원본 없는 변환본/쓰지 않는 썸네일을 백그라운드에서 천천히 찾음 (fsck.py).
+# FSCK_AUTO_DELETE=1 이면 찾는 즉시 정리, 아니면 화면의 확인을 받은 뒤 정리.
+FSCK_AUTO_DELETE = load_setting("FSCK_AUTO_DELETE", "0") == "1"
+
+@st.cache_resource
+def get_janitor(auto_delete: bool) -> Janitor:
+    janitor = Janitor(auto_delete=auto_delete)
+    janitor.start()
+    return janitor
+
+janitor = get_janitor(FSCK_AUTO_DELETE) if FSCK_INTERVAL > 0 else None
+
+def image_src(path: str, kind: str) -> str:
+    """<img src>에 넣을 값. kind: thumb/display/full. 미디어 서버가 있으면 캐시 가능한 URL."""
+    is_converted_file = is_converted_key(digest_key(path))
+    if MEDIA_BASE_URL:
+        if kind != "full":
+            return thumbnail_url(MEDIA_BASE_URL, path, kind)
+        if is_converted_file:
+            return converted_url(MEDIA_BASE_URL, MEMORIAL_ID, path)
+        return original_url(MEDIA_BASE_URL, MEMORIAL_ID, path)
+    if kind == "full":
+        return img_file_to_data_uri(path)
+    # 인코딩 결과는 프레임 캐시에 보관 → 다른 조각 때문에 다시 그려도 재인코딩 없음
+    return frame_uri(path, kind)
+
+def friendly_error(msg: str) -> str:
+    if "must be verified" in msg or "403" in msg:
+        return ("이미지 모델 접근 권한(조직 Verify/결제)이 필요합니다. "
+                "https://platform.openai.com/settings/organization/general 에서 인증 후 재시도하세요.")
+    return msg
 
 # -------------------- 파일 유틸 --------------------
+# 폴더 스캔은 catalog 인덱스가 담당 (폴더 mtime이 바뀔 때만 다시 읽음)
+uploads_index = folder_index(UPLOAD_FOLDER)
+converted_index = folder_index(CONVERTED_FOLDER)
+# 유사 사진 처리: flag(저장하고 알림) / skip(저장하지 않음). 변환 전에는 항상 건너뜀.
+NEAR_DUP_UPLOAD = load_setting("NEAR_DUP_UPLOAD", "flag").lower()
+similar_index = phash_index(UPLOAD_FOLDER, paths.phash_index)
+
+@timed("app.list_uploaded")
 def list_uploaded_only():
-    if not os.path.exists(UPLOAD_FOLDER):
-        return []
-    return sorted([f for f in os.listdir(UPLOAD_FOLDER)
-                   if f.lower().endswith((".png", ".jpg", ".jpeg"))])
+    return [e.name for e in uploads_index.by_name()]
 
+@timed("app.list_uploaded")
 def list_uploaded_paths():
-    if not os.path.exists(UPLOAD_FOLDER):
-        return []
-    paths = [os.path.join(UPLOAD_FOLDER, f)
-             for f in os.listdir(UPLOAD_FOLDER)
-             if f.lower().endswith((".png", ".jpg", ".jpeg"))]
-    paths.sort(key=lambda p: os.path.getmtime(p), reverse=True)
-    return paths
+    return [e.path for e in uploads_index.by_mtime()]
 
+@timed("app.list_converted")
 def list_converted_only():
-    if not os.path.exists(CONVERTED_FOLDER):
-        return []
-    files = []
-    for f in os.listdir(CONVERTED_FOLDER):
-        if f.lower().endswith((".png", ".jpg", ".jpeg")):
-            files.append(os.path.join(CONVERTED_FOLDER, f))
-    files.sort(key=lambda p: os.path.getmtime(p), reverse=True)
-    return files
-
-def img_file_to_data_uri(path: str) -> str:
-    mime, _ = mimetypes.guess_type(path)
-    if mime is None:
-        mime = "image/png"
-    with open(path, "rb") as f:
-        b64 = base64.b64encode(f.read()).decode("utf-8")
-    return f"data:{mime};base64,{b64}"
-
-def converted_stem(src_filename: str) -> str:
-    base, _ = os.path.splitext(src_filename)
-    return f"{base}__converted"
-
-def converted_png_name(src_filename: str) -> str:
-    return converted_stem(src_filename) + ".png"
-
-# -------------------- 이미지 변환 --------------------
-# 일본 TV 애니 감성 프롬프트
-_ANIME_PROMPT = (
-    "High-quality Japanese TV anime illustration. Keep the SAME pose and composition as the input photo. "
-    "Clean cel shading with 2–3 tones per color, hard shadows with clear shapes, flat high-saturation palette. "
-    "Bold, clean black lineart with slight variable line weight (0.5–2.5px). "
-    "Cute expressive eyes (species-appropriate), small/simple nose & mouth, subtle fur tufts and inner line details. "
-    "Anime highlights on eyes/fur, crisp edges. "
-    "Simple background without gradients: plain color, halftone dots, or speed lines. "
-    "No photo textures, no blur, no noise, no text, no watermark, not photorealistic."
-)
-
-def _save_temp_square_png(src_path: str, max_side: int = 1024) -> str:
-    """원본 비율 유지 + 흰 배경 정사각 캔버스에 합성하여 임시 PNG 저장."""
-    with Image.open(src_path) as im:
-        im = im.convert("RGBA")
-        scale = min(max_side / im.width, max_side / im.height, 1.0)
-        new_w = int(im.width * scale)
-        new_h = int(im.height * scale)
-        im = im.resize((new_w, new_h), Image.LANCZOS)
-
-        canvas = Image.new("RGBA", (max_side, max_side), (255, 255, 255, 255))
-        x = (max_side - new_w) // 2
-        y = (max_side - new_h) // 2
-        canvas.paste(im, (x, y))
-
-    t = tempfile.NamedTemporaryFile(suffix=".png", delete=False)
-    canvas.save(t.name, "PNG")
-    return t.name
-
-def _make_frame_mask_rgba(size: int = 1024, border: int = 24):
-    """images.edit 폴백용: 가장자리 보존(불투명), 내부 편집(투명)"""
-    m = Image.new("L", (size, size), 0)  # 0=편집
-    d = ImageDraw.Draw(m)
-    d.rectangle([0, 0, size-1, border-1], fill=255)                         # top
-    d.rectangle([0, size-border, size-1, size-1], fill=255)                 # bottom
-    d.rectangle([0, border, border-1, size-border-1], fill=255)             # left
-    d.rectangle([size-border, border, size-1, size-border-1], fill=255)     # right
-    return m.convert("RGBA")
-
-def ai_redraw_comic_style(img_path: str, out_path: str):
-    """
-    variations 우선 → edit 폴백. 결과는 PNG 저장.
-    """
-    if client is None:
-        raise RuntimeError("OpenAI 클라이언트가 준비되지 않았습니다. (OPENAI_API_KEY/조직 인증 확인)")
-
-    if not out_path.lower().endswith(".png"):
-        out_path = os.path.splitext(out_path)[0] + ".png"
-
-    tmp_img = None
-    tmp_mask = None
-    try:
-        tmp_img = _save_temp_square_png(img_path, max_side=1024)
-
-        # 1) variations (일부 환경에선 prompt 인자 미지원 → 예외 시 프롬프트 제거 재시도)
-        try:
-            with open(tmp_img, "rb") as f_img:
-                try:
-                    resp = client.images.variations(
-                        model="gpt-image-1",
-                        image=f_img,
-                        n=1,
-                        size="1024x1024",
-                        prompt=_ANIME_PROMPT,
-                    )
-                except Exception:
-                    f_img.seek(0)
-                    resp = client.images.variations(
-                        model="gpt-image-1",
-                        image=f_img,
-                        n=1,
-                        size="1024x1024",
-                    )
-        except Exception:
-            # 2) 폴백: edit + 프레임 마스크
-            mask = _make_frame_mask_rgba(size=1024, border=24)
-            tmask = tempfile.NamedTemporaryFile(suffix=".png", delete=False)
-            mask.save(tmask.name, "PNG")
-            tmp_mask = tmask.name
-
-            with open(tmp_img, "rb") as f_img, open(tmp_mask, "rb") as f_mask:
-                resp = client.images.edit(
-                    model="gpt-image-1",
-                    image=f_img,
-                    mask=f_mask,
-                    size="1024x1024",
-                    prompt=_ANIME_PROMPT,
-                )
-
-        # 저장
-        b64_img = resp.data[0].b64_json
-        img_bytes = base64.b64decode(b64_img)
-        with open(out_path, "wb") as out:
-            out.write(img_bytes)
-
-    finally:
-        for p in (tmp_img, tmp_mask):
-            try:
-                if p and os.path.exists(p):
-                    os.remove(p)
-            except Exception:
-                pass
+    return [e.path for e in converted_index.by_mtime()]
+
+# -------------------- 조각(fragment) 간 공유 데이터 --------------------
+# 페이지는 히어로/캐러셀/부고/방명록/업로드 그리드 조각으로 나뉘어 각자 다시 실행됨.
+# 조각 안에서만 바뀌는 것(페이지 이동, ◀/▶ 등)은 그 조각만, 여러 조각이 쓰는 데이터가
+# 바뀌면(업로드/변환/삭제/방명록 글) 여기서 명시적으로 무효화하고 페이지 전체를 다시 그림.
+# 같은 저장소를 쓰는 다른 복제본(프로세스)에는 changes.db 버전으로 알리고, 각자 재실행 때 확인.
+changes = change_feed()
+
+def drop_caches(kinds):
+    """이 프로세스의 메모리 캐시만 무효화."""
+    if "photos" in kinds:
+        uploads_index.invalidate()
+    if "converted" in kinds:
+        converted_index.invalidate()
+
+def invalidate(*kinds: str):
+    """kinds: photos / converted / guestbook / info. 이 프로세스 캐시 + 다른 복제본에 알림."""
+    drop_caches(kinds)
+    changes.bump(MEMORIAL_ID, *kinds)
+    for kind in kinds:
+        metrics.incr(f"app.invalidate.{kind}")
+
+drop_caches(changes.poll(MEMORIAL_ID))
 
 # -------------------- 스타일(CSS) --------------------
-st.markdown("""
-<style>
-:root{ --bg:#FDF6EC; --ink:#4B3832; --accent:#CFA18D; --accent-2:#FAE8D9; --line:#EED7CA;
---shadow:0 10px 24px rgba(79,56,50,0.12);}
-body { background-color: var(--bg); color: var(--ink); }
-.page-wrap{ max-width:1180px; margin:0 auto; }
-.topbar-fixed { position:fixed; top:0; left:0; right:0; height:60px;
-  background:#FAE8D9; border-bottom:1px solid var(--line);
-  display:flex; align-items:center; padding:0 24px; z-index:1000; }
-.topbar-fixed .brand { font-size:28px; font-weight:900; color:#4B3832; }
-.main-block { margin-top:74px; }
-.hero{ background:linear-gradient(180deg,#FFF7F2 0%,#FFEFE6 100%);
-  border:1px solid var(--line); border-radius:24px; box-shadow:var(--shadow); padding:17px 32px; }
-.hero-grid{ display:grid; grid-template-columns:1.6fr .9fr; gap:28px; align-items:center; }
-.hero-logo{ font-size:26px; font-weight:900; color:#4B3832; }
-.tagline{ font-size:18px; color:#6C5149; margin-bottom:14px; }
-.badges{ display:flex; gap:10px; flex-wrap:wrap; }
-.badge{ padding:6px 10px; border-radius:999px; font-weight:700; font-size:13px;
-  background:#fff; border:1px solid var(--line); box-shadow:0 2px 8px rgba(79,56,50,.05); color:#5A3E36; }
-.badge .dot{ width:8px; height:8px; border-radius:50%; background: var(--accent); }
-.hero-visual .kv img{ width:50%; display:block; }
-.photo-frame{ background:#fff; border:6px solid #F3E2D8; box-shadow:0 8px 18px rgba(79,56,50,0.12);
-  border-radius:16px; padding:10px; margin-bottom:12px; }
-.photo-frame .thumb{ width:70%; display:block; border-radius:10px; margin:0 auto; }
-.guest-card{ background:linear-gradient(180deg,#FFF8F1 0%,#FFFFFF 100%);
-  border:1px solid var(--line); border-left:6px solid #CFA18D; border-radius:14px;
-  padding:14px 16px; margin:10px 0 16px; box-shadow:0 4px 10px rgba(79,56,50,0.08); }
-.stTabs [role="tablist"]{ justify-content:center !important; gap:12px !important; }
-.frame-card{ background:#fff; border:6px solid #F3E2D8; border-radius:16px;
-  box-shadow:0 8px 18px rgba(79,56,50,0.12); padding:10px; margin-bottom:16px; }
-.frame-edge{ background:#FFFFFF; border:1px solid var(--line); border-radius:12px; padding:8px; }
-.square-thumb{ width:100%; aspect-ratio:1/1; object-fit:cover; display:block; border-radius:10px; }
-.frame-meta{ color:#6C5149; font-size:12px; margin-top:8px; text-align:center; opacity:.9; }
-
-/* 🎨 그림 버튼 (좌) - 파스텔 블루 */
-div[data-testid="stButton"][key="btn_convert"] button {
-    background-color: #d7ecfb; color: #2a4d69; border: 1px solid #bcdff7;
-    border-radius: 8px; padding: 0.45em 1em; min-width: 88px;
-    font-weight: 600; font-size: 15px; white-space: nowrap;
-}
-div[data-testid="stButton"][key="btn_convert"] button:hover {
-    background-color: #c2e0fa; border-color: #a6d1f5;
-}
-
-/* 🖼️ 원본 버튼 (우) - 파스텔 그린 */
-div[data-testid="stButton"][key="btn_original"] button {
-    background-color: #d9f5e3; color: #2e5d4e; border: 1px solid #b8e6cf;
-    border-radius: 8px; padding: 0.45em 1em; min-width: 88px;
-    font-weight: 600; font-size: 15px; white-space: nowrap;
-}
-div[data-testid="stButton"][key="btn_original"] button:hover {
-    background-color: #c5edd7; border-color: #a5dec4;
-}
-</style>
-""", unsafe_allow_html=True)
+@st.cache_resource
+def load_css() -> str:
+    """static/style.css 를 프로세스당 한 번만 읽음."""
+    with open(os.path.join(APP_DIR, "static", "style.css"), "r", encoding="utf-8") as f:
+        return f"<style>\n{f.read()}</style>"
+
+st.markdown(load_css(), unsafe_allow_html=True)
 
 # -------------------- 상단 바 --------------------
 st.markdown("""<div class="topbar-fixed"><div class="brand">🐾 Pet Memorialization 🐾</div></div>""", unsafe_allow_html=True)
@@ -259,13 +241,18 @@ default_name = "초코"
 default_birth = datetime(2015, 3, 15).date()
 default_pass  = datetime(2024, 8, 10).date()
 
+@st.cache_data(max_entries=1024, show_spinner=False)
+def load_memorial_info(path: str, mtime: float) -> dict:
+    """memorial_info.json 파싱 결과를 (경로, mtime) 기준으로 캐시."""
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
 if os.path.exists(INFO_PATH):
     try:
-        with open(INFO_PATH, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            default_name = data.get("name", default_name)
-            if data.get("birth"): default_birth = datetime.strptime(data["birth"], "%Y-%m-%d").date()
-            if data.get("pass"):  default_pass  = datetime.strptime(data["pass"], "%Y-%m-%d").date()
+        data = load_memorial_info(INFO_PATH, os.path.getmtime(INFO_PATH))
+        default_name = data.get("name", default_name)
+        if data.get("birth"): default_birth = datetime.strptime(data["birth"], "%Y-%m-%d").date()
+        if data.get("pass"):  default_pass  = datetime.strptime(data["pass"], "%Y-%m-%d").date()
     except Exception:
         pass
 
@@ -275,127 +262,231 @@ birth_date = st.sidebar.date_input("태어난 날", value=default_birth)
 pass_date = st.sidebar.date_input("무지개다리 건넌 날", value=default_pass)
 
 if st.sidebar.button("저장하기"):
-    with open(INFO_PATH, "w", encoding="utf-8") as f:
-        json.dump({
-            "name": (pet_name or "").strip() or default_name,
-            "birth": birth_date.isoformat(),
-            "pass":  pass_date.isoformat()
-        }, f, ensure_ascii=False, indent=2)
+    ensure_memorial(paths, (pet_name or "").strip())
+    # 다른 복제본이 같은 파일을 읽는 중이어도 반쯤 쓰인 JSON을 보지 않도록 임시 파일 → rename
+    write_json(INFO_PATH, {
+        "name": (pet_name or "").strip() or default_name,
+        "birth": birth_date.isoformat(),
+        "pass":  pass_date.isoformat()
+    })
+    invalidate("info")
     st.sidebar.success("저장 완료!")
     st.rerun()
 
+# 다른 추모관의 ID/이름은 방문자에게 보이지 않음. SHOW_MEMORIAL_LIST=1 이면 (관리용 배포에서만)
+# 최근 갱신된 추모관 목록을 사이드바에 표시
+SHOW_MEMORIAL_LIST = load_setting("SHOW_MEMORIAL_LIST", "0") == "1"
+
+with st.sidebar.expander("🏠 추모관"):
+    st.caption(f"현재 추모관 ID: {MEMORIAL_ID}")
+    goto_id = st.text_input("추모관 ID로 이동", key="goto_memorial")
+    if st.button("이동", key="btn_goto_memorial"):
+        try:
+            target = normalize_memorial_id(goto_id)
+            st.query_params.pop("i", None)   # 캐러셀 위치는 추모관마다 처음부터
+            if target == DEFAULT_MEMORIAL:
+                st.query_params.pop("m", None)
+            else:
+                st.query_params["m"] = target
+            st.rerun()
+        except ValueError as e:
+            st.error(str(e))
+    recent = list_memorials(limit=10) if SHOW_MEMORIAL_LIST else []
+    if recent:
+        st.markdown("\n".join(
+            f"- [{html.escape(name or mid)}](?m={mid})" for mid, name in recent))
+
+with st.sidebar.expander("📦 내보내기"):
+    st.caption("원본·변환본·부고·방명록 전체를 ZIP 하나로 내려받습니다.")
+    if MEDIA_BASE_URL:
+        # 미디어 서버가 파일을 조금씩 읽어 스트리밍 → 용량과 무관하게 메모리 일정, 끊기면 이어받기
+        st.link_button("⬇️ 전체 ZIP 내려받기", f"{MEDIA_BASE_URL}/m/{MEMORIAL_ID}/export.zip",
+                       use_container_width=True)
+    else:
+        st.caption("MEDIA_BASE_URL을 설정하면 여기서 바로 내려받을 수 있습니다. "
+                   f"서버에서는 `python export.py {MEMORIAL_ID} out.zip`")
+
 with st.sidebar.expander("🔎 상태"):
-    st.write("OpenAI 클라이언트:", "OK" if client else ("오류" if openai_import_error else "없음"))
+    if client is not None:
+        st.write("OpenAI 클라이언트:", "OK" if client.ready else "대기 (첫 변환 때 생성)")
+    else:
+        st.write("OpenAI 클라이언트:", "오류" if openai_import_error else "없음")
+    st.caption(f"변환 방식: {CONVERT_BACKEND}")
     if OPENAI_API_KEY:
         masked = OPENAI_API_KEY[:7] + "..." + OPENAI_API_KEY[-4:]
         st.caption(f"키 지문: {masked}")
     st.caption(f"조직 ID: {OPENAI_ORG_ID or '(미지정)'}")
+    st.caption(f"캐러셀 프레임 캐시: {cached_frames()}장")
+    if MEDIA_BASE_URL:
+        st.caption(f"미디어 서버: {MEDIA_BASE_URL} "
+                   + ("(이 프로세스)" if media_server else f"(포트 {MEDIA_PORT} 사용 중 — 외부 서버 사용)"))
+    else:
+        st.caption("미디어 서버: 꺼짐 (data URI 인라인)")
+
+    # 계측: 이 프로세스에서 직전 실행까지 누적된 값
+    snap = metrics.snapshot()
+    if not snap["enabled"]:
+        st.caption("계측: 꺼짐 (METRICS_ENABLED=0)")
+    else:
+        st.caption(f"계측 (프로세스 {snap['pid']}, {snap['uptime_s'] / 60:.0f}분 누적)")
+        span_rows = [{"구간": name, "횟수": v["count"],
+                      "평균 ms": round(v["total_s"] / v["count"] * 1000, 1),
+                      "최대 ms": round(v["max_s"] * 1000, 1), "합계 s": round(v["total_s"], 2)}
+                     for name, v in sorted(snap["spans"].items(), key=lambda kv: -kv[1]["total_s"])]
+        if span_rows:
+            st.dataframe(span_rows, hide_index=True, use_container_width=True)
+        if snap["counters"]:
+            st.dataframe([{"이벤트": k, "값": v} for k, v in sorted(snap["counters"].items())],
+                         hide_index=True, use_container_width=True)
+        c_prom, c_json = st.columns(2)
+        c_prom.download_button("Prometheus", metrics.to_prometheus(), "metrics.prom", "text/plain")
+        c_json.download_button("JSON", metrics.to_json(), "metrics.json", "application/json")
+        if MEDIA_BASE_URL:
+            st.caption(f"수집 주소: {MEDIA_BASE_URL}/metrics · {MEDIA_BASE_URL}/metrics.json")
 
 # -------------------- 히어로 --------------------
-try:
-    with open("guestbook.txt", "r", encoding="utf-8") as f:
-        guest_lines = [ln for ln in f.readlines() if ln.strip()]
-except FileNotFoundError:
-    guest_lines = []
+# 예전 guestbook.txt가 남아 있으면 한 번만 DB로 이관
+migrate_legacy(GUESTBOOK_DB, paths.legacy_guestbook)
+
+@st.cache_resource
+def hero_image_html(base_url: str) -> str:
+    """번들된 petfuneral.png 변형의 <img> 마크업 (프로세스당 한 번).
+    미디어 서버가 있으면 srcset(불변 URL, 생성 전이면 서버가 기다렸다 응답)만 만들고,
+    없으면 백그라운드 생성이 먼저 만드는 작은 WebP 한 장을 기다려 data URI로."""
+    try:
+        variants = plan_variants()
+    except OSError:
+        return ""   # 원본이 없음: 그림 없이 표시
+    if base_url:
+        return picture_html(variants, lambda v: asset_url(base_url, v.name), alt="memorial")
+    v = inline_variant(variants)
+    path = os.path.join(ASSET_FOLDER, v.name)
+    if not os.path.exists(path):
+        wait_built(inline_only=True)
+        if not os.path.exists(path):
+            return ""   # 쓸 수 없는 폴더 등으로 생성 실패
+    src = img_file_to_data_uri(path)
+    return f'<img src="{src}" width="{v.width}" height="{v.height}" alt="memorial">'
 
 def list_for_badge():
-    return len(list_converted_only()), len(guest_lines)
-
-photo_count, message_count = list_for_badge()
-
-st.markdown(f"""
-<div class="hero">
-  <div class="hero-grid">
-    <div>
-      <div class="hero-logo">🐾 Pet Memorialization 🐾</div>
-      <div class="tagline">소중한 반려동물을 추모하는 공간</div>
-      <div class="badges">
-        <span class="badge"><span class="dot"></span> 사진 {photo_count}장</span>
-        <span class="badge"><span class="dot"></span> 방명록 {message_count}개</span>
-      </div>
-    </div>
-    <div class="hero-visual">
-      <div class="kv">
-        <img src="{BASE_IMG_URL}" alt="memorial">
+    return len(list_converted_only()), message_count(GUESTBOOK_DB)
+
+# 위젯이 없어 스스로 다시 실행되지 않음: 전체 재실행(= 사진/방명록 데이터 변경) 때만 다시 그림
+@st.fragment
+@timed("app.fragment.hero")
+def hero():
+    photo_count, guest_count = list_for_badge()
+    st.markdown(f"""
+    <div class="hero">
+      <div class="hero-grid">
+        <div>
+          <div class="hero-logo">🐾 Pet Memorialization 🐾</div>
+          <div class="tagline">소중한 반려동물을 추모하는 공간</div>
+          <div class="badges">
+            <span class="badge"><span class="dot"></span> 사진 {photo_count}장</span>
+            <span class="badge"><span class="dot"></span> 방명록 {guest_count}개</span>
+          </div>
+        </div>
+        <div class="hero-visual">
+          <div class="kv">
+            {hero_image_html(MEDIA_BASE_URL)}
+          </div>
+        </div>
       </div>
     </div>
-  </div>
-</div>
-""", unsafe_allow_html=True)
+    """, unsafe_allow_html=True)
+
+hero()
 
 # -------------------- 탭 --------------------
 tab1, tab2 = st.tabs(["📜 부고장/방명록/추모관", "📺 장례식 스트리밍"])
 
+# -------------------- 페이지 나누기 --------------------
+GUEST_PAGE_SIZE = 20   # 방명록 한 페이지 글 수
+PHOTO_PAGE_SIZE = 12   # 미리보기 한 페이지 사진 수 (3열 × 4줄)
+
+def pager(key: str, page: int, n_pages: int, go):
+    """이전/다음 버튼. 누르면 go(이동할 페이지, 0부터)를 콜백으로 호출 → 조각 재실행 한 번으로 반영."""
+    if n_pages <= 1:
+        return
+    c_prev, c_info, c_next = st.columns([1, 2, 1])
+    with c_prev:
+        st.button("◀ 이전", key=f"{key}_prev", disabled=page <= 0, use_container_width=True,
+                  on_click=go, args=(page - 1,))
+    with c_info:
+        st.markdown(f"<p style='text-align:center;'>{page+1} / {n_pages}</p>", unsafe_allow_html=True)
+    with c_next:
+        st.button("다음 ▶", key=f"{key}_next", disabled=page >= n_pages - 1, use_container_width=True,
+                  on_click=go, args=(page + 1,))
+
+# -------------------- 변환 진행 상황 --------------------
+_, total_jobs = job_progress(MEMORIAL_ID)
+
+@st.fragment(run_every=POLL_INTERVAL if total_jobs else None)
+def conversion_status():
+    """대기열을 주기적으로 확인. 새 변환본이 생기면 전체 페이지를 다시 그림."""
+    drop_caches(changes.poll(MEMORIAL_ID))   # 다른 복제본의 워커가 만든 변환본
+    finished, total = job_progress(MEMORIAL_ID)
+    if total:
+        st.progress(finished / total, text=f"변환 중 {finished}/{total} (동시 {CONVERT_WORKERS}장)")
+
+    # 완료 수 + 변환본 수: auto 방식의 로컬 미리보기는 작업이 끝나기 전에 먼저 생김
+    done = (job_counts(MEMORIAL_ID).get(DONE, 0), len(list_converted_only()))
+    if st.session_state.get("jobs_done_seen") != done:
+        first_check = "jobs_done_seen" not in st.session_state
+        st.session_state.jobs_done_seen = done
+        if not first_check:
+            st.rerun()
+
+    failures = failed_jobs(MEMORIAL_ID)
+    if failures:
+        with st.expander(f"⚠️ 실패 {len(failures)}장 (자세히 보기)", expanded=not total):
+            for _, src, err in failures:
+                st.error(f"{os.path.basename(src)} → {friendly_error(err or '')}")
+            if conversion_worker is not None and st.button("다시 시도", key="retry_failed"):
+                enqueue([(digest, src, os.path.join(CONVERTED_FOLDER, converted_png_name(os.path.basename(src))))
+                         for digest, src, _ in failures], MEMORIAL_ID)
+                conversion_worker.notify()
+                st.rerun()
+
 # ====== 탭1: 추모관/방명록/업로드 ======
 with tab1:
     # 상태 초기화
     if "show_converted" not in st.session_state:
         st.session_state.show_converted = True
-    if "carousel_idx" not in st.session_state:
-        st.session_state.carousel_idx = 0
+    if "show_full" not in st.session_state:
+        st.session_state.show_full = False
 
     # 상단 컨트롤 + 캐러셀
-    col_left, col_mid, col_right = st.columns([1, 10, 1], gap="small")
+    st.markdown("<h2 style='text-align:center;'>In Loving Memory</h2>", unsafe_allow_html=True)
+    conversion_status()
 
-    with col_left:
-        if st.button("🎨 그림", key="btn_convert", use_container_width=True):
-            if client is None:
-                st.error("❌ OpenAI 준비가 안 되었습니다. (OPENAI_API_KEY/조직 인증 확인)")
-            else:
-                originals = list_uploaded_only()
-                if not originals:
-                    st.info("업로드된 원본 사진이 없습니다.")
-                else:
-                    existing_stems = {os.path.splitext(f)[0] for f in os.listdir(CONVERTED_FOLDER)}
-                    to_convert = [fn for fn in originals if converted_stem(fn) not in existing_stems]
+    # 캐러셀 위치는 세션이 아니라 URL(?i=)에: 로드 밸런서가 다른 복제본으로 연결을 옮겨
+    # 새 세션이 되어도 같은 사진에서 이어서 봄
+    def carousel_idx() -> int:
+        try:
+            return max(0, int(st.query_params.get("i", 0)))
+        except ValueError:
+            return 0
 
-                    if not to_convert:
-                        st.info("변환할 원본이 없습니다. (모두 이미 변환됨)")
-                        st.session_state.show_converted = True
-                        st.rerun()
-                    else:
-                        progress = st.progress(0)
-                        status = st.empty()
-                        success = 0
-                        failures = []
-                        total = len(to_convert)
-
-                        for i, fname in enumerate(to_convert, start=1):
-                            in_path = os.path.join(UPLOAD_FOLDER, fname)
-                            out_path = os.path.join(CONVERTED_FOLDER, converted_png_name(fname))
-                            try:
-                                status.write(f"변환 중 {i}/{total} : {html.escape(fname)}")
-                                ai_redraw_comic_style(in_path, out_path)
-                                success += 1
-                            except Exception as e:
-                                msg = str(e)
-                                if "must be verified" in msg or "403" in msg:
-                                    msg = ("이미지 모델 접근 권한(조직 Verify/결제)이 필요합니다. "
-                                           "https://platform.openai.com/settings/organization/general 에서 인증 후 재시도하세요.")
-                                failures.append((fname, msg))
-                            finally:
-                                progress.progress(i / total)
-
-                        if success:
-                            st.success(f"✅ 변환 완료: {success}장")
-                            st.session_state.show_converted = True
-                        if failures:
-                            with st.expander(f"⚠️ 실패 {len(failures)}장 (자세히 보기)", expanded=True):
-                                for fn, msg in failures:
-                                    st.error(f"{fn} → {msg}")
-                        st.rerun()
-
-        st.markdown("<div style='height:8px;'></div>", unsafe_allow_html=True)
-        # 왼쪽 화살표
-        images_for_nav = list_converted_only() if st.session_state.show_converted else list_uploaded_paths()
-        n_for_nav = len(images_for_nav)
-        if n_for_nav > 0 and st.button("◀", key="carousel_prev", use_container_width=True):
-            st.session_state.carousel_idx = (st.session_state.carousel_idx - 1) % n_for_nav
-            st.rerun()
+    def set_carousel_idx(idx: int):
+        if idx:
+            st.query_params["i"] = str(idx)
+        else:
+            st.query_params.pop("i", None)
+
+    def step_carousel(delta: int, n: int):
+        set_carousel_idx((carousel_idx() + delta) % n)
+        st.session_state.autoplay_last = time.monotonic()
+
+    def show_originals():
+        st.session_state.show_converted = False
+        set_carousel_idx(0)
 
-    with col_mid:
-        # 캐러셀 본문
-        st.markdown("<h2 style='text-align:center;'>In Loving Memory</h2>", unsafe_allow_html=True)
+    # ◀/▶·원본 크기·자동 재생은 이 조각만 다시 그림 (페이지 전체 재실행 없음)
+    @st.fragment(run_every=AUTOPLAY_INTERVAL if st.session_state.get("autoplay") else None)
+    @timed("app.fragment.carousel")
+    def carousel():
         converted_list = list_converted_only()
         original_paths = list_uploaded_paths()
         use_converted = st.session_state.show_converted and len(converted_list) > 0
@@ -403,89 +494,177 @@ with tab1:
         n = len(carousel_src)
 
         # 인덱스 보정
-        st.session_state.carousel_idx = max(0, min(st.session_state.carousel_idx, max(n-1, 0)))
-
-        if n == 0:
-            if use_converted:
-                st.info("표시할 변환 이미지가 없습니다. 먼저 사진을 업로드하고 ‘그림’ 변환을 진행해 주세요.")
+        idx = min(carousel_idx(), max(n-1, 0))
+        if idx != carousel_idx():
+            set_carousel_idx(idx)
+
+        # 자동 재생: 주기 재실행 때 간격이 지났으면 다음 장으로
+        if st.session_state.get("autoplay") and n > 1:
+            now = time.monotonic()
+            last = st.session_state.get("autoplay_last")
+            if last is None:
+                st.session_state.autoplay_last = now
+            elif now - last >= AUTOPLAY_INTERVAL * 0.9:
+                step_carousel(1, n)
+
+        col_left, col_mid, col_right = st.columns([1, 10, 1], gap="small")
+
+        with col_left:
+            if st.button("🎨 그림", key="btn_convert", use_container_width=True):
+                if conversion_worker is None:
+                    st.error("❌ OpenAI 준비가 안 되었습니다. (OPENAI_API_KEY/조직 인증 확인, "
+                             "키 없이 쓰려면 CONVERT_BACKEND=local)")
+                else:
+                    originals = list_uploaded_only()
+                    if not originals:
+                        st.info("업로드된 원본 사진이 없습니다.")
+                    else:
+                        states = job_states(MEMORIAL_ID)
+                        busy = lambda fn: (is_converted(fn, converted_index)
+                                           or states.get(digest_key(fn)) in (QUEUED, RUNNING))
+                        to_convert = [fn for fn in originals if not busy(fn)]
+                        # 이미 변환됐거나 대기 중인 사진과 비슷한 사진은 다시 (유료로) 변환하지 않음
+                        to_convert, similar = similar_index.dedupe(
+                            to_convert, keep=[fn for fn in originals if busy(fn)])
+                        if similar:
+                            st.session_state.near_dup_notes = [
+                                f"변환 생략: {fn} ≈ {match}" for fn, match in similar.items()]
+
+                        if not to_convert:
+                            st.info("변환할 원본이 없습니다. (모두 이미 변환됨)")
+                            st.session_state.show_converted = True
+                            st.rerun()
+                        else:
+                            # 백그라운드 워커에 넘기고 즉시 반환 (진행 상황은 캐러셀 위에서 폴링)
+                            ensure_memorial(paths)   # 예전 추모관에는 변환본 폴더가 없을 수 있음
+                            enqueue([(digest_key(fname),
+                                      os.path.join(UPLOAD_FOLDER, fname),
+                                      os.path.join(CONVERTED_FOLDER, converted_png_name(fname)))
+                                     for fname in to_convert], MEMORIAL_ID)
+                            conversion_worker.notify()
+                            st.session_state.show_converted = True
+                            st.rerun()   # 진행 상황 폴링 조각을 켜야 하므로 전체 재실행
+
+            st.markdown("<div style='height:8px;'></div>", unsafe_allow_html=True)
+            # 왼쪽 화살표
+            if n > 0:
+                st.button("◀", key="carousel_prev", use_container_width=True,
+                          on_click=step_carousel, args=(-1, n))
+
+        with col_mid:
+            if n == 0:
+                if st.session_state.show_converted:
+                    st.info("표시할 변환 이미지가 없습니다. 먼저 사진을 업로드하고 ‘그림’ 변환을 진행해 주세요.")
+                else:
+                    st.info("업로드된 원본 사진이 없습니다. 아래에서 파일을 업로드하세요.")
             else:
-                st.info("업로드된 원본 사진이 없습니다. 아래에서 파일을 업로드하세요.")
-        else:
-            current = carousel_src[st.session_state.carousel_idx]
-            data_uri = img_file_to_data_uri(current)
-            badge = "변환본" if use_converted else "원본"
-            st.markdown(
-                f"<div style='text-align:center; color:#9B8F88; font-size:13px;'>({badge})</div>",
-                unsafe_allow_html=True
-            )
-            st.markdown(
-                f"""
-                <div style="display:flex;justify-content:center;">
-                  <div class="photo-frame" style="width:720px;max-width:90vw;">
-                    <img class="thumb" src="{data_uri}" style="width:100%;display:block;border-radius:10px;">
-                  </div>
-                </div>
-                """,
-                unsafe_allow_html=True
-            )
-            st.markdown(
-                f"<p style='text-align:center;'><b>{st.session_state.carousel_idx+1}/{n}</b></p>",
-                unsafe_allow_html=True
-            )
+                idx = carousel_idx()
+                current = carousel_src[idx]
+                # 기본은 캐시된 표시용 축소본, 원본 크기는 요청 시에만 로드
+                img_src = image_src(current, "full" if st.session_state.show_full else "display")
+                prefetch_tag = ""
+                if MEDIA_BASE_URL and n > 1:
+                    # 다음 장은 브라우저가 미리 받아 캐시
+                    next_src = image_src(carousel_src[(idx + 1) % n], "display")
+                    prefetch_tag = f'<link rel="prefetch" href="{html.escape(next_src)}">'
+                elif not st.session_state.show_full:
+                    prefetch(carousel_src, idx, "display")
+                badge = "변환본" if use_converted else "원본"
+                st.markdown(
+                    f"<div style='text-align:center; color:#9B8F88; font-size:13px;'>({badge})</div>",
+                    unsafe_allow_html=True
+                )
+                st.markdown(
+                    f"""
+                    <div style="display:flex;justify-content:center;">
+                      <div class="photo-frame" style="width:720px;max-width:90vw;">
+                        <img class="thumb" src="{html.escape(img_src)}" style="width:100%;display:block;border-radius:10px;">
+                      </div>
+                    </div>{prefetch_tag}
+                    """,
+                    unsafe_allow_html=True
+                )
+                st.markdown(
+                    f"<p style='text-align:center;'><b>{idx+1}/{n}</b></p>",
+                    unsafe_allow_html=True
+                )
+                c_full, c_auto = st.columns(2)
+                with c_full:
+                    st.toggle("🔍 원본 크기로 보기", key="show_full")
+                with c_auto:
+                    autoplay = st.toggle("⏯️ 자동 재생", key="autoplay", disabled=n < 2)
+                # 재생 주기(run_every)는 조각 정의 시점에 정해지므로 켜고 끌 때만 전체 재실행
+                if autoplay != st.session_state.get("autoplay_seen", False):
+                    st.session_state.autoplay_seen = autoplay
+                    st.session_state.autoplay_last = time.monotonic()
+                    st.rerun()
 
-    with col_right:
-        if st.button("🖼️ 원본", key="btn_original", use_container_width=True):
-            if len(list_uploaded_paths()) == 0:
-                st.info("원본 사진이 없습니다. 먼저 업로드해 주세요.")
+        with col_right:
+            if len(original_paths) == 0:
+                if st.button("🖼️ 원본", key="btn_original", use_container_width=True):
+                    st.info("원본 사진이 없습니다. 먼저 업로드해 주세요.")
             else:
-                st.session_state.show_converted = False
-                st.session_state.carousel_idx = 0
-                st.rerun()
+                st.button("🖼️ 원본", key="btn_original", use_container_width=True,
+                          on_click=show_originals)
 
-        st.markdown("<div style='height:8px;'></div>", unsafe_allow_html=True)
-        if n_for_nav > 0 and st.button("▶", key="carousel_next", use_container_width=True):
-            st.session_state.carousel_idx = (st.session_state.carousel_idx + 1) % n_for_nav
-            st.rerun()
-
-    # -------- 부고장 --------
-    st.subheader("📜 부고장")
-    safe_name = html.escape((pet_name or "").strip() or default_name)
-    st.markdown(f"""
-    <div style="text-align:center; background-color:#FAE8D9; padding:15px; border-radius:15px; margin:10px;">
-      사랑하는 <b>{safe_name}</b> 이(가) 무지개다리를 건넜습니다.<br>
-      함께한 시간들을 기억하며 따뜻한 마음으로 추모해주세요.<br><br>
-      🐾 <b>태어난 날:</b> {birth_date.isoformat()} <br>
-      🌈 <b>무지개다리 건넌 날:</b> {pass_date.isoformat()}
-    </div>
-    """, unsafe_allow_html=True)
+            st.markdown("<div style='height:8px;'></div>", unsafe_allow_html=True)
+            if n > 0:
+                st.button("▶", key="carousel_next", use_container_width=True,
+                          on_click=step_carousel, args=(1, n))
 
-    # -------- 방명록 작성 --------
-    st.subheader("✍️ 방명록")
-    name = st.text_input("이름")
-    message = st.text_area("메시지")
-    if st.button("추모 메시지 남기기"):
-        if name and message:
-            with open("guestbook.txt", "a", encoding="utf-8") as f:
-                f.write(f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}|{name}|{message}\n")
-            st.success("메시지가 등록되었습니다.")
-            st.rerun()
-        else:
-            st.warning("이름과 메시지를 입력해주세요.")
+    carousel()
 
-    # -------- 방명록 목록 --------
-    st.subheader("📖 추모 메시지 모음")
-    try:
-        with open("guestbook.txt", "r", encoding="utf-8") as f:
-            guest_lines = [ln for ln in f.readlines() if ln.strip()]
-    except FileNotFoundError:
-        guest_lines = []
-
-    if guest_lines:
-        for idx, line in enumerate(reversed(guest_lines)):
-            try:
-                time_str, user, msg = line.strip().split("|", 2)
-            except Exception:
-                continue
+    # -------- 부고장 --------
+    # 입력은 사이드바 위젯이라 값이 바뀌면 어차피 전체 재실행 → 인자로 받아 그리기만 함
+    @st.fragment
+    @timed("app.fragment.obituary")
+    def obituary(pet_name: str, birth_date, pass_date):
+        st.subheader("📜 부고장")
+        safe_name = html.escape((pet_name or "").strip() or default_name)
+        st.markdown(f"""
+        <div style="text-align:center; background-color:#FAE8D9; padding:15px; border-radius:15px; margin:10px;">
+          사랑하는 <b>{safe_name}</b> 이(가) 무지개다리를 건넜습니다.<br>
+          함께한 시간들을 기억하며 따뜻한 마음으로 추모해주세요.<br><br>
+          🐾 <b>태어난 날:</b> {birth_date.isoformat()} <br>
+          🌈 <b>무지개다리 건넌 날:</b> {pass_date.isoformat()}
+        </div>
+        """, unsafe_allow_html=True)
+
+    obituary(pet_name, birth_date, pass_date)
+
+    # -------- 방명록 (작성 + 목록) --------
+    # 입력/페이지 이동은 이 조각만 다시 실행. 글 작성/삭제는 히어로 배지 개수도 바뀌므로 전체 재실행.
+    @st.fragment
+    @timed("app.fragment.guestbook")
+    def guestbook():
+        st.subheader("✍️ 방명록")
+        name = st.text_input("이름")
+        message = st.text_area("메시지")
+        if st.button("추모 메시지 남기기"):
+            if name and message:
+                ensure_memorial(paths)
+                add_message(name, message, GUESTBOOK_DB)
+                st.success("메시지가 등록되었습니다.")
+                invalidate("guestbook")
+                st.rerun()
+            else:
+                st.warning("이름과 메시지를 입력해주세요.")
+
+        st.subheader("📖 추모 메시지 모음")
+        # 페이지별 시작 커서(직전 페이지 마지막 id) 스택. 현재 페이지 글만 읽어서 그림
+        if "guest_cursors" not in st.session_state:
+            st.session_state.guest_cursors = [None]
+        cursors = st.session_state.guest_cursors
+        guest_rows = list_messages(GUEST_PAGE_SIZE, before_id=cursors[-1], db=GUESTBOOK_DB)  # 최신순
+        if not guest_rows and len(cursors) > 1:
+            # 마지막 페이지 글을 모두 지운 경우 앞 페이지로
+            cursors.pop()
+            guest_rows = list_messages(GUEST_PAGE_SIZE, before_id=cursors[-1], db=GUESTBOOK_DB)
+
+        if not guest_rows:
+            st.info("아직 등록된 메시지가 없습니다.")
+            return
+        for msg_id, time_str, user, msg in guest_rows:
             col_msg, col_btn = st.columns([6, 1])
             with col_msg:
                 safe_user = html.escape(user)
@@ -509,90 +688,172 @@ with tab1:
                 </div>
                 """, unsafe_allow_html=True)
             with col_btn:
-                if st.button("삭제", key=f"del_msg_{idx}"):
-                    real_idx = len(guest_lines) - 1 - idx
-                    del guest_lines[real_idx]
-                    with open("guestbook.txt", "w", encoding="utf-8") as f:
-                        f.writelines(guest_lines)
+                if st.button("삭제", key=f"del_msg_{msg_id}"):
+                    delete_message(msg_id, GUESTBOOK_DB)
+                    invalidate("guestbook")
                     st.rerun()
-    else:
-        st.info("아직 등록된 메시지가 없습니다.")
 
-    # -------- 업로드 전용 + 미리보기 --------
-    st.subheader("🖼️ 온라인 추모관")
+        guest_pages = max(1, -(-message_count(GUESTBOOK_DB) // GUEST_PAGE_SIZE))
+        page = len(cursors) - 1
+        last_id = guest_rows[-1][0] if len(guest_rows) == GUEST_PAGE_SIZE else None
 
-    with st.form("gallery_upload_only", clear_on_submit=True):
-        uploaded_files = st.file_uploader(
-            "사진 업로드 (PNG/JPG)", type=["png", "jpg", "jpeg"], accept_multiple_files=True
-        )
-        submit_upload = st.form_submit_button("업로드")
+        def go_guest_page(new_page: int):
+            if new_page > page and last_id is not None:
+                cursors.append(last_id)
+            elif new_page < page:
+                cursors.pop()
 
-    if submit_upload:
-        if not uploaded_files:
-            st.warning("업로드할 파일을 선택해 주세요.")
-        else:
-            saved, dup, errs = 0, 0, 0
-            existing = set(os.listdir(UPLOAD_FOLDER))
-            for uf in uploaded_files:
-                try:
-                    data = uf.getvalue()
-                    if not data:
+        pager("guest_page", page, guest_pages, go_guest_page)
+
+    guestbook()
+
+    # -------- 업로드 전용 + 미리보기 --------
+    # 미리보기 페이지 이동은 이 조각만. 업로드/삭제는 캐러셀·배지도 바뀌므로 무효화 후 전체 재실행.
+    @st.fragment
+    @timed("app.fragment.gallery")
+    def gallery():
+        st.subheader("🖼️ 온라인 추모관")
+
+        with st.form("gallery_upload_only", clear_on_submit=True):
+            uploaded_files = st.file_uploader(
+                "사진 업로드 (PNG/JPG)", type=["png", "jpg", "jpeg"], accept_multiple_files=True
+            )
+            submit_upload = st.form_submit_button("업로드")
+
+        if submit_upload:
+            if not uploaded_files:
+                st.warning("업로드할 파일을 선택해 주세요.")
+            else:
+                ensure_memorial(paths)
+                saved, dup, similar, errs = 0, 0, 0, 0
+                notes = []
+                seen = set()
+                known = lambda d: d in seen or uploads_index.has_digest(d)
+                similar_index.refresh()   # 배치마다 한 번 (파일마다 폴더를 다시 스캔하지 않음)
+                for uf in uploaded_files:
+                    try:
+                        # 청크 단위 해시+기록 → 중복 확인 → EXIF 정리 → rename
+                        result, filename = ingest_upload(uf, uf.name, UPLOAD_FOLDER, known)
+                        if result == EMPTY:
+                            errs += 1
+                            continue
+                        if result == DUPLICATE:
+                            dup += 1
+                            continue
+                        saved_path = os.path.join(UPLOAD_FOLDER, filename)
+                        # 같은 배치에서 먼저 저장한 사진과도 비교 (인덱스 무효화는 배치 끝에 한 번)
+                        match = similar_index.check_new(saved_path)
+                        if match and NEAR_DUP_UPLOAD == "skip":
+                            similar_index.forget(filename)
+                            os.remove(saved_path)
+                            similar += 1
+                            notes.append(f"업로드 생략: {uf.name} ≈ {match[0]}")
+                            continue
+                        if match:
+                            notes.append(f"비슷한 사진: {uf.name} ≈ {match[0]} (거리 {match[1]})")
+                        ensure_thumbnails(saved_path)
+                        saved += 1
+                        seen.add(digest_key(filename))
+                    except Exception as e:
                         errs += 1
-                        continue
-                    digest = hashlib.sha256(data).hexdigest()[:16]
-                    safe_name = "".join(c for c in uf.name if c not in "\\/:*?\"<>|")
-                    filename = f"{digest}_{safe_name}"
-                    if any(name.startswith(digest + "_") for name in existing):
-                        dup += 1
-                        continue
-                    with open(os.path.join(UPLOAD_FOLDER, filename), "wb") as f:
-                        f.write(data)
-                    saved += 1
-                    existing.add(filename)
-                except Exception as e:
-                    errs += 1
-                    st.error(f"업로드 실패({uf.name}): {e}")
-
-            if saved: st.success(f"✅ {saved}장 업로드 완료!")
-            if dup:   st.info(f"ℹ️ 중복으로 제외된 사진: {dup}장")
-            if errs:  st.warning(f"⚠️ 저장 중 오류: {errs}장")
-            st.rerun()
+                        st.error(f"업로드 실패({uf.name}): {e}")
+
+                invalidate("photos")
+                if saved: st.success(f"✅ {saved}장 업로드 완료!")
+                if dup:   st.info(f"ℹ️ 중복으로 제외된 사진: {dup}장")
+                if similar: st.info(f"ℹ️ 비슷한 사진이라 제외: {similar}장")
+                st.session_state.near_dup_notes = notes
+                if errs:  st.warning(f"⚠️ 저장 중 오류: {errs}장")
+                st.rerun()
 
-    # 업로드된 원본 미리보기 (3열 그리드)
-    originals = list_uploaded_only()
-    if originals:
+        # 유사 사진 알림 (업로드/변환 직후 한 번 표시)
+        near_dup_notes = st.session_state.pop("near_dup_notes", None)
+        if near_dup_notes:
+            with st.expander(f"🔁 비슷한 사진 {len(near_dup_notes)}건", expanded=True):
+                for note in near_dup_notes:
+                    st.caption(note)
+
+        # 업로드된 원본 미리보기 (3열 그리드)
+        originals = list_uploaded_only()
+        if not originals:
+            st.info("아직 업로드된 사진이 없습니다. 위에서 파일을 업로드하세요.")
+            return
         st.caption(f"📂 업로드된 원본: {len(originals)}장")
-        for i in range(0, len(originals), 3):
+        # 현재 페이지 조각만 썸네일 인코딩/렌더링
+        photo_pages = -(-len(originals) // PHOTO_PAGE_SIZE)
+        photo_page = max(0, min(st.session_state.get("photo_page", 0), photo_pages - 1))
+        st.session_state.photo_page = photo_page
+        start = photo_page * PHOTO_PAGE_SIZE
+        visible = originals[start:start + PHOTO_PAGE_SIZE]
+        for i in range(0, len(visible), 3):
             cols = st.columns(3, gap="medium")
-            for j, fname in enumerate(originals[i:i+3]):
+            for j, fname in enumerate(visible[i:i+3]):
                 path = os.path.join(UPLOAD_FOLDER, fname)
                 with cols[j]:
                     try:
-                        data_uri = img_file_to_data_uri(path)
+                        img_src = image_src(path, "thumb")
                         st.markdown(f"""
                         <div class="frame-card">
                           <div class="frame-edge">
-                            <img class="square-thumb" src="{data_uri}" alt="{html.escape(fname)}"/>
+                            <img class="square-thumb" src="{html.escape(img_src)}" loading="lazy" alt="{html.escape(fname)}"/>
                           </div>
                           <div class="frame-meta">{html.escape(fname)}</div>
                         </div>
                         """, unsafe_allow_html=True)
-                        if st.button("삭제", key=f"del_origin_{i+j}"):
+                        if st.button("삭제", key=f"del_origin_{digest_key(fname)}"):
                             try:
-                                os.remove(path)
-                                # 변환본도 스템 기준으로 함께 제거
-                                stem = converted_stem(fname)
-                                for cf in list(os.listdir(CONVERTED_FOLDER)):
-                                    if os.path.splitext(cf)[0] == stem:
-                                        os.remove(os.path.join(CONVERTED_FOLDER, cf))
+                                # 변환본도 함께, 다른 복제본의 변환 워커와 겹치지 않게 추모관 잠금 안에서
+                                delete_photo(paths, fname)
+                                forget(MEMORIAL_ID, digest_key(fname))
+                                invalidate("photos", "converted")
                                 st.success("삭제되었습니다.")
                                 st.rerun()
                             except Exception as e:
                                 st.error(f"삭제 실패: {e}")
                     except Exception as e:
                         st.error(f"미리보기 실패({fname}): {e}")
-    else:
-        st.info("아직 업로드된 사진이 없습니다. 위에서 파일을 업로드하세요.")
+
+        def go_photo_page(new_page: int):
+            st.session_state.photo_page = new_page
+
+        pager("photo_page_nav", photo_page, photo_pages, go_photo_page)
+
+    gallery()
+
+    FSCK_LABELS = {"temp": "남은 임시 파일", "truncated": "끝까지 쓰이지 않은 파일",
+                   "converted": "원본이 없는 변환본", "thumbnail": "쓰지 않는 썸네일",
+                   "asset": "예전 히어로 이미지", "job": "원본이 없는 변환 기록",
+                   "damaged": "손상된 원본 (보고만)"}
+
+    def clean_storage():
+        janitor.request_cleanup()
+        st.session_state.fsck_confirm = False
+
+    # 점검/정리는 janitor 스레드가 하고 여기서는 마지막 결과만 읽음
+    @st.fragment
+    @timed("app.fragment.storage")
+    def storage_check():
+        report = janitor.report
+        with st.expander("🧹 저장 공간 점검"):
+            if report is None:
+                st.caption("점검 중입니다…" if janitor.checking else "아직 점검 전입니다.")
+            else:
+                for kind, (n, size) in report.summary().items():
+                    st.write(f"- {FSCK_LABELS.get(kind, kind)}: {n}개, {size / 1024 / 1024:.1f} MB")
+                st.caption(f"정리 가능 {report.reclaimable() / 1024 / 1024:.1f} MB · "
+                           f"파일 {report.scanned}개를 {report.seconds:.1f}초 동안 점검")
+            if janitor.cleaned:
+                st.caption(f"마지막 정리: {janitor.cleaned[0]}개, {janitor.cleaned[1] / 1024 / 1024:.1f} MB 확보")
+            removable = report is not None and any(f.kind in REMOVABLE for f in report.findings)
+            confirm = st.checkbox("위 항목을 삭제합니다", key="fsck_confirm", disabled=not removable)
+            c1, c2 = st.columns(2)
+            c1.button("다시 점검", key="fsck_check", on_click=janitor.notify,
+                      disabled=janitor.checking, use_container_width=True)
+            c2.button("정리", key="fsck_clean", on_click=clean_storage, disabled=not (removable and confirm),
+                      use_container_width=True)
+
+    if janitor is not None:
+        storage_check()
 
 # ====== 탭2: 스트리밍 ======
 with tab2:
@@ -602,3 +863,6 @@ with tab2:
         f"<div style='text-align:center;'><iframe width='560' height='315' src='{video_url}' frameborder='0' allowfullscreen></iframe></div>",
         unsafe_allow_html=True
     )
+
+if metrics.enabled():
+    metrics.observe("app.run", time.perf_counter() - _run_started)
@@ -0,0 +1,98 @@
+import os
+import re
+import time
+import hashlib
+import sqlite3
+from typing import NamedTuple
+
+from storage import connect_db
+
+# -------------------- 추모관(memorial) 라우팅 --------------------
+# URL `?m=<id>` 로 추모관을 고르고, 추모관마다 폴더를 따로 둠.
+# default 추모관은 예전 단일 추모관 경로를 그대로 사용(기존 데이터 호환).
+MEMORIALS_ROOT = "memorials"
+DEFAULT_MEMORIAL = "default"
+REGISTRY_DB = "memorials.db"   # 모든 추모관이 공유하는 목록
+
+_ID_RE = re.compile(r"^[a-z0-9][a-z0-9_-]{0,63}$")
+
+
+class MemorialPaths(NamedTuple):
+    memorial_id: str
+    root: str
+    upload_folder: str
+    converted_folder: str
+    info_path: str
+    guestbook_db: str
+    legacy_guestbook: str
+    phash_index: str
+
+
+def normalize_memorial_id(raw) -> str:
+    """쿼리 파라미터 값 → 추모관 ID. 허용되지 않는 값이면 ValueError."""
+    mid = (raw or DEFAULT_MEMORIAL).strip().lower()
+    if not _ID_RE.match(mid):
+        raise ValueError(f"잘못된 추모관 ID: {raw!r} (영문 소문자/숫자/-/_ 64자 이내)")
+    return mid
+
+def memorial_paths(memorial_id: str) -> MemorialPaths:
+    if memorial_id == DEFAULT_MEMORIAL:
+        root = "."
+    else:
+        # 한 폴더에 수천 개가 몰리지 않도록 해시 앞 2자리로 샤딩
+        shard = hashlib.sha1(memorial_id.encode("utf-8")).hexdigest()[:2]
+        root = os.path.join(MEMORIALS_ROOT, shard, memorial_id)
+    return MemorialPaths(
+        memorial_id=memorial_id,
+        root=root,
+        upload_folder=os.path.join(root, "uploaded_images"),
+        converted_folder=os.path.join(root, "converted_images"),
+        info_path=os.path.join(root, "memorial_info.json"),
+        guestbook_db=os.path.join(root, "guestbook.db"),
+        legacy_guestbook=os.path.join(root, "guestbook.txt"),
+        phash_index=os.path.join(root, "phash_index.npz"),
+    )
+
+def ensure_memorial(paths: MemorialPaths, name: str = ""):
+    """첫 쓰기 때 폴더 생성 + 공유 목록에 등록. 방문만으로는 아무것도 만들지 않음."""
+    os.makedirs(paths.upload_folder, exist_ok=True)
+    os.makedirs(paths.converted_folder, exist_ok=True)
+    register_memorial(paths.memorial_id, name)
+
+
+# -------------------- 공유 추모관 목록 --------------------
+def _create_schema(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS memorials (
+            id      TEXT PRIMARY KEY,
+            name    TEXT NOT NULL DEFAULT '',
+            created REAL NOT NULL,
+            updated REAL NOT NULL
+        )""")
+
+def _connect(db: str) -> sqlite3.Connection:
+    return connect_db(db, _create_schema)
+
+def register_memorial(memorial_id: str, name: str = "", db: str = REGISTRY_DB):
+    now = time.time()
+    conn = _connect(db)
+    try:
+        conn.execute("""
+            INSERT INTO memorials(id, name, created, updated) VALUES (?, ?, ?, ?)
+            ON CONFLICT(id) DO UPDATE SET
+                name = CASE WHEN excluded.name != '' THEN excluded.name ELSE memorials.name END,
+                updated = excluded.updated""",
+            (memorial_id, name, now, now))
+    finally:
+        conn.close()
+
+def list_memorials(limit: int = 50, offset: int = 0, db: str = REGISTRY_DB):
+    """최근 갱신순 [(id, name)]"""
+    if not os.path.exists(db):
+        return []
+    conn = _connect(db)
+    try:
+        return conn.execute("SELECT id, name FROM memorials ORDER BY updated DESC LIMIT ? OFFSET ?",
+                            (limit, offset)).fetchall()
+    finally:
+        conn.close()
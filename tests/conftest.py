@@ -0,0 +1,14 @@
+import os
+import sys
+
+import pytest
+
+# 앱 모듈은 저장소 루트에 평평하게 있으므로 루트를 import 경로에 추가
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    """기본 경로(guestbook.db, uploaded_images/ 등)가 cwd 기준이므로 테스트마다 빈 임시 폴더에서 실행."""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
@@ -0,0 +1,68 @@
+import io
+import os
+import json
+import zipfile
+
+from PIL import Image
+
+import export
+from export import ZipExport, _data_entry, collect_entries
+from guestbook import add_message
+from tenancy import DEFAULT_MEMORIAL, memorial_paths
+
+
+def _memorial():
+    paths = memorial_paths(DEFAULT_MEMORIAL)
+    os.makedirs(paths.upload_folder)
+    os.makedirs(paths.converted_folder)
+    for i in range(3):
+        Image.new("RGB", (64 + i, 48), (i * 60, 90, 120)).save(
+            os.path.join(paths.upload_folder, f"{i:016x}_사진{i}.jpg"), quality=90)
+    Image.new("RGB", (32, 32), (200, 100, 50)).save(os.path.join(paths.converted_folder, "x.png"))
+    with open(paths.info_path, "w", encoding="utf-8") as f:
+        json.dump({"name": "초코"}, f, ensure_ascii=False)
+    add_message("철수", "안녕", db=paths.guestbook_db)
+    return paths
+
+def _full(zx: ZipExport) -> bytes:
+    buf = io.BytesIO()
+    zx.write_to(buf)
+    return buf.getvalue()
+
+def test_export_is_valid_zip():
+    paths = _memorial()
+    zx = ZipExport(collect_entries(paths))
+    data = _full(zx)
+    assert len(data) == zx.size and not zx.zip64
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        assert zf.testzip() is None
+        names = zf.namelist()
+        assert names[0] == "manifest.json"
+        assert {"obituary.json", "guestbook.txt", "converted/x.png"} <= set(names)
+        assert "originals/0000000000000001_사진1.jpg" in names
+        assert "안녕" in zf.read("guestbook.txt").decode("utf-8")
+        manifest = json.loads(zf.read("manifest.json"))
+        assert len(manifest["files"]) == 4
+
+def test_export_ranges_match_full_output():
+    zx = ZipExport(collect_entries(_memorial()))
+    data = _full(zx)
+    export._crc_cache.clear()   # 건너뛴 항목의 CRC를 파일에서 다시 계산하는 경로
+    zx = ZipExport(collect_entries(memorial_paths(DEFAULT_MEMORIAL)))
+    for start, end in [(0, 0), (10, 500), (len(data) // 2, len(data) - 1),
+                       (len(data) - 30, len(data) + 100)]:
+        assert b"".join(zx.iter_bytes(start, end)) == data[start:end + 1]
+    assert zx.etag == ZipExport(collect_entries(memorial_paths(DEFAULT_MEMORIAL))).etag
+
+def test_export_zip64_when_entry_count_overflows():
+    entries = [_data_entry(f"e/{i}.txt", str(i).encode()) for i in range(0xFFFF)]
+    zx = ZipExport(entries)
+    assert zx.zip64
+    data = _full(zx)
+    assert len(data) == zx.size
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        assert len(zf.infolist()) == 0xFFFF
+        assert zf.read("e/65534.txt") == b"65534"
+        assert zf.testzip() is None
+    tail = len(data) - 200
+    assert b"".join(zx.iter_bytes(tail)) == data[tail:]
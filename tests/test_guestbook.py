@@ -0,0 +1,39 @@
+import os
+import shutil
+
+from guestbook import add_message, iter_messages, message_count, migrate_legacy
+
+LEGACY = ("2024-01-01 10:00:00|철수|안녕\n"
+          "2024-01-02 10:00:00|영희|보고 싶어\n둘째 줄|파이프 포함\n\n"
+          "2024-01-03 10:00:00|민수|잘 가\n")
+
+
+def _write_legacy(path="guestbook.txt"):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(LEGACY)
+
+def test_migrate_legacy_once():
+    _write_legacy()
+    assert migrate_legacy() == 3
+    assert not os.path.exists("guestbook.txt")
+    assert os.path.exists("guestbook.txt.migrated")
+    rows = [r[1:] for r in iter_messages()]
+    assert rows == [("2024-01-01 10:00:00", "철수", "안녕"),
+                    ("2024-01-02 10:00:00", "영희", "보고 싶어\n둘째 줄|파이프 포함"),
+                    ("2024-01-03 10:00:00", "민수", "잘 가")]
+    assert message_count() == 3
+    assert migrate_legacy() == 0
+
+def test_migrate_legacy_after_crash_before_rename():
+    # 커밋 뒤 이름 변경 전에 죽은 경우: 파일은 남아 있지만 migrated 표시가 있어 다시 옮기지 않음
+    _write_legacy()
+    migrate_legacy()
+    shutil.copy("guestbook.txt.migrated", "guestbook.txt")
+    add_message("새 방문자", "안녕하세요")
+    assert migrate_legacy() == 0
+    assert not os.path.exists("guestbook.txt")
+    assert message_count() == 4
+
+def test_migrate_legacy_without_file():
+    assert migrate_legacy() == 0
+    assert not os.path.exists("guestbook.db")
@@ -0,0 +1,52 @@
+import os
+import sys
+import subprocess
+
+import pytest
+
+import jobs
+from jobs import DONE, QUEUED, RUNNING, claim, enqueue, finish, job_states, recover
+
+HOST = jobs._OWNER.rsplit(":", 1)[0]
+
+
+@pytest.fixture
+def db(tmp_path):
+    return str(tmp_path / "jobs.db")
+
+def _enqueue(db, *digests):
+    return enqueue([(d, f"{d}.jpg", f"{d}.png") for d in digests], "default", db=db)
+
+def _dead_pid() -> int:
+    proc = subprocess.Popen([sys.executable, "-c", "pass"])
+    proc.wait()
+    return proc.pid
+
+def test_claim_hands_out_each_job_once(db):
+    assert _enqueue(db, "a", "b", "c") == 3
+    first, second = claim(2, db=db), claim(2, db=db)
+    assert [r[1] for r in first] == ["a", "b"]
+    assert [r[1] for r in second] == ["c"]
+    assert claim(2, db=db) == []
+    # 대기/진행 중인 작업은 다시 넣어도 추가되지 않음
+    assert _enqueue(db, "a", "b", "c") == 0
+
+def test_finish_only_by_owner(db, monkeypatch):
+    _enqueue(db, "a")
+    claim(1, db=db)
+    with monkeypatch.context() as m:
+        m.setattr(jobs, "_OWNER", f"{HOST}:{os.getppid()}")
+        assert not finish("default", "a", db=db)
+    assert finish("default", "a", db=db)
+    assert job_states("default", db=db) == {"a": DONE}
+
+def test_recover_requeues_only_dead_workers(db, monkeypatch):
+    _enqueue(db, "dead", "alive", "remote")
+    for owner in (f"{HOST}:{_dead_pid()}", f"{HOST}:{os.getppid()}", f"other-{HOST}:{_dead_pid()}"):
+        monkeypatch.setattr(jobs, "_OWNER", owner)
+        claim(1, db=db)
+    monkeypatch.undo()
+    assert recover(db=db) == 1
+    assert job_states("default", db=db) == {"dead": QUEUED, "alive": RUNNING, "remote": RUNNING}
+    assert [r[1] for r in claim(3, db=db)] == ["dead"]
+    assert recover(db=db) == 0
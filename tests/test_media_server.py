@@ -0,0 +1,24 @@
+import pytest
+
+from media_server import parse_range
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-99", (0, 99)),
+    ("bytes=500-", (500, 999)),
+    ("bytes=900-5000", (900, 999)),     # 끝이 길이를 넘으면 마지막 바이트까지
+    ("bytes=-100", (900, 999)),         # 뒤에서 100바이트
+    ("bytes=-5000", (0, 999)),
+    (" bytes=0-0 ", (0, 0)),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, 1000) == expected
+
+@pytest.mark.parametrize("header", ["bytes=0-1,5-6", "bytes=-", "items=0-1", "bytes=a-b", ""])
+def test_parse_range_unsupported_is_full_response(header):
+    assert parse_range(header, 1000) is None
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=5-2", "bytes=-0"])
+def test_parse_range_unsatisfiable(header):
+    with pytest.raises(ValueError):
+        parse_range(header, 1000)
@@ -0,0 +1,8 @@
+import bench
+
+
+def test_startup_within_target():
+    # 새 프로세스 3개 x 웜 재실행 10회 (첫 재실행 제외) 중앙값. 앱이 예외를 내면 여기서 실패
+    cold, warm, colds, warms = bench.measure_startup(repeat=3, reruns=10)
+    assert cold <= bench.STARTUP_TARGET_MS, f"cold start {cold:.0f} ms: {[round(x) for x in colds]}"
+    assert warm <= bench.RERUN_TARGET_MS, f"warm rerun {warm:.0f} ms: {[round(x) for x in warms]}"